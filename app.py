@@ -1,30 +1,74 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response, g, has_request_context, send_file, Response, stream_with_context, abort
+from flask import before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from markupsafe import Markup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import string
-import random
+import secrets
 import os
 from functools import wraps
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+import click
+from sqlalchemy import and_, column, event, func, or_, insert, inspect, literal, select, table, text, tuple_, union_all, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import backref, selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import io
+import base64
+import binascii
+import hashlib
+import importlib
+import math
+import csv
+import json
+import re
+import unicodedata
+from urllib.parse import quote
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from migrations import MIGRATIONS, create_expense_search
+from engine import SOLVERS, calculate_settlements, net_balances, split_evenly
+from config import Config
+from cache import DiskFragmentStore, FragmentCache, RedisFragmentStore, TTLCache, TokenBucketLimiter
+from passwords import HashingBusy, PasswordHasher
+from events import RESYNC, LocalBroker, RedisBroker, TooManySubscribers, format_sse
+from metrics import COUNT_BUCKETS, Registry, SamplingProfiler
+import sqlite3
+from collections import namedtuple
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'anil123'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///splitly.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config.from_object(Config)
+app.config.setdefault('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'reports'))
+app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside a writer; busy_timeout makes writers wait instead of failing"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for name, value in app.config['SQLITE_PRAGMAS'].items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
 
 db = SQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# PDF reports are built off the request thread and cached per group version
+report_executor = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'])
+if app.config['PDF_PRELOAD']:
+    # Load ReportLab on a report worker now instead of when the first report is built
+    report_executor.submit(importlib.import_module, 'reports')
+report_jobs = {}
+report_jobs_lock = threading.Lock()
+
 from flask_login import UserMixin
 from datetime import datetime
 
@@ -45,6 +89,9 @@ class Group(db.Model):
     code = db.Column(db.String(6), unique=True, nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every data change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Set with every version bump
+    expense_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Kept with the version
     
     creator = db.relationship('User', backref='created_groups')
     
@@ -52,51 +99,323 @@ class Group(db.Model):
         return f'<Group {self.name}>'
 
 class GroupMember(db.Model):
+    __table_args__ = (
+        db.Index('uq_group_member_group_user', 'group_id', 'user_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     group = db.relationship('Group', backref='members')
     user = db.relationship('User', backref='group_memberships')
 
 class Expense(db.Model):
+    __table_args__ = (
+        db.Index('ix_expense_group_date_id', 'group_id', 'date', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     description = db.Column(db.String(200), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)  # Minor units
     paid_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    split_members = db.Column(db.Text, nullable=False)  # Comma-separated user IDs
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
     group = db.relationship('Group', backref='expenses')
     payer = db.relationship('User', backref='paid_expenses')
     
+    @property
+    def is_equal_split(self):
+        shares = [split.share_cents for split in self.splits]
+        return max(shares) - min(shares) <= 1 if shares else True
+    
     def __repr__(self):
-        return f'<Expense {self.description}:  {self.amount}>'
+        return f'<Expense {self.description}:  {format_money(self.amount_cents)}>'
+
+@event.listens_for(Expense.__table__, 'after_create')
+def create_expense_search_index(target, connection, **kw):
+    """Fresh databases get the full-text index along with the expense table"""
+    create_expense_search(connection)
+
+class ExpenseSplit(db.Model):
+    """The share of one expense owed by one member"""
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, index=True)
+    share_cents = db.Column(db.Integer, nullable=False)
+    
+    expense = db.relationship('Expense', backref=backref('splits', cascade='all, delete-orphan'))
+    user = db.relationship('User', backref='expense_splits')
 
 class Settlement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False, index=True)
     from_user = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     to_user = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
     group = db.relationship('Group', backref='settlements')
     from_user_obj = db.relationship('User', foreign_keys=[from_user], backref='settlements_made')
     to_user_obj = db.relationship('User', foreign_keys=[to_user], backref='settlements_received')
 
+class GroupBalance(db.Model):
+    """Net balance of one member in one group, kept in step with every ledger write"""
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    balance_cents = db.Column(db.Integer, nullable=False, default=0)
+
+class SpendingRollup(db.Model):
+    """One member's spending in one group over a day or a month, kept in step with every expense write"""
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)  # 'day' or 'month'
+    bucket = db.Column(db.Date, primary_key=True)  # The day, or the first day of the month
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    paid_cents = db.Column(db.Integer, nullable=False, default=0)
+    owed_cents = db.Column(db.Integer, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)  # Expenses the member paid or shared
+
+class LedgerEvent(db.Model):
+    """One balance-changing write, appended and never updated; ``seq`` counts up from 1 per group"""
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'expense_added', 'expense_deleted' or 'settlement_added'
+    ref_id = db.Column(db.Integer, nullable=False)  # Expense or settlement id; the row itself may be gone
+    deltas = db.Column(db.Text, nullable=False)  # JSON {user_id: cents}
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class BalanceSnapshot(db.Model):
+    """Every member's balance in a group after ledger event ``seq``"""
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    balances = db.Column(db.Text, nullable=False)  # JSON {user_id: cents}
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in testing when a route issues more SQL queries than it declared"""
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        conn.info['query_start'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('query_start', None)
+    if start is not None and has_request_context():
+        g.query_time = g.get('query_time', 0) + time.perf_counter() - start
+
+def query_budget(limit):
+    """Declare the maximum number of SQL queries a route may issue per request"""
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+@app.after_request
+def check_query_budget(response):
+    view = app.view_functions.get(request.endpoint)
+    limit = getattr(view, 'query_budget', None)
+    used = g.get('query_count', 0)
+    if limit is not None and used > limit:
+        message = f'{request.endpoint} issued {used} queries, budget is {limit}'
+        if app.config.get('QUERY_BUDGET_ENFORCE', app.testing):
+            raise QueryBudgetExceeded(message)
+        app.logger.warning(message)
+    return response
+
+# Per-process metrics, scraped from /metrics
+metrics_registry = Registry()
+request_duration = metrics_registry.histogram(
+    'splitly_request_duration_seconds', 'Time to handle a request', ['endpoint', 'method', 'status'])
+request_queries = metrics_registry.histogram(
+    'splitly_request_sql_queries', 'SQL queries issued per request', ['endpoint'], buckets=COUNT_BUCKETS)
+request_sql_duration = metrics_registry.histogram(
+    'splitly_request_sql_duration_seconds', 'Time spent in SQL per request', ['endpoint'])
+template_render_duration = metrics_registry.histogram(
+    'splitly_template_render_duration_seconds', 'Time to render a template', ['template'])
+pdf_build_duration = metrics_registry.histogram(
+    'splitly_pdf_build_duration_seconds', 'Time to build a PDF report', ['result'])
+slow_requests_profiled = metrics_registry.counter(
+    'splitly_slow_requests_profiled_total', 'Slow requests whose stacks were saved', ['endpoint'])
+fragment_lookups = metrics_registry.counter(
+    'splitly_fragment_cache_lookups_total', 'Expense card lookups in the fragment cache', ['result'])
+
+profiler = SamplingProfiler(app.config['PROFILE_SAMPLE_INTERVAL']) if app.config['PROFILE_SLOW_REQUESTS'] else None
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if profiler:
+        profiler.start()
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    """Record the finished request; unhandled exceptions count as 500s"""
+    if 'request_start' not in g:
+        return
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unmatched'
+    status = g.get('response_status', 500)
+    request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=status)
+    request_queries.observe(g.get('query_count', 0), endpoint=endpoint)
+    request_sql_duration.observe(g.get('query_time', 0), endpoint=endpoint)
+    
+    if profiler:
+        stacks = profiler.stop()
+        if elapsed >= app.config['PROFILE_SLOW_REQUESTS'] and stacks:
+            save_request_profile(endpoint, elapsed, stacks)
+
+def save_request_profile(endpoint, elapsed, stacks):
+    """Write a slow request's sampled stacks as a collapsed-stack file for flamegraph tools"""
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    filename = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{endpoint}_{elapsed * 1000:.0f}ms.folded"
+    path = os.path.join(app.config['PROFILE_DIR'], filename)
+    with open(path, 'w') as f:
+        f.write(stacks)
+    slow_requests_profiled.inc(endpoint=endpoint)
+    app.logger.warning('Slow request %s %s took %.0f ms; stacks saved to %s',
+                       request.method, request.path, elapsed * 1000, path)
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_starts', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    template_render_duration.observe(time.perf_counter() - g.template_starts.pop(), template=template.name)
+
+class AuthUser(UserMixin):
+    """Detached snapshot of the logged-in user, safe to share across requests"""
+    
+    def __init__(self, id, email, name):
+        self.id = id
+        self.email = email
+        self.name = name
+
+Member = namedtuple('Member', ['id', 'name'])
+
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+)
+email_limiter = TokenBucketLimiter(*app.config['AUTH_RATE_LIMIT_PER_EMAIL'], maxsize=app.config['AUTH_RATE_LIMIT_KEYS'])
+ip_limiter = TokenBucketLimiter(*app.config['AUTH_RATE_LIMIT_PER_IP'], maxsize=app.config['AUTH_RATE_LIMIT_KEYS'])
+
+# Live group updates; Redis relays them between worker processes when configured
+broker_options = {
+    'queue_size': app.config['EVENTS_QUEUE_SIZE'],
+    'max_subscribers': app.config['EVENTS_MAX_SUBSCRIBERS'],
+}
+if app.config['EVENTS_REDIS_URL']:
+    event_broker = RedisBroker(app.config['EVENTS_REDIS_URL'], **broker_options)
+else:
+    event_broker = LocalBroker(**broker_options)
+
+user_cache = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+membership_cache = TTLCache(maxsize=app.config['MEMBERSHIP_CACHE_SIZE'], ttl=app.config['MEMBERSHIP_CACHE_TTL'])
+
+if app.config['FRAGMENT_CACHE_REDIS_URL']:
+    fragment_store = RedisFragmentStore(app.config['FRAGMENT_CACHE_REDIS_URL'], ttl=app.config['FRAGMENT_CACHE_TTL'])
+elif app.config['FRAGMENT_CACHE_DIR']:
+    fragment_store = DiskFragmentStore(app.config['FRAGMENT_CACHE_DIR'], ttl=app.config['FRAGMENT_CACHE_TTL'])
+else:
+    fragment_store = None
+fragment_cache = FragmentCache(maxsize=app.config['FRAGMENT_CACHE_SIZE'], backend=fragment_store)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    def load():
+        user = db.session.get(User, int(user_id))
+        return AuthUser(user.id, user.email, user.name) if user else None
+    return user_cache.get_or_set(int(user_id), load)
+
+def get_group_members(group_id):
+    """Members of a group in join order, cached per process and memoized per request.
+    
+    Entries are keyed by the group's version, which every join bumps, so a
+    join handled by another worker process is seen on the next request."""
+    memo = g.setdefault('group_members', {})
+    if group_id not in memo:
+        # No query when the route has already loaded the group
+        group = db.session.get(Group, group_id)
+        if group is None:
+            memo[group_id] = []
+        else:
+            memo[group_id] = membership_cache.get_or_set((group_id, group.version), lambda: [
+                Member(user_id, name) for user_id, name in db.session.execute(
+                    select(User.id, User.name).join(GroupMember)
+                        .where(GroupMember.group_id == group_id)
+                        .order_by(GroupMember.id)
+                )
+            ])
+    return memo[group_id]
+
+def is_group_member(group_id, user_id):
+    """Whether the user belongs to the group"""
+    return any(member.id == user_id for member in get_group_members(group_id))
+
+def invalidate_group_members(group_id):
+    """Forget the member list read earlier in this request, after members join"""
+    if has_request_context():
+        g.setdefault('group_members', {}).pop(group_id, None)
+
+GROUP_CODE_ALPHABET = string.ascii_uppercase + string.digits
+GROUP_CODE_LENGTH = 6
+GROUP_CODE_ATTEMPTS = 10
+
+class GroupCodeUnavailable(Exception):
+    """No unused group code was found within GROUP_CODE_ATTEMPTS draws"""
 
 def generate_group_code():
-    """Generate a unique 6-character group code"""
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        if not Group.query.filter_by(code=code).first():
-            return code
+    """Random 6-character group code; uniqueness is enforced when the group is inserted"""
+    return ''.join(secrets.choice(GROUP_CODE_ALPHABET) for _ in range(GROUP_CODE_LENGTH))
+
+def insert_group(group):
+    """Insert a new group, drawing a fresh code whenever the last one was taken.
+    
+    The unique index on group.code does the checking, so there is no lookup
+    per attempt and concurrent creators can never end up with the same code.
+    A collision rolls the transaction back, so this must be its first write."""
+    for _ in range(GROUP_CODE_ATTEMPTS):
+        group.code = generate_group_code()
+        db.session.add(group)
+        try:
+            db.session.flush()
+            return group
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'group.code' not in str(e.orig):
+                raise
+    raise GroupCodeUnavailable(f'no free group code after {GROUP_CODE_ATTEMPTS} attempts')
+
+def auth_rate_limited(email=None):
+    """Return a 429 response if this client or email has used up its attempts, else None"""
+    retry_after = ip_limiter.hit(request.remote_addr)
+    if email and not retry_after:
+        retry_after = email_limiter.hit(email.strip().lower())
+    if not retry_after:
+        return None
+    
+    response = jsonify({'success': False, 'message': 'Too many attempts. Please try again later.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+def hashing_busy_response():
+    response = jsonify({'success': False, 'message': 'The server is busy. Please try again.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 @app.route('/')
 def index():
@@ -120,6 +439,10 @@ def register():
             if len(password) < 6:
                 return jsonify({'success': False, 'message': 'Password must be at least 6 characters'})
             
+            limited = auth_rate_limited()
+            if limited:
+                return limited
+            
             # Check if user already exists
             existing_user = User.query.filter_by(email=email).first()
             if existing_user:
@@ -129,7 +452,7 @@ def register():
             user = User(
                 email=email,
                 name=name,
-                password_hash=generate_password_hash(password)
+                password_hash=password_hasher.hash(password)
             )
             
             db.session.add(user)
@@ -138,9 +461,11 @@ def register():
             login_user(user)
             return jsonify({'success': True, 'redirect': url_for('dashboard')})
             
-        except Exception as e:
+        except HashingBusy:
+            return hashing_busy_response()
+        except Exception:
             db.session.rollback()
-            print(f"Registration error: {e}")  # For debugging
+            app.logger.exception('Registration failed')
             return jsonify({'success': False, 'message': 'Registration failed. Please try again.'})
     
     return render_template('auth.html', mode='register')
@@ -155,17 +480,28 @@ def login():
         
             if not email or not password:
                 return jsonify({'success': False, 'message': 'Email and password are required'})
+            
+            limited = auth_rate_limited(email)
+            if limited:
+                return limited
         
             user = User.query.filter_by(email=email).first()
+            matches, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
         
-            if user and check_password_hash(user.password_hash, password):
+            if matches:
+                if new_hash:
+                    # Stored with older hash parameters; upgrade it now we know the password
+                    user.password_hash = new_hash
+                    db.session.commit()
                 login_user(user)
                 return jsonify({'success': True, 'redirect': url_for('dashboard')})
             else:
                 return jsonify({'success': False, 'message': 'Invalid email or password'})
             
-        except Exception as e:
-            print(f"Login error: {e}")  # For debugging
+        except HashingBusy:
+            return hashing_busy_response()
+        except Exception:
+            app.logger.exception('Login failed')
             return jsonify({'success': False, 'message': 'Login failed. Please try again.'})
     
     return render_template('auth.html', mode='login')
@@ -178,12 +514,32 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
+@query_budget(2)
 def dashboard():
-    user_groups = db.session.query(Group).join(GroupMember).filter(
+    # Counted only for the user's own groups, not over every membership
+    my_group_ids = select(GroupMember.group_id).where(GroupMember.user_id == current_user.id)
+    member_counts = select(
+        GroupMember.group_id, func.count(GroupMember.id).label('member_count')
+    ).where(GroupMember.group_id.in_(my_group_ids)).group_by(GroupMember.group_id).subquery()
+    
+    # The user's balance in each group comes from the materialized ledger in
+    # the same query, so the page costs the same for one group or hundreds
+    rows = db.session.query(Group, member_counts.c.member_count, GroupBalance.balance_cents).join(GroupMember).join(
+        member_counts, member_counts.c.group_id == Group.id
+    ).outerjoin(
+        GroupBalance, and_(GroupBalance.group_id == Group.id, GroupBalance.user_id == current_user.id)
+    ).filter(
         GroupMember.user_id == current_user.id
     ).all()
     
-    return render_template('dashboard.html', groups=user_groups)
+    user_groups = [group for group, _, _ in rows]
+    group_balances = {group.id: balance or 0 for group, _, balance in rows}
+    return render_template('dashboard.html',
+                         groups=user_groups,
+                         member_counts={group.id: count for group, count, _ in rows},
+                         group_balances=group_balances,
+                         owed_to_you=sum(balance for balance in group_balances.values() if balance > 0),
+                         you_owe=-sum(balance for balance in group_balances.values() if balance < 0))
 
 @app.route('/create-group', methods=['GET', 'POST'])
 @login_required
@@ -196,16 +552,18 @@ def create_group():
         group = Group(
             name=name,
             description=description,
-            code=generate_group_code(),
             created_by=current_user.id
         )
-        db.session.add(group)
-        db.session.flush()
+        try:
+            insert_group(group)
+        except GroupCodeUnavailable:
+            return jsonify({'success': False, 'message': 'Could not create group. Please try again.'})
         
         # Add creator as group member
         member = GroupMember(group_id=group.id, user_id=current_user.id)
         db.session.add(member)
         db.session.commit()
+        invalidate_group_members(group.id)
         
         return jsonify({
             'success': True, 
@@ -227,16 +585,19 @@ def join_group():
             return jsonify({'success': False, 'message': 'Invalid group code'})
         
         # Check if user is already a member
-        existing_member = GroupMember.query.filter_by(
-            group_id=group.id, user_id=current_user.id
-        ).first()
-        
-        if existing_member:
+        if is_group_member(group.id, current_user.id):
             return jsonify({'success': False, 'message': 'You are already a member of this group'})
         
         member = GroupMember(group_id=group.id, user_id=current_user.id)
         db.session.add(member)
-        db.session.commit()
+        bump_group_version(group.id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request joined first; the unique index kept one row
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'You are already a member of this group'})
+        invalidate_group_members(group.id)
         
         return jsonify({
             'success': True,
@@ -247,361 +608,1571 @@ def join_group():
 
 @app.route('/group/<int:group_id>')
 @login_required
+@query_budget(7)
 def group_detail(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Check if user is a member
-    member = GroupMember.query.filter_by(
-        group_id=group_id, user_id=current_user.id
-    ).first()
-    
-    if not member:
+    if not is_group_member(group_id, current_user.id):
         flash('You are not a member of this group')
         return redirect(url_for('dashboard'))
     
-    expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.date.desc()).all()
-    members = db.session.query(User).join(GroupMember).filter(
-        GroupMember.group_id == group_id
-    ).all()
+    etag = group_etag(group, 'detail', current_user.id)
+    not_modified = conditional_group_response(group, etag)
+    if not_modified:
+        return not_modified
+    
+    # Only the first page is rendered; the rest is fetched by infinite scroll
+    expenses, next_cursor = get_expense_page(group_id)
+    members = get_group_members(group_id)
+    member_names = {member.id: member.name for member in members}
     
     # Calculate balances
     balances = calculate_group_balances(group_id)
     
-    return render_template('group_detail.html', 
+    response = make_response(render_template('group_detail.html', 
                          group=group, 
                          expenses=expenses, 
+                         expense_count=group.expense_count,
+                         next_cursor=next_cursor,
+                         expense_cards=render_expense_cards(expenses, member_names),
                          members=members,
-                         balances=balances)
+                         balances=balances))
+    return set_group_cache_headers(response, group, etag)
+
+@app.route('/api/group/<int:group_id>/expenses')
+@login_required
+@query_budget(5)
+def api_group_expenses(group_id):
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    try:
+        expenses, next_cursor = get_expense_page(group_id, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    
+    member_names = {member.id: member.name for member in get_group_members(group_id)}
+    
+    return jsonify({
+        'success': True,
+        'expenses': serialize_expenses(expenses, member_names),
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/group/<int:group_id>/search')
+@login_required
+@query_budget(7)
+def search_expenses(group_id):
+    """Full-text search over a group's expense descriptions.
+    
+    ``q`` matches word prefixes; every word must match. Optional filters are
+    ``payer`` (user id), ``from``/``to`` (YYYY-MM-DD, inclusive) and
+    ``min_amount``/``max_amount``. Results are ranked by relevance, or
+    newest first with ``sort=date``, and paged with ``cursor``."""
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    try:
+        expenses, next_cursor = search_expense_page(group_id, request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    member_names = {member.id: member.name for member in get_group_members(group_id)}
+    
+    return jsonify({
+        'success': True,
+        'expenses': serialize_expenses(expenses, member_names),
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/group/<int:group_id>/stats')
+@login_required
+@query_budget(4)
+def group_stats(group_id):
+    """Spending per member by month (default) or by day, for charts.
+    
+    ``period`` is ``month`` or ``day`` and ``from``/``to`` (YYYY-MM-DD,
+    inclusive) bound the range. Only the rollup tables are read, so the cost
+    follows the number of buckets in the range, not the number of expenses."""
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    try:
+        period, start, end = parse_stats_range(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    rows = db.session.execute(
+        select(SpendingRollup.bucket, SpendingRollup.user_id, SpendingRollup.paid_cents,
+               SpendingRollup.owed_cents, SpendingRollup.expense_count)
+            .where(SpendingRollup.group_id == group_id, SpendingRollup.period == period,
+                   SpendingRollup.bucket.between(start, end), SpendingRollup.expense_count != 0)
+            .order_by(SpendingRollup.bucket, SpendingRollup.user_id)
+    ).all()
+    
+    buckets = {}
+    totals = {member.id: {'user_id': member.id, 'name': member.name, 'paid_cents': 0, 'owed_cents': 0,
+                          'expense_count': 0} for member in get_group_members(group_id)}
+    for bucket, user_id, paid, owed, count in rows:
+        entry = buckets.setdefault(bucket, {'start': bucket.isoformat(), 'paid_cents': 0, 'members': []})
+        entry['paid_cents'] += paid
+        entry['members'].append({'user_id': user_id, 'paid_cents': paid, 'owed_cents': owed, 'expense_count': count})
+        # Former members keep their history
+        member = totals.setdefault(user_id, {'user_id': user_id, 'name': None, 'paid_cents': 0, 'owed_cents': 0,
+                                             'expense_count': 0})
+        member['paid_cents'] += paid
+        member['owed_cents'] += owed
+        member['expense_count'] += count
+    
+    return jsonify({
+        'success': True,
+        'period': period,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'buckets': list(buckets.values()),
+        'members': list(totals.values())
+    })
+
+@app.route('/api/group/<int:group_id>/balances')
+@login_required
+@query_budget(6)
+def group_balances_as_of(group_id):
+    """Member balances as they stood at a point in the group's ledger.
+    
+    ``seq`` names a ledger event; ``as_of`` (ISO date or datetime, UTC; a
+    bare date means the end of that day) picks the last event recorded by
+    then. Without either, the latest balances are replayed. The answer comes
+    from the nearest balance snapshot plus the events after it."""
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    try:
+        seq, as_of = parse_ledger_point(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if seq is None:
+        seq = ledger_seq_at(group_id, as_of)
+    balances, replayed = replay_ledger(group_id, seq)
+    names = {member.id: member.name for member in get_group_members(group_id)}
+    
+    return jsonify({
+        'success': True,
+        'seq': seq,
+        'as_of': as_of.isoformat() if as_of else None,
+        'replayed_events': replayed,
+        'balances': [{'user_id': user_id, 'name': names.get(user_id), 'balance_cents': cents}
+                     for user_id, cents in sorted(balances.items())]
+    })
+
+@app.route('/api/group/<int:group_id>/ledger')
+@login_required
+@query_budget(4)
+def group_ledger(group_id):
+    """A group's ledger events in sequence order, LEDGER_PAGE_SIZE at a time after ``after``"""
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'after must be a sequence number'}), 400
+    
+    limit = app.config['LEDGER_PAGE_SIZE']
+    events = LedgerEvent.query.filter(LedgerEvent.group_id == group_id, LedgerEvent.seq > after) \
+        .order_by(LedgerEvent.seq).limit(limit + 1).all()
+    
+    return jsonify({
+        'success': True,
+        'events': [{
+            'seq': event.seq,
+            'kind': event.kind,
+            'ref_id': event.ref_id,
+            'deltas': parse_ledger_amounts(event.deltas),
+            'created_at': event.created_at.isoformat()
+        } for event in events[:limit]],
+        'next_after': events[limit - 1].seq if len(events) > limit else None
+    })
 
 @app.route('/add-expense/<int:group_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(12)
 def add_expense(group_id):
     group = Group.query.get_or_404(group_id)
     
+    if not is_group_member(group_id, current_user.id):
+        if request.method == 'POST':
+            return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+        flash('You are not a member of this group')
+        return redirect(url_for('dashboard'))
+    
     if request.method == 'POST':
-        data = request.get_json()
+        try:
+            fields, shares = parse_expense_data(request.get_json(), member_lookup(group_id))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
         expense = Expense(
             group_id=group_id,
-            description=data.get('description'),
-            amount=float(data.get('amount')),
-            paid_by=int(data.get('paid_by')),
-            date=datetime.now(),
-            split_members=','.join(map(str, data.get('split_members', [])))
+            splits=[ExpenseSplit(user_id=user_id, share_cents=share) for user_id, share in shares.items()],
+            **fields
         )
         
         db.session.add(expense)
+        deltas = expense_balance_deltas(expense)
+        apply_balance_deltas(group_id, deltas)
+        apply_rollup_deltas(group_id, spending_rollup_deltas([expense_spending(expense)]))
+        # The balance upsert flushed the expense, so it has its id
+        record_ledger_events(group_id, [('expense_added', expense.id, deltas)])
+        version = bump_group_version(group_id, expenses=1)
+        # Detached with its splits, so the event can still read it after the commit
+        db.session.expunge(expense)
         db.session.commit()
+        publish_group_event(group_id, 'expense_added', version, expense=lambda: serialize_expense(
+            expense, {member.id: member.name for member in get_group_members(group_id)}
+        ))
         
         return jsonify({'success': True, 'redirect': url_for('group_detail', group_id=group_id)})
     
-    # Convert User objects to dictionaries for JSON serialization
-    members_query = db.session.query(User).join(GroupMember).filter(
-        GroupMember.group_id == group_id
-    ).all()
-    
-    members = [{'id': member.id, 'name': member.name} for member in members_query]
+    # Convert members to dictionaries for JSON serialization
+    members = [member._asdict() for member in get_group_members(group_id)]
     
     return render_template('add_expense.html', group=group, members=members)
 
+@app.route('/api/group/<int:group_id>/expenses/bulk', methods=['POST'])
+@login_required
+def bulk_import_expenses(group_id):
+    """Import many expenses from a JSON array, NDJSON stream or CSV upload.
+    
+    Rows are validated against the member list once, then inserted in
+    batches of IMPORT_BATCH_SIZE with one transaction per batch. Invalid
+    rows are skipped and reported back by row number."""
+    Group.query.get_or_404(group_id)
+    
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    lookup = member_lookup(group_id)
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    imported = 0
+    errors = []
+    batch = []
+    
+    def flush():
+        nonlocal imported
+        try:
+            insert_expense_batch(group_id, batch)
+            imported += len(batch)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Bulk import batch failed for group %s', group_id)
+            errors.extend({'row': row_number, 'message': 'Failed to save row'} for row_number, _, _ in batch)
+        batch.clear()
+    
+    try:
+        for row_number, row in iter_import_rows():
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                batch.append((row_number, *parse_expense_data(row, lookup)))
+            except ValueError as e:
+                errors.append({'row': row_number, 'message': str(e)})
+            if len(batch) >= batch_size:
+                flush()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if batch:
+        flush()
+    
+    return jsonify({
+        'success': not errors,
+        'imported': imported,
+        'failed': len(errors),
+        'errors': errors
+    })
+
 @app.route('/delete-expense/<int:expense_id>', methods=['POST'])
 @login_required
+@query_budget(14)
 def delete_expense(expense_id):
     try:
         expense = Expense.query.get_or_404(expense_id)
         
         # Check if user is a member of the group
-        member = GroupMember.query.filter_by(
-            group_id=expense.group_id, user_id=current_user.id
-        ).first()
-        
-        if not member:
+        if not is_group_member(expense.group_id, current_user.id):
             return jsonify({'success': False, 'message': 'You are not authorized to delete this expense'})
         
         group_id = expense.group_id
+        deltas = {user_id: -delta for user_id, delta in expense_balance_deltas(expense).items()}
+        apply_balance_deltas(group_id, deltas)
+        apply_rollup_deltas(group_id, spending_rollup_deltas([expense_spending(expense)]), sign=-1)
+        record_ledger_events(group_id, [('expense_deleted', expense_id, deltas)])
+        version = bump_group_version(group_id, expenses=-1)
+        card_key = expense_card_key(expense)
         db.session.delete(expense)
         db.session.commit()
+        # Only frees the space; a card is never served for different content
+        fragment_cache.delete(card_key)
+        publish_group_event(group_id, 'expense_deleted', version, expense_id=expense_id)
         
         return jsonify({'success': True, 'message': 'Expense deleted successfully'})
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Delete expense error: {e}")
+        app.logger.exception('Deleting expense %s failed', expense_id)
         return jsonify({'success': False, 'message': 'Failed to delete expense'})
 
+@app.route('/group/<int:group_id>/events')
+@login_required
+@query_budget(4)
+def group_events(group_id):
+    """Server-Sent Events stream of changes to the group as other members make them.
+    
+    On a sync or threaded server every open stream holds a worker thread, so
+    streams are capped per process by EVENTS_MAX_SUBSCRIBERS and each one
+    ends after EVENTS_MAX_AGE seconds; the browser then reconnects with
+    Last-Event-ID and is told to resync if it missed anything."""
+    if not is_group_member(group_id, current_user.id):
+        return "Unauthorized", 403
+    
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+    try:
+        subscription = event_broker.subscribe(group_channel(group_id))
+    except TooManySubscribers:
+        # The page tries again after ``retry`` and reloads if the group changed meanwhile
+        return Response(f'retry: {heartbeat * 1000}\n\n', 503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(heartbeat)})
+    
+    # Read after subscribing, so a change committed in between is never missed
+    version = db.session.scalar(select(Group.version).where(Group.id == group_id))
+    if version is None:
+        event_broker.unsubscribe(subscription)
+        abort(404)
+    
+    # The page (or a reconnecting browser) says which version it last saw
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    deadline = time.monotonic() + app.config['EVENTS_MAX_AGE']
+    
+    def stream():
+        yield f'retry: {heartbeat * 1000}\n\n'
+        if since is not None and since != str(version):
+            yield RESYNC
+        while time.monotonic() < deadline:
+            # Idle streams just block here; the heartbeat comment also
+            # surfaces closed connections so they can be cleaned up
+            message = subscription.get(timeout=heartbeat)
+            yield message if message is not None else ': heartbeat\n\n'
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.call_on_close(lambda: event_broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/settle-up/<int:group_id>')
 @login_required
+@query_budget(4)
 def settle_up(group_id):
     group = Group.query.get_or_404(group_id)
+    
+    if not is_group_member(group_id, current_user.id):
+        flash('You are not a member of this group')
+        return redirect(url_for('dashboard'))
+    
+    # ?solver=exact|greedy|auto picks the algorithm for this request
+    solver = request.args.get('solver', app.config['SETTLEMENT_SOLVER'])
+    if solver not in SOLVERS:
+        solver = app.config['SETTLEMENT_SOLVER']
+    
+    etag = group_etag(group, 'settle', current_user.id, solver)
+    not_modified = conditional_group_response(group, etag)
+    if not_modified:
+        return not_modified
+    
     balances = calculate_group_balances(group_id)
-    settlements = calculate_settlements(balances)
+    settlements, solver_used = calculate_settlements(balances, solver)
     
-    members = db.session.query(User).join(GroupMember).filter(
-        GroupMember.group_id == group_id
-    ).all()
+    members = get_group_members(group_id)
     
-    return render_template('settle_up.html', 
+    response = make_response(render_template('settle_up.html', 
                          group=group, 
                          balances=balances,
                          settlements=settlements,
-                         members=members)
+                         solver_used=solver_used,
+                         members=members))
+    response.headers['X-Settlement-Solver'] = solver_used
+    return set_group_cache_headers(response, group, etag)
 
 @app.route('/mark-settled', methods=['POST'])
 @login_required
+@query_budget(10)
 def mark_settled():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+    try:
+        group_id, from_user, to_user = (int(data.get(key)) for key in ('group_id', 'from_user', 'to_user'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'group_id, from_user and to_user must be ids'}), 400
+    try:
+        amount_cents = parse_money(data.get('amount'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Please enter a valid amount'}), 400
     
     settlement = Settlement(
-        group_id=data.get('group_id'),
-        from_user=data.get('from_user'),
-        to_user=data.get('to_user'),
-        amount=float(data.get('amount')),
+        group_id=group_id,
+        from_user=from_user,
+        to_user=to_user,
+        amount_cents=amount_cents,
         date=datetime.now()
     )
     
+    member_ids = {member.id for member in get_group_members(settlement.group_id)}
+    if not member_ids.issuperset({current_user.id, settlement.from_user, settlement.to_user}):
+        return jsonify({'success': False, 'message': 'Settlements can only involve group members'}), 403
+    
     db.session.add(settlement)
+    deltas = settlement_balance_deltas(settlement)
+    apply_balance_deltas(settlement.group_id, deltas)
+    record_ledger_events(settlement.group_id, [('settlement_added', settlement.id, deltas)])
+    version = bump_group_version(settlement.group_id)
+    # Read before the commit expires the settlement
+    group_id = settlement.group_id
+    details = {
+        'from_user': settlement.from_user,
+        'to_user': settlement.to_user,
+        'amount_cents': settlement.amount_cents
+    }
     db.session.commit()
+    publish_group_event(group_id, 'settlement_added', version, settlement=details)
     
     return jsonify({'success': True})
 
 @app.route('/download-pdf/<int:group_id>')
 @login_required
+@query_budget(3)
 def download_pdf(group_id):
+    group = Group.query.get_or_404(group_id)
+    
+    # Check if user is a member
+    if not is_group_member(group_id, current_user.id):
+        return "Unauthorized", 403
+    
+    # The PDF is the same for every member, so the tag only depends on the version
+    etag = group_etag(group, 'pdf')
+    not_modified = conditional_group_response(group, etag)
+    if not_modified:
+        return not_modified
+    
     try:
-        group = Group.query.get_or_404(group_id)
-        
-        # Check if user is a member
-        member = GroupMember.query.filter_by(
-            group_id=group_id, user_id=current_user.id
-        ).first()
-        
-        if not member:
-            return "Unauthorized", 403
-        
-        # Get data
-        expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.date.desc()).all()
-        members = db.session.query(User).join(GroupMember).filter(
-            GroupMember.group_id == group_id
-        ).all()
-        balances = calculate_group_balances(group_id)
-        settlements = calculate_settlements(balances)
+        # Streamed from disk rather than read into memory; the file is opened
+        # here, so one removed since the last check is caught as well
+        response = send_file(report_path(group.id, group.version), mimetype='application/pdf',
+                             as_attachment=True, download_name=f'{group.name}_expenses.pdf', conditional=False)
+    except FileNotFoundError:
+        start_report_job(group)
+        return jsonify({
+            'success': False,
+            'status': 'pending',
+            'status_url': url_for('group_report', group_id=group_id)
+        }), 202
+    return set_group_cache_headers(response, group, etag)
+
+@app.route('/api/group/<int:group_id>/report', methods=['GET', 'POST'])
+@login_required
+@query_budget(3)
+def group_report(group_id):
+    """Start (POST) or poll (GET) background generation of the group's PDF report"""
+    group = Group.query.get_or_404(group_id)
+    
+    if not is_group_member(group_id, current_user.id):
+        return jsonify({'success': False, 'message': 'You are not a member of this group'}), 403
+    
+    if os.path.exists(report_path(group.id, group.version)):
+        status = 'done'
+    elif request.method == 'POST':
+        status = start_report_job(group)
+    else:
+        status = report_job_status(group)
+    
+    response = {'success': status != 'failed', 'status': status}
+    if status == 'done':
+        response['download_url'] = url_for('download_pdf', group_id=group_id)
+    return jsonify(response)
+
+@app.route('/metrics')
+def metrics():
+    """Request, SQL, template and PDF metrics for this process in Prometheus text format"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return "Unauthorized", 401
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/export/<int:group_id>.<fmt>')
+@login_required
+@query_budget(4)
+def export_group(group_id, fmt):
+    """Stream one group's expense ledger as CSV or JSON Lines"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    group = Group.query.get_or_404(group_id)
+    
+    if not is_group_member(group_id, current_user.id):
+        return "Unauthorized", 403
+    
+    names = {member.id: member.name for member in get_group_members(group_id)}
+    return export_response(f'{group.name}_expenses', fmt, {group.id: group.name}, names)
+
+@app.route('/export/all.<fmt>')
+@login_required
+@query_budget(4)
+def export_all_groups(fmt):
+    """Stream the expense ledgers of every group the current user belongs to"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    
+    groups = dict(db.session.execute(
+        select(Group.id, Group.name).join(GroupMember).where(GroupMember.user_id == current_user.id)
+    ).all())
+    names = dict(db.session.execute(
+        select(User.id, User.name).join(GroupMember).where(GroupMember.group_id.in_(groups)).distinct()
+    ).all())
+    return export_response('splitly_expenses', fmt, groups, names)
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXPORT_COLUMNS = ['Group', 'Date', 'Description', 'Paid By', 'Amount', 'Split Between']
+
+# Spreadsheets run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_cell(value):
+    """Make user-entered text inert when the CSV is opened in a spreadsheet"""
+    value = str(value)
+    return "'" + value if value.startswith(CSV_FORMULA_PREFIXES) else value
+
+def export_response(filename, fmt, groups, names):
+    """Streaming download of the ledgers of ``groups`` ({id: name}) in the given format"""
+    rows = iter_ledger_rows(list(groups), names)
+    
+    if fmt == 'csv':
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for row in rows:
+                writer.writerow([csv_cell(value) for value in (
+                    groups[row['group_id']], row['date'], row['description'],
+                    row['paid_by_name'], row['amount'], ', '.join(row['split_between'])
+                )])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+    else:
+        def generate():
+            for row in rows:
+                yield json.dumps(dict(row, group=groups[row['group_id']])) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+    set_download_name(response, f'{filename}.{fmt}')
+    return response
+
+def set_download_name(response, name):
+    """Mark a response as a download called ``name``, quoted and encoded the way send_file does it.
+    
+    Headers must be Latin-1, so names outside ASCII also get an RFC 5987
+    ``filename*`` with an ASCII fallback."""
+    try:
+        name.encode('ascii')
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': fallback, 'filename*': "UTF-8''" + quote(name, safe="!#$&+^`|~")}
+    else:
+        names = {'filename': name}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+
+def iter_ledger_rows(group_ids, names):
+    """Yield one dict per expense, newest first within each group.
+    
+    A single query streams through a server-side cursor in EXPORT_BATCH_SIZE
+    batches, with each expense's split members aggregated in SQL, so memory
+    use does not grow with the size of the ledger."""
+    split_ids = select(
+        ExpenseSplit.expense_id, func.group_concat(ExpenseSplit.user_id).label('user_ids')
+    ).group_by(ExpenseSplit.expense_id).subquery()
+    
+    query = select(
+        Expense.id, Expense.group_id, Expense.date, Expense.description,
+        Expense.paid_by, Expense.amount_cents, split_ids.c.user_ids
+    ).outerjoin(split_ids, split_ids.c.expense_id == Expense.id).where(
+        Expense.group_id.in_(group_ids)
+    ).order_by(Expense.group_id, Expense.date.desc(), Expense.id.desc()).execution_options(
+        yield_per=app.config['EXPORT_BATCH_SIZE']
+    )
+    
+    for row in db.session.execute(query):
+        split_member_ids = sorted(int(x) for x in (row.user_ids or '').split(',') if x)
+        yield {
+            'id': row.id,
+            'group_id': row.group_id,
+            'date': row.date.strftime('%m/%d/%Y'),
+            'description': row.description,
+            'paid_by': row.paid_by,
+            'paid_by_name': names.get(row.paid_by, 'Unknown'),
+            'amount': format_money(row.amount_cents),
+            'amount_cents': row.amount_cents,
+            'split_between': [names[user_id] for user_id in split_member_ids if user_id in names],
+            'split_member_ids': split_member_ids,
+        }
+
+def report_path(group_id, version):
+    """On-disk cache location of a group's report for one data version"""
+    return os.path.join(app.config['REPORT_CACHE_DIR'], f'group_{group_id}_v{version}.pdf')
+
+def start_report_job(group):
+    """Queue report generation for the group's current version unless it is queued, running or done"""
+    with report_jobs_lock:
+        status = report_job_status(group)
+        if status in ('queued', 'running', 'done'):
+            return status
+        future = report_executor.submit(run_report_job, group.id, group.version)
+        report_jobs[group.id] = (group.version, future)
+    return report_job_status(group)
+
+def report_job_status(group):
+    """Status of the report job for the group's current version.
+    
+    A finished job only counts as done while its file is still there;
+    otherwise the report is 'missing' and the next start queues it again."""
+    job = report_jobs.get(group.id)
+    if not job or job[0] != group.version:
+        return 'missing'
+    future = job[1]
+    if future.running():
+        return 'running'
+    if not future.done():
+        return 'queued'
+    if future.exception():
+        return 'failed'
+    return 'done' if os.path.exists(report_path(group.id, group.version)) else 'missing'
+
+def run_report_job(group_id, version):
+    """Worker entry point: build the report inside its own app context"""
+    with app.app_context():
+        start = time.perf_counter()
+        try:
+            path = build_group_report(group_id, version)
+        except Exception:
+            pdf_build_duration.observe(time.perf_counter() - start, result='error')
+            app.logger.exception('PDF generation failed for group %s', group_id)
+            raise
+        pdf_build_duration.observe(time.perf_counter() - start, result='ok')
+        return path
+
+def build_group_report(group_id, version):
+    """Render the group's PDF report for ``version`` into the report cache and return its path.
+    
+    Returns None without writing anything if the group has moved past
+    ``version``; the newer version gets its own job. Every read below is in
+    one SQLite read transaction, so the data all belongs to the same version."""
+    # ReportLab is only imported here, on the report worker, so it stays out of app start-up
+    import reports
+    
+    group = db.session.get(Group, group_id)
+    if group is None or group.version != version:
+        return None
+    path = report_path(group.id, version)
+    
+    # Get data
+    expenses = Expense.query.filter_by(group_id=group_id).options(
+        selectinload(Expense.splits), selectinload(Expense.payer)
+    ).order_by(Expense.date.desc()).all()
+    members = get_group_members(group_id)
+    member_names = {member.id: member.name for member in members}
+    balances = calculate_group_balances(group_id)
+    settlements, _ = calculate_settlements(balances, app.config['SETTLEMENT_SOLVER'])
+    
+    # Format the content; reports.py lays it out
+    info_lines = [f"<b>Group Code:</b> {group.code}"]
+    if group.description:
+        info_lines.append(f"<b>Description:</b> {group.description}")
+    info_lines.append(f"<b>Generated on:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}")
+    
+    total_expenses = sum(expense.amount_cents for expense in expenses)
+    summary_lines = [
+        f"Total Expenses: {format_money(total_expenses)}",
+        f"Number of Expenses: {len(expenses)}",
+        f"Group Members: {len(members)}",
+    ]
+    
+    balance_rows = []
+    for member in members:
+        balance = balances.get(member.id, 0)
+        if balance > 0:
+            status = "Gets back"
+            balance_str = f"+ {format_money(balance)}"
+        elif balance < 0:
+            status = "Owes"
+            balance_str = f"- {format_money(-balance)}"
+        else:
+            status = "Settled"
+            balance_str = " 0.00"
         
-        # Create PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
+        balance_rows.append([member.name, balance_str, status])
+    
+    settlement_rows = [[
+        member_names.get(settlement['from_user'], 'Unknown'),
+        member_names.get(settlement['to_user'], 'Unknown'),
+        f" {format_money(settlement['amount_cents'])}"
+    ] for settlement in settlements]
+    
+    expense_rows = []
+    for expense in expenses:
+        split_names = [member_names[split.user_id] for split in expense.splits
+                       if split.user_id in member_names]
         
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#2563eb')
+        expense_rows.append([
+            expense.date.strftime('%m/%d/%Y'),
+            expense.description[:30] + ('...' if len(expense.description) > 30 else ''),
+            expense.payer.name,
+            f" {format_money(expense.amount_cents)}",
+            ', '.join(split_names)[:40] + ('...' if len(', '.join(split_names)) > 40 else '')
+        ])
+    
+    # Build PDF, then publish it atomically and drop older versions. Newer
+    # ones may have been written by a concurrent job and are left alone
+    os.makedirs(app.config['REPORT_CACHE_DIR'], exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    reports.write_group_report(tmp_path, f"Splitly Pro - {group.name}", info_lines, summary_lines,
+                               balance_rows, settlement_rows, expense_rows)
+    os.replace(tmp_path, path)
+    
+    cache_dir = app.config['REPORT_CACHE_DIR']
+    for name in os.listdir(cache_dir):
+        match = re.fullmatch(rf'group_{group.id}_v(\d+)\.pdf', name)
+        if match and int(match.group(1)) < version:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+    
+    return path
+
+def member_lookup(group_id):
+    """Map member ids and case-folded names to user ids, for parsing submitted expenses"""
+    lookup = {}
+    for member in get_group_members(group_id):
+        lookup[str(member.id)] = member.id
+        lookup.setdefault(member.name.strip().casefold(), member.id)
+    return lookup
+
+def parse_expense_data(data, lookup):
+    """Validate one submitted expense.
+    
+    Members may be given by id or by name. Returns the Expense column values
+    and a {user_id: share_cents} mapping, or raises ValueError with a message
+    suitable for the user."""
+    def resolve(value):
+        user_id = lookup.get(str(value).strip().casefold())
+        if user_id is None:
+            raise ValueError('Expenses can only involve group members')
+        return user_id
+    
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    
+    description = str(data.get('description') or '').strip()
+    if not description:
+        raise ValueError('Description is required')
+    if len(description) > 200:
+        raise ValueError('Description must be at most 200 characters')
+    
+    custom_shares = data.get('shares') or {}
+    if not isinstance(custom_shares, dict):
+        raise ValueError('shares must map members to amounts')
+    split_members = data.get('split_members') or []
+    if isinstance(split_members, str):
+        split_members = [x for x in re.split(r'[;|]', split_members) if x.strip()]
+    elif not isinstance(split_members, (list, tuple)):
+        raise ValueError('split_members must be a list of members')
+    
+    try:
+        amount_cents = parse_money(data.get('amount'))
+        custom_shares = {user_id: parse_money(share) for user_id, share in custom_shares.items()}
+    except ValueError as e:
+        raise ValueError('Please enter a valid amount') from e
+    
+    if custom_shares:
+        shares = {resolve(user_id): share for user_id, share in custom_shares.items()}
+    else:
+        shares = split_evenly(amount_cents, [resolve(user_id) for user_id in split_members])
+    
+    if not shares:
+        raise ValueError('Select at least one member to split with')
+    
+    if sum(shares.values()) != amount_cents:
+        raise ValueError('Shares must add up to the expense amount')
+    
+    date = datetime.now()
+    if data.get('date'):
+        try:
+            date = datetime.fromisoformat(str(data['date']).strip())
+        except ValueError as e:
+            raise ValueError('Date must be in YYYY-MM-DD format') from e
+    
+    fields = {
+        'description': description,
+        'amount_cents': amount_cents,
+        'paid_by': resolve(data.get('paid_by')),
+        'date': date,
+    }
+    return fields, shares
+
+def iter_import_rows():
+    """Yield (row_number, row) pairs from the request body without loading it all.
+    
+    CSV (a 'file' upload or a text/csv body) and NDJSON are read
+    incrementally; a plain JSON body must hold an "expenses" array. Rows that
+    cannot be decoded are yielded as ValueError instances."""
+    upload = request.files.get('file')
+    if upload or request.mimetype == 'text/csv':
+        stream = upload.stream if upload else request.stream
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        for row_number, row in enumerate(reader, start=1):
+            yield row_number, {key.strip().lower(): value for key, value in row.items() if key}
+    elif request.mimetype == 'application/x-ndjson':
+        for row_number, line in enumerate(io.TextIOWrapper(request.stream, encoding='utf-8'), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield row_number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+            except json.JSONDecodeError:
+                yield row_number, ValueError('Invalid JSON')
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('expenses'), list):
+            raise ValueError('Expected a JSON object with an "expenses" list, NDJSON or a CSV file')
+        for row_number, row in enumerate(data['expenses'], start=1):
+            yield row_number, row if isinstance(row, dict) else ValueError('Each expense must be a JSON object')
+
+def insert_expense_batch(group_id, batch):
+    """Insert validated (row_number, fields, shares) rows and their ledger updates in one transaction.
+    
+    Balances move in one folded update, but the ledger still gets one event per expense."""
+    expense_ids = db.session.execute(
+        insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+        [dict(fields, group_id=group_id) for _, fields, _ in batch]
+    ).scalars().all()
+    
+    split_rows = [
+        {'expense_id': expense_id, 'user_id': user_id, 'share_cents': share}
+        for expense_id, (_, _, shares) in zip(expense_ids, batch)
+        for user_id, share in shares.items()
+    ]
+    db.session.execute(insert(ExpenseSplit), split_rows)
+    
+    # Fold the whole batch into one balance update
+    apply_balance_deltas(group_id, net_balances(
+        [fields['paid_by'] for _, fields, _ in batch],
+        [fields['amount_cents'] for _, fields, _ in batch],
+        [row['user_id'] for row in split_rows],
+        [row['share_cents'] for row in split_rows],
+    ))
+    apply_rollup_deltas(group_id, spending_rollup_deltas(
+        (fields['date'], fields['paid_by'], fields['amount_cents'], shares) for _, fields, shares in batch
+    ))
+    record_ledger_events(group_id, [
+        ('expense_added', expense_id, split_balance_deltas(fields['paid_by'], fields['amount_cents'], shares))
+        for expense_id, (_, fields, shares) in zip(expense_ids, batch)
+    ])
+    version = bump_group_version(group_id, expenses=len(batch))
+    db.session.commit()
+    publish_group_event(group_id, 'expenses_imported', version, count=len(batch))
+
+def encode_expense_cursor(expense):
+    """Opaque keyset cursor pointing just past the given expense"""
+    raw = f'{expense.date.isoformat()}|{expense.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_expense_cursor(cursor):
+    """Return the (date, id) pair encoded in a cursor, raising ValueError if malformed"""
+    date, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(date), int(expense_id)
+
+def get_expense_page(group_id, cursor=None, limit=None):
+    """Newest-first page of a group's expenses using keyset pagination on (date, id)"""
+    limit = limit or app.config['EXPENSE_PAGE_SIZE']
+    query = Expense.query.filter_by(group_id=group_id).options(selectinload(Expense.splits))
+    if cursor:
+        query = query.filter(tuple_(Expense.date, Expense.id) < decode_expense_cursor(cursor))
+    
+    expenses = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_expense_cursor(expenses[limit - 1]) if len(expenses) > limit else None
+    return expenses[:limit], next_cursor
+
+SEARCH_MAX_TERMS = 8
+
+# Lightweight handle on the FTS5 table; it is created by DDL, not by the models
+expense_fts = table('expense_fts', column('rowid', db.Integer), column('expense_fts'))
+
+def fts_query(text_query, group_id):
+    """Turn free text into an FTS5 query for one group where every word must match as a prefix.
+    
+    Words are quoted, so FTS5 operators and punctuation typed by users are
+    matched literally instead of being parsed. They only match descriptions;
+    the group token restricts the match itself, so matches in other groups
+    are never scored. Returns '' when there are no words to search for."""
+    words = re.findall(r'\w+', text_query)[:SEARCH_MAX_TERMS]
+    if not words:
+        return ''
+    return f'grp:"g{group_id}" AND description:(' + ' '.join(f'"{word}"*' for word in words) + ')'
+
+
+def encode_search_cursor(phase, floor, score, expense_id):
+    raw = f'{phase}|{floor}|{score!r}|{expense_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_search_cursor(cursor):
+    """Return the (phase, floor, score, expense_id) encoded in a relevance cursor"""
+    phase, floor, score, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    if phase not in ('ranked', 'older'):
+        raise ValueError('Unknown cursor phase')
+    return phase, int(floor), float(score), int(expense_id)
+
+def search_filters(args):
+    """Expense criteria for the optional payer, date range and amount filters"""
+    filters = []
+    if args.get('payer'):
+        filters.append(Expense.paid_by == int(args['payer']))
+    if args.get('from'):
+        filters.append(Expense.date >= datetime.strptime(args['from'], '%Y-%m-%d'))
+    if args.get('to'):
+        filters.append(Expense.date < datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1))
+    if args.get('min_amount'):
+        filters.append(Expense.amount_cents >= parse_money(args['min_amount']))
+    if args.get('max_amount'):
+        filters.append(Expense.amount_cents <= parse_money(args['max_amount']))
+    return filters
+
+def search_expense_page(group_id, args, limit=None):
+    """One page of search results for a group, with the cursor for the next page.
+    
+    Ranking every match of a common word costs time in proportion to the
+    number of matches, so relevance only orders the newest
+    SEARCH_RANK_WINDOW matches in the group. Older matches follow, newest
+    first, and are read straight off the index in rowid order. ``args``
+    holds the request's query parameters; bad values raise ValueError."""
+    limit = limit or app.config['EXPENSE_PAGE_SIZE']
+    match = fts_query(args.get('q', ''), group_id)
+    if not match:
+        raise ValueError('Enter something to search for')
+    sort = args.get('sort', 'relevance')
+    if sort not in ('relevance', 'date'):
+        raise ValueError('sort must be "relevance" or "date"')
+    
+    try:
+        filters = search_filters(args)
+        cursor = args.get('cursor')
+        if cursor and sort == 'date':
+            filters.append(tuple_(Expense.date, Expense.id) < decode_expense_cursor(cursor))
+        state = decode_search_cursor(cursor) if cursor and sort == 'relevance' else None
+    except (ValueError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f'Invalid search filter: {e}') from e
+    
+    def matching(*columns):
+        return db.session.query(Expense, *columns).join(expense_fts, expense_fts.c.rowid == Expense.id).filter(
+            expense_fts.c.expense_fts.match(match), Expense.group_id == group_id, *filters
+        ).options(selectinload(Expense.splits))
+    
+    if sort == 'date':
+        expenses = matching().order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+        next_cursor = encode_expense_cursor(expenses[limit - 1]) if len(expenses) > limit else None
+        return expenses[:limit], next_cursor
+    
+    # Matches with rowid >= floor are ranked; the floor is fixed by the first page
+    if state:
+        phase, floor, last_score, last_id = state
+    else:
+        phase, last_score, last_id = 'ranked', None, None
+        floor = db.session.execute(
+            select(expense_fts.c.rowid).where(expense_fts.c.expense_fts.match(match))
+                .order_by(expense_fts.c.rowid.desc()).offset(app.config['SEARCH_RANK_WINDOW']).limit(1)
+        ).scalar() or 0
+    
+    rows = []
+    if phase == 'ranked':
+        # bm25 scores are negative; lower is a better match. The group token carries no weight
+        ranked = text(
+            'SELECT rowid AS id, bm25(expense_fts, 1.0, 0.0) AS score FROM expense_fts '
+            'WHERE expense_fts MATCH :match AND rowid >= :floor'
+        ).bindparams(match=match, floor=floor).columns(id=db.Integer, score=db.Float).subquery('ranked')
+        query = db.session.query(Expense, ranked.c.score).join(ranked, ranked.c.id == Expense.id).filter(
+            Expense.group_id == group_id, *filters
+        ).options(selectinload(Expense.splits))
+        if last_id is not None:
+            query = query.filter(or_(ranked.c.score > last_score,
+                                     and_(ranked.c.score == last_score, Expense.id < last_id)))
+        rows = [('ranked', expense, score) for expense, score in
+                query.order_by(ranked.c.score, Expense.id.desc()).limit(limit + 1)]
+    
+    if len(rows) <= limit and floor:
+        before = last_id if phase == 'older' else floor
+        rows += [('older', expense, 0.0) for expense in
+                 matching().filter(expense_fts.c.rowid < before)
+                     .order_by(expense_fts.c.rowid.desc()).limit(limit + 1 - len(rows))]
+    
+    next_cursor = None
+    if len(rows) > limit:
+        phase, last, score = rows[limit - 1]
+        next_cursor = encode_search_cursor(phase, floor, score, last.id)
+    return [expense for _, expense, _ in rows[:limit]], next_cursor
+
+def parse_stats_range(args):
+    """Validate the stats period and date range, returning (period, first bucket, last day).
+    
+    Months default to all history and days to the last STATS_DEFAULT_DAYS.
+    Day ranges longer than STATS_MAX_DAYS are rejected; use months instead."""
+    period = args.get('period', 'month')
+    if period not in ('day', 'month'):
+        raise ValueError('period must be "day" or "month"')
+    try:
+        end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else datetime.utcnow().date()
+        if args.get('from'):
+            start = datetime.strptime(args['from'], '%Y-%m-%d').date()
+        elif period == 'day':
+            start = end - timedelta(days=app.config['STATS_DEFAULT_DAYS'] - 1)
+        else:
+            start = datetime.min.date()
+    except ValueError as e:
+        raise ValueError('Dates must be in YYYY-MM-DD format') from e
+    
+    if start > end:
+        raise ValueError('"from" must not be after "to"')
+    if period == 'day' and (end - start).days >= app.config['STATS_MAX_DAYS']:
+        raise ValueError(f'Day ranges are limited to {app.config["STATS_MAX_DAYS"]} days; use period=month')
+    if period == 'month':
+        # Month buckets are dated by their first day
+        start = start.replace(day=1)
+    return period, start, end
+
+def parse_ledger_point(args):
+    """Read ``seq`` or ``as_of`` into (seq, naive UTC datetime); either or both may be None"""
+    if args.get('seq'):
+        try:
+            seq = int(args['seq'])
+        except ValueError:
+            raise ValueError('seq must be a sequence number')
+        if seq < 0:
+            raise ValueError('seq must be a sequence number')
+        return seq, None
+    
+    value = args.get('as_of', '').strip()
+    if not value:
+        return None, None
+    try:
+        as_of = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('as_of must be an ISO date or datetime')
+    if len(value) == 10:
+        as_of += timedelta(days=1, microseconds=-1)
+    if as_of.tzinfo:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    return None, as_of
+
+def expense_card_key(expense):
+    """Cache key of an expense's card: its id and a digest of everything the card shows.
+    
+    SQLite hands the id of the newest expense out again once it is deleted
+    or its insert rolls back, so the id alone could match a card that
+    another process or a shared store still holds for the old expense."""
+    content = (expense.description, expense.amount_cents, expense.date.isoformat(), expense.paid_by,
+               sorted((split.user_id, split.share_cents) for split in expense.splits))
+    return f'expense-card:{expense.id}:{hashlib.sha1(repr(content).encode()).hexdigest()[:16]}'
+
+def member_names_version(member_names):
+    """Digest of a group's member names; cards rendered under other names are re-rendered"""
+    return hashlib.sha1(repr(sorted(member_names.items())).encode()).hexdigest()[:16]
+
+def render_expense_cards(expenses, member_names):
+    """Rendered _expense_card.html for each expense, reusing cards cached under the same names.
+    
+    Keys cover the expense's content and the version covers the member
+    names, so a card is only reused for exactly what it shows."""
+    version = member_names_version(member_names)
+    keys = [expense_card_key(expense) for expense in expenses]
+    cached = fragment_cache.get_many(keys, version)
+    cards = []
+    for expense, key in zip(expenses, keys):
+        card = cached.get(key)
+        if card is None:
+            card = render_template('_expense_card.html', expense=expense, member_names=member_names)
+            fragment_cache.set(key, version, card)
+        cards.append(Markup(card))
+    fragment_lookups.inc(len(cached), result='hit')
+    fragment_lookups.inc(len(expenses) - len(cached), result='miss')
+    return cards
+
+def serialize_expenses(expenses, member_names):
+    cards = render_expense_cards(expenses, member_names)
+    return [serialize_expense(expense, member_names, card) for expense, card in zip(expenses, cards)]
+
+def serialize_expense(expense, member_names, card=None):
+    """JSON representation of an expense, including its rendered card"""
+    return {
+        'id': expense.id,
+        'description': expense.description,
+        'amount_cents': expense.amount_cents,
+        'paid_by': expense.paid_by,
+        'payer_name': member_names.get(expense.paid_by) or expense.payer.name,
+        'date': expense.date.isoformat(),
+        'splits': [{'user_id': split.user_id, 'name': member_names.get(split.user_id), 'share_cents': split.share_cents}
+                   for split in expense.splits],
+        'html': card if card is not None else render_expense_cards([expense], member_names)[0]
+    }
+
+# Ten billion in major units; balance sums stay exact well below 2**53 cents
+MAX_AMOUNT_CENTS = 10 ** 12
+
+def parse_money(value):
+    """Convert a user-entered amount such as "12.5" into integer minor units"""
+    try:
+        cents = (Decimal(str(value).strip()) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    except InvalidOperation as e:
+        raise ValueError(f'Invalid amount: {value!r}') from e
+    if not cents.is_finite():
+        raise ValueError(f'Invalid amount: {value!r}')
+    if cents <= 0:
+        raise ValueError(f'Amount must be positive: {value!r}')
+    if cents > MAX_AMOUNT_CENTS:
+        raise ValueError(f'Amount is too large: {value!r}')
+    return int(cents)
+
+@app.template_filter('money')
+def format_money(cents):
+    """Render integer minor units as a decimal string, e.g. 123456 -> 1234.56"""
+    sign = '-' if cents < 0 else ''
+    return f'{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}'
+
+def expense_balance_deltas(expense):
+    """Balance changes caused by a single expense"""
+    return split_balance_deltas(expense.paid_by, expense.amount_cents,
+                                {split.user_id: split.share_cents for split in expense.splits})
+
+def split_balance_deltas(paid_by, amount_cents, shares):
+    """Balance changes of an expense given as payer, amount and {user_id: share_cents}"""
+    # Person who paid gets credited
+    deltas = {paid_by: amount_cents}
+    
+    # Each person who shared gets debited
+    for user_id, share in shares.items():
+        deltas[user_id] = deltas.get(user_id, 0) - share
+    
+    return deltas
+
+def settlement_balance_deltas(settlement):
+    """Balance changes caused by a single settlement"""
+    deltas = {settlement.from_user: settlement.amount_cents}
+    deltas[settlement.to_user] = deltas.get(settlement.to_user, 0) - settlement.amount_cents
+    return deltas
+
+def apply_balance_deltas(group_id, deltas, sign=1):
+    """Add balance changes to the materialized ledger inside the current transaction.
+    
+    The increment happens in SQL so concurrent writers never overwrite each other."""
+    if not deltas:
+        return
+    stmt = sqlite_insert(GroupBalance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['group_id', 'user_id'],
+        set_={'balance_cents': GroupBalance.balance_cents + stmt.excluded.balance_cents}
+    )
+    db.session.execute(stmt, [
+        {'group_id': group_id, 'user_id': user_id, 'balance_cents': sign * delta}
+        for user_id, delta in deltas.items()
+    ])
+
+def rollup_buckets(day):
+    """The (period, bucket) rollup rows a given day counts towards"""
+    return [('day', day), ('month', day.replace(day=1))]
+
+def expense_spending(expense):
+    """An expense as the (date, paid_by, amount_cents, shares) tuple spending_rollup_deltas takes"""
+    shares = {split.user_id: split.share_cents for split in expense.splits}
+    return expense.date, expense.paid_by, expense.amount_cents, shares
+
+def spending_rollup_deltas(expenses):
+    """Fold (date, paid_by, amount_cents, shares) tuples into {(period, bucket, user_id): [paid, owed, count]}"""
+    deltas = {}
+    for date, paid_by, amount_cents, shares in expenses:
+        involved = {paid_by: [amount_cents, 0]}
+        for user_id, share in shares.items():
+            involved.setdefault(user_id, [0, 0])[1] += share
+        for period, bucket in rollup_buckets(date.date()):
+            for user_id, (paid, owed) in involved.items():
+                totals = deltas.setdefault((period, bucket, user_id), [0, 0, 0])
+                totals[0] += paid
+                totals[1] += owed
+                totals[2] += 1
+    return deltas
+
+def apply_rollup_deltas(group_id, deltas, sign=1):
+    """Add spending changes to the day and month rollups inside the current transaction"""
+    if not deltas:
+        return
+    stmt = sqlite_insert(SpendingRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['group_id', 'period', 'bucket', 'user_id'],
+        set_={
+            'paid_cents': SpendingRollup.paid_cents + stmt.excluded.paid_cents,
+            'owed_cents': SpendingRollup.owed_cents + stmt.excluded.owed_cents,
+            'expense_count': SpendingRollup.expense_count + stmt.excluded.expense_count,
+        }
+    )
+    db.session.execute(stmt, [
+        {'group_id': group_id, 'period': period, 'bucket': bucket, 'user_id': user_id,
+         'paid_cents': sign * paid, 'owed_cents': sign * owed, 'expense_count': sign * count}
+        for (period, bucket, user_id), (paid, owed, count) in deltas.items()
+    ])
+
+def record_ledger_events(group_id, events):
+    """Append (kind, ref_id, deltas) events to the group's ledger inside the current transaction.
+    
+    Events take the group's next sequence numbers in list order. Call after
+    the balance changes: the transaction then already holds SQLite's write
+    lock, so no other writer can take the same numbers (the (group_id, seq)
+    key would reject them anyway). When the events cross a multiple of
+    LEDGER_SNAPSHOT_INTERVAL, the balances as they now stand are
+    snapshotted as well."""
+    if not events:
+        return
+    now = datetime.utcnow()
+    last_seq = db.session.scalar(
+        select(func.coalesce(func.max(LedgerEvent.seq), 0)).where(LedgerEvent.group_id == group_id)
+    )
+    db.session.execute(insert(LedgerEvent.__table__), [
+        {'group_id': group_id, 'seq': last_seq + offset, 'kind': kind, 'ref_id': ref_id,
+         'deltas': json.dumps(deltas), 'created_at': now}
+        for offset, (kind, ref_id, deltas) in enumerate(events, start=1)
+    ])
+    interval = app.config['LEDGER_SNAPSHOT_INTERVAL']
+    if (last_seq + len(events)) // interval > last_seq // interval:
+        take_balance_snapshot(group_id, now)
+
+def take_balance_snapshot(group_id, now=None):
+    """Snapshot the group's current balances at its latest ledger event, unless one is already there"""
+    latest = select(func.max(LedgerEvent.seq)).where(LedgerEvent.group_id == group_id).scalar_subquery()
+    previous = select(func.coalesce(func.max(BalanceSnapshot.seq), 0)) \
+        .where(BalanceSnapshot.group_id == group_id).scalar_subquery()
+    balances = select(func.json_group_object(GroupBalance.user_id, GroupBalance.balance_cents)) \
+        .where(GroupBalance.group_id == group_id).scalar_subquery()
+    db.session.execute(insert(BalanceSnapshot.__table__).from_select(
+        ['group_id', 'seq', 'balances', 'created_at'],
+        select(literal(group_id), latest, balances, literal(now or datetime.utcnow())).where(latest > previous)
+    ))
+
+def parse_ledger_amounts(value):
+    """Decode a ledger JSON object; its keys come back as strings"""
+    return {int(user_id): cents for user_id, cents in json.loads(value).items()}
+
+def ledger_seq_at(group_id, at=None):
+    """Sequence number of the last ledger event recorded at or before ``at`` (UTC; None for the latest), 0 if none"""
+    query = select(func.coalesce(func.max(LedgerEvent.seq), 0)).where(LedgerEvent.group_id == group_id)
+    if at is not None:
+        query = query.where(LedgerEvent.created_at <= at)
+    return db.session.scalar(query)
+
+def replay_ledger(group_id, seq=None):
+    """Balances right after ledger event ``seq`` (default the latest) and how many events were replayed.
+    
+    Starts from the newest snapshot at or before ``seq`` and only adds up
+    the events after it, so the cost is bounded by the snapshot interval."""
+    snapshot_query = select(BalanceSnapshot.seq, BalanceSnapshot.balances) \
+        .where(BalanceSnapshot.group_id == group_id)
+    event_query = select(LedgerEvent.deltas).where(LedgerEvent.group_id == group_id)
+    if seq is not None:
+        snapshot_query = snapshot_query.where(BalanceSnapshot.seq <= seq)
+        event_query = event_query.where(LedgerEvent.seq <= seq)
+    
+    snapshot = db.session.execute(snapshot_query.order_by(BalanceSnapshot.seq.desc()).limit(1)).first()
+    base, balances = (snapshot.seq, parse_ledger_amounts(snapshot.balances)) if snapshot else (0, {})
+    
+    replayed = 0
+    for deltas in db.session.scalars(event_query.where(LedgerEvent.seq > base)):
+        replayed += 1
+        for user_id, cents in parse_ledger_amounts(deltas).items():
+            balances[user_id] = balances.get(user_id, 0) + cents
+    return balances, replayed
+
+def find_ledger_drift(group_id):
+    """Replay a group's whole ledger from the start and report where it disagrees.
+    
+    Returns a list of (seq, user_id, stored, replayed) for every snapshot
+    balance, and then every current balance (seq None), that differs from
+    the running sum of the events."""
+    snapshots = {
+        seq: parse_ledger_amounts(balances) for seq, balances in db.session.execute(
+            select(BalanceSnapshot.seq, BalanceSnapshot.balances).where(BalanceSnapshot.group_id == group_id)
         )
-        story.append(Paragraph(f"Splitly Pro - {group.name}", title_style))
-        story.append(Spacer(1, 20))
-        
-        # Group Info
-        info_style = ParagraphStyle(
-            'Info',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=10
+    }
+    running = {}
+    drift = []
+    
+    def compare(seq, stored):
+        for user_id in set(stored) | set(running):
+            if stored.get(user_id, 0) != running.get(user_id, 0):
+                drift.append((seq, user_id, stored.get(user_id, 0), running.get(user_id, 0)))
+    
+    events = db.session.execute(
+        select(LedgerEvent.seq, LedgerEvent.deltas).where(LedgerEvent.group_id == group_id)
+            .order_by(LedgerEvent.seq)
+    )
+    for seq, deltas in events:
+        for user_id, cents in parse_ledger_amounts(deltas).items():
+            running[user_id] = running.get(user_id, 0) + cents
+        if seq in snapshots:
+            compare(seq, snapshots[seq])
+    compare(None, calculate_group_balances(group_id))
+    return drift
+
+def bump_group_version(group_id, expenses=0):
+    """Mark a group's data as changed inside the current transaction and return its new version.
+    
+    ``expenses`` is the number of expenses the write added (or removed, if
+    negative); the group's expense count moves in the same statement."""
+    return db.session.execute(
+        update(Group).where(Group.id == group_id).values(
+            version=Group.version + 1, updated_at=datetime.utcnow(),
+            expense_count=Group.expense_count + expenses
+        ).returning(Group.version)
+    ).scalar_one()
+
+def group_channel(group_id):
+    return f'group:{group_id}'
+
+def publish_group_event(group_id, event_type, version, **data):
+    """Send a live update for the group's event stream, with its current balances.
+    
+    Call after the write has committed: the payload is rendered outside the
+    transaction, so it never holds SQLite's write lock, and nothing is sent
+    for a write that rolled back. The balances are read then, so they are at
+    least as new as ``version``. Callable values in ``data`` are only
+    evaluated when someone could be listening; otherwise nothing is read."""
+    if not event_broker.has_subscribers(group_channel(group_id)):
+        return
+    try:
+        balances = calculate_group_balances(group_id)
+        data = {key: value() if callable(value) else value for key, value in data.items()}
+        data.update(
+            version=version,
+            balances=balances,
+            balances_html=render_template('_balances.html', balances=balances, members=get_group_members(group_id))
         )
-        story.append(Paragraph(f"<b>Group Code:</b> {group.code}", info_style))
-        if group.description:
-            story.append(Paragraph(f"<b>Description:</b> {group.description}", info_style))
-        story.append(Paragraph(f"<b>Generated on:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", info_style))
-        story.append(Spacer(1, 20))
-        
-        # Summary
-        total_expenses = sum(expense.amount for expense in expenses)
-        story.append(Paragraph("<b>Summary</b>", styles['Heading2']))
-        story.append(Paragraph(f"Total Expenses: {total_expenses:.2f}", info_style))
-        story.append(Paragraph(f"Number of Expenses: {len(expenses)}", info_style))
-        story.append(Paragraph(f"Group Members: {len(members)}", info_style))
-        story.append(Spacer(1, 20))
-        
-        # Current Balances
-        story.append(Paragraph("<b>Current Balances</b>", styles['Heading2']))
-        balance_data = [['Member', 'Balance', 'Status']]
-        
-        for member in members:
-            balance = balances.get(member.id, 0)
-            if balance > 0.01:
-                status = "Gets back"
-                balance_str = f"+ {balance:.2f}"
-            elif balance < -0.01:
-                status = "Owes"
-                balance_str = f"- {abs(balance):.2f}"
-            else:
-                status = "Settled"
-                balance_str = " 0.00"
-            
-            balance_data.append([member.name, balance_str, status])
-        
-        balance_table = Table(balance_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
-        balance_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        story.append(balance_table)
-        story.append(Spacer(1, 20))
-        
-        # Suggested Settlements
-        if settlements:
-            story.append(Paragraph("<b>Suggested Settlements</b>", styles['Heading2']))
-            settlement_data = [['From', 'To', 'Amount']]
-            
-            for settlement in settlements:
-                from_user = next((m for m in members if m.id == settlement['from_user']), None)
-                to_user = next((m for m in members if m.id == settlement['to_user']), None)
-                
-                settlement_data.append([
-                    from_user.name if from_user else 'Unknown',
-                    to_user.name if to_user else 'Unknown',
-                    f" {settlement['amount']:.2f}"
-                ])
-            
-            settlement_table = Table(settlement_data, colWidths=[2*inch, 2*inch, 1.5*inch])
-            settlement_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(settlement_table)
-            story.append(Spacer(1, 20))
-        
-        # Expense Details
-        if expenses:
-            story.append(Paragraph("<b>Expense Details</b>", styles['Heading2']))
-            expense_data = [['Date', 'Description', 'Paid By', 'Amount', 'Split Between']]
-            
-            for expense in expenses:
-                split_member_ids = [int(x) for x in expense.split_members.split(',') if x]
-                split_names = [m.name for m in members if m.id in split_member_ids]
-                
-                expense_data.append([
-                    expense.date.strftime('%m/%d/%Y'),
-                    expense.description[:30] + ('...' if len(expense.description) > 30 else ''),
-                    expense.payer.name,
-                    f" {expense.amount:.2f}",
-                    ', '.join(split_names)[:40] + ('...' if len(', '.join(split_names)) > 40 else '')
-                ])
-            
-            expense_table = Table(expense_data, colWidths=[1*inch, 2*inch, 1.5*inch, 1*inch, 2*inch])
-            expense_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(expense_table)
-        
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
-        
-        # Create response
-        response = make_response(buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename="{group.name}_expenses.pdf"'
-        
-        return response
-        
-    except Exception as e:
-        print(f"PDF generation error: {e}")
-        return "Error generating PDF", 500
+        event_broker.publish(group_channel(group_id), format_sse(event_type, data, event_id=version))
+    except Exception:
+        # The write itself succeeded; streams resync on their next reconnect
+        app.logger.exception('Publishing an event for group %s failed', group_id)
 
-def calculate_group_balances(group_id):
-    """Calculate how much each member owes or is owed"""
-    expenses = Expense.query.filter_by(group_id=group_id).all()
-    settlements = Settlement.query.filter_by(group_id=group_id).all()
+def group_etag(group, *parts):
+    """Strong ETag for a page that only changes when the group's version does.
+    
+    ``parts`` carries whatever else the page depends on (page name, viewer,
+    query options) so different pages and users never share a tag."""
+    key = ':'.join(str(part) for part in (group.id, group.version) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def group_last_modified(group):
+    """The group's last change as an aware datetime, rounded up to HTTP's one-second precision"""
+    updated_at = (group.updated_at or group.created_at).replace(tzinfo=timezone.utc)
+    if updated_at.microsecond:
+        updated_at = updated_at.replace(microsecond=0) + timedelta(seconds=1)
+    return updated_at
+
+def conditional_group_response(group, etag):
+    """Return a 304 response if the client's copy of the page is still current, else None.
     
-    balances = {}
+    Called before any expense, settlement or balance rows are read. Pending
+    flash messages always get a full render so they are not left behind."""
+    if session.get('_flashes'):
+        return None
     
-    # Calculate from expenses
-    for expense in expenses:
-        split_members = [int(x) for x in expense.split_members.split(',') if x]
-        split_amount = expense.amount / len(split_members)
-        
-        # Person who paid gets credited
-        if expense.paid_by not in balances:
-            balances[expense.paid_by] = 0
-        balances[expense.paid_by] += expense.amount
-        
-        # Each person who shared gets debited
-        for member_id in split_members:
-            if member_id not in balances:
-                balances[member_id] = 0
-            balances[member_id] -= split_amount
-    
-    # Subtract settlements
-    for settlement in settlements:
-        if settlement.from_user not in balances:
-            balances[settlement.from_user] = 0
-        if settlement.to_user not in balances:
-            balances[settlement.to_user] = 0
-            
-        balances[settlement.from_user] += settlement.amount
-        balances[settlement.to_user] -= settlement.amount
+    # If-Modified-Since only counts when no ETag was sent. Last-Modified is
+    # rounded up and only sent once that second is over, so any later change
+    # is strictly newer than a date the client got from us
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = request.if_modified_since is not None and request.if_modified_since >= group_last_modified(group)
     
-    return balances
+    if not fresh:
+        return None
+    return set_group_cache_headers(make_response('', 304), group, etag)
+
+def set_group_cache_headers(response, group, etag):
+    """Attach the validators browsers need to revalidate a group page"""
+    response.set_etag(etag)
+    last_modified = group_last_modified(group)
+    # A date in the current second could be shared by a change still to come
+    if last_modified <= datetime.now(timezone.utc):
+        response.last_modified = last_modified
+    # Pages are per user and must be revalidated on every visit
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-def calculate_settlements(balances):
-    """Calculate optimal settlements to minimize transactions"""
-    creditors = [(user_id, amount) for user_id, amount in balances.items() if amount > 0.01]
-    debtors = [(user_id, -amount) for user_id, amount in balances.items() if amount < -0.01]
+def calculate_group_balances(group_id):
+    """Calculate how much each member owes or is owed"""
+    rows = GroupBalance.query.filter_by(group_id=group_id).all()
+    return {row.user_id: row.balance_cents for row in rows}
+
+def recompute_group_balances(group_id):
+    """Recalculate balances from the raw expense and settlement rows"""
+    expenses = db.session.execute(
+        select(Expense.paid_by, Expense.amount_cents).where(Expense.group_id == group_id)
+    ).all()
+    splits = db.session.execute(
+        select(ExpenseSplit.user_id, ExpenseSplit.share_cents)
+            .join(Expense, Expense.id == ExpenseSplit.expense_id)
+            .where(Expense.group_id == group_id)
+    ).all()
+    settlements = db.session.execute(
+        select(Settlement.from_user, Settlement.to_user, Settlement.amount_cents)
+            .where(Settlement.group_id == group_id)
+    ).all()
     
-    settlements = []
+    # Columnar arrays go straight to the vectorized engine
+    payers, amounts = zip(*expenses) if expenses else ((), ())
+    split_users, split_shares = zip(*splits) if splits else ((), ())
+    from_users, to_users, settled = zip(*settlements) if settlements else ((), (), ())
+    return net_balances(payers, amounts, split_users, split_shares, from_users, to_users, settled)
+
+def rebuild_group_balances(group_id):
+    """Replace a group's materialized balances and expense count with freshly recomputed ones"""
+    db.session.execute(update(Group).where(Group.id == group_id).values(
+        expense_count=select(func.count(Expense.id)).where(Expense.group_id == group_id).scalar_subquery()
+    ))
+    GroupBalance.query.filter_by(group_id=group_id).delete()
+    for user_id, balance in recompute_group_balances(group_id).items():
+        db.session.add(GroupBalance(group_id=group_id, user_id=user_id, balance_cents=balance))
+
+def rebuild_spending_rollups(group_id):
+    """Replace a group's spending rollups with totals aggregated from the raw expense rows"""
+    SpendingRollup.query.filter_by(group_id=group_id).delete()
+    # One row per member an expense involves: what they paid and what they owe
+    involvement = union_all(
+        select(Expense.id.label('expense_id'), Expense.date, Expense.paid_by.label('user_id'),
+               Expense.amount_cents.label('paid_cents'), literal(0).label('owed_cents'))
+            .where(Expense.group_id == group_id),
+        select(Expense.id, Expense.date, ExpenseSplit.user_id, literal(0), ExpenseSplit.share_cents)
+            .join(ExpenseSplit, ExpenseSplit.expense_id == Expense.id)
+            .where(Expense.group_id == group_id)
+    ).subquery()
+    # Same buckets as rollup_buckets
+    for period, bucket in (('day', func.date(involvement.c.date)),
+                           ('month', func.strftime('%Y-%m-01', involvement.c.date))):
+        db.session.execute(insert(SpendingRollup).from_select(
+            ['group_id', 'period', 'bucket', 'user_id', 'paid_cents', 'owed_cents', 'expense_count'],
+            select(literal(group_id), literal(period), bucket, involvement.c.user_id,
+                   func.sum(involvement.c.paid_cents), func.sum(involvement.c.owed_cents),
+                   func.count(involvement.c.expense_id.distinct()))
+                .group_by(bucket, involvement.c.user_id)
+        ))
+
+def find_balance_drift(group_id):
+    """Return {user_id: (stored, expected)} for every balance that disagrees with the raw rows"""
+    stored = calculate_group_balances(group_id)
+    expected = recompute_group_balances(group_id)
+    drift = {}
+    for user_id in set(stored) | set(expected):
+        if stored.get(user_id, 0) != expected.get(user_id, 0):
+            drift[user_id] = (stored.get(user_id, 0), expected.get(user_id, 0))
+    return drift
+
+def upgrade_database():
+    """Create missing tables and apply pending migrations"""
+    if not inspect(db.engine).has_table('user'):
+        db.create_all()
+        db.session.execute(text(f'PRAGMA user_version = {len(MIGRATIONS)}'))
+        db.session.commit()
+        return
     
-    creditors.sort(key=lambda x: x[1], reverse=True)
-    debtors.sort(key=lambda x: x[1], reverse=True)
+    version = db.session.execute(text('PRAGMA user_version')).scalar()
+    if version >= len(MIGRATIONS):
+        db.create_all()
+        return
     
-    i, j = 0, 0
-    while i < len(creditors) and j < len(debtors):
-        creditor_id, credit_amount = creditors[i]
-        debtor_id, debt_amount = debtors[j]
-        
-        settle_amount = min(credit_amount, debt_amount)
-        
-        if settle_amount > 0.01:
-            settlements.append({
-                'from_user': debtor_id,
-                'to_user': creditor_id,
-                'amount': round(settle_amount, 2)
-            })
-        
-        creditors[i] = (creditor_id, credit_amount - settle_amount)
-        debtors[j] = (debtor_id, debt_amount - settle_amount)
-        
-        if creditors[i][1] < 0.01:
-            i += 1
-        if debtors[j][1] < 0.01:
-            j += 1
+    with db.engine.begin() as conn:
+        for step in range(version, len(MIGRATIONS)):
+            MIGRATIONS[step](conn)
+        conn.exec_driver_sql(f'PRAGMA user_version = {len(MIGRATIONS)}')
+    db.create_all()
     
-    return settlements
+    # Derived tables are rebuilt from the migrated raw rows
+    for group in Group.query.all():
+        rebuild_group_balances(group.id)
+        rebuild_spending_rollups(group.id)
+        # Backfilled ledger events get a snapshot, so replays need not start from zero
+        take_balance_snapshot(group.id)
+    db.session.commit()
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables and apply pending migrations."""
+    upgrade_database()
+    click.echo('Database is up to date')
+
+@app.cli.command('rebuild-balances')
+@click.option('--group-id', type=int, help='Only rebuild this group.')
+def rebuild_balances_command(group_id):
+    """Recompute materialized balances and expense counts from expenses and settlements."""
+    group_ids = [group_id] if group_id else [group.id for group in Group.query.all()]
+    for gid in group_ids:
+        rebuild_group_balances(gid)
+    db.session.commit()
+    click.echo(f'Rebuilt balances for {len(group_ids)} group(s)')
+
+@app.cli.command('rebuild-rollups')
+@click.option('--group-id', type=int, help='Only rebuild this group.')
+def rebuild_rollups_command(group_id):
+    """Backfill the day and month spending rollups from expenses."""
+    group_ids = [group_id] if group_id else [group.id for group in Group.query.all()]
+    for gid in group_ids:
+        rebuild_spending_rollups(gid)
+    db.session.commit()
+    click.echo(f'Rebuilt spending rollups for {len(group_ids)} group(s)')
+
+@app.cli.command('verify-balances')
+@click.option('--group-id', type=int, help='Only verify this group.')
+def verify_balances_command(group_id):
+    """Compare materialized balances with the raw rows and report drift."""
+    group_ids = [group_id] if group_id else [group.id for group in Group.query.all()]
+    drifted = 0
+    for gid in group_ids:
+        for user_id, (stored, expected) in find_balance_drift(gid).items():
+            drifted += 1
+            click.echo(f'group {gid} user {user_id}: stored {format_money(stored)}, '
+                       f'expected {format_money(expected)}')
+    if drifted:
+        raise click.ClickException(f'{drifted} balance(s) drifted; run rebuild-balances')
+    click.echo(f'Balances consistent for {len(group_ids)} group(s)')
+
+@app.cli.command('verify-ledger')
+@click.option('--group-id', type=int, help='Only verify this group.')
+def verify_ledger_command(group_id):
+    """Replay every ledger event and check the snapshots and current balances against it."""
+    group_ids = [group_id] if group_id else [group.id for group in Group.query.all()]
+    mismatches = 0
+    for gid in group_ids:
+        for seq, user_id, stored, replayed in find_ledger_drift(gid):
+            mismatches += 1
+            where = f'snapshot at seq {seq}' if seq is not None else 'current balance'
+            click.echo(f'group {gid} user {user_id}: {where} {format_money(stored)}, '
+                       f'ledger replay {format_money(replayed)}')
+    if mismatches:
+        raise click.ClickException(f'{mismatches} balance(s) disagree with the ledger')
+    click.echo(f'Ledger consistent for {len(group_ids)} group(s)')
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_database()
     app.run(debug=True)
@@ -0,0 +1,246 @@
+"""Small in-process caches shared by the request handlers."""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Only needed when FRAGMENT_CACHE_REDIS_URL is set
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Entries are per process, so anything cached here must either be
+    invalidated explicitly on writes or be acceptable to serve stale for up
+    to ``ttl`` seconds in other worker processes.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, loader):
+        """Return the cached value, calling ``loader()`` to fill it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets holding at most ``capacity`` tokens, refilled at ``rate`` per second.
+
+    Buckets live in an LRU of ``maxsize`` keys. Evicting one is the same as
+    letting it refill completely, so the store stays bounded at the cost of
+    forgetting the least recently seen keys first.
+    """
+
+    def __init__(self, capacity, rate, maxsize=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Take a token for ``key``. Returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class FragmentCache:
+    """Rendered HTML fragments in a process-local LRU, optionally in front of a shared store.
+
+    Every entry carries a version, such as a digest of the names it shows.
+    A lookup under another version is a miss, and the next ``set``
+    overwrites the entry, so changed inputs never serve a stale fragment.
+    The backend (DiskFragmentStore, RedisFragmentStore) holds plain strings.
+    If it fails, the lookup counts as a miss and the page still renders.
+    """
+
+    def __init__(self, maxsize=4096, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, version):
+        """{key: fragment} for those of ``keys`` cached under ``version``"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] == version:
+                    self._data.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    missing.append(key)
+        if missing and self.backend is not None:
+            try:
+                stored = self.backend.get_many(missing)
+            except Exception as e:
+                logger.warning('Fragment cache backend read failed: %s', e)
+                stored = {}
+            for key, value in stored.items():
+                stored_version, _, fragment = value.partition('\n')
+                if stored_version == version:
+                    found[key] = fragment
+                    self._remember(key, version, fragment)
+        return found
+
+    def set(self, key, version, fragment):
+        self._remember(key, version, fragment)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, f'{version}\n{fragment}')
+            except Exception as e:
+                logger.warning('Fragment cache backend write failed: %s', e)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                logger.warning('Fragment cache backend delete failed: %s', e)
+
+    def clear(self):
+        """Empty the local LRU; the shared backend is left alone"""
+        with self._lock:
+            self._data.clear()
+
+    def _remember(self, key, version, fragment):
+        with self._lock:
+            self._data[key] = (version, fragment)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskFragmentStore:
+    """Fragments as files in ``directory``, shared by every process on the host.
+
+    Files older than ``ttl`` seconds count as missing; a periodic
+    ``find -mmin`` sweep can delete them.
+    """
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        for key in keys:
+            path = self._path(key)
+            try:
+                if self.ttl and os.path.getmtime(path) < now - self.ttl:
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    found[key] = f.read()
+            except FileNotFoundError:
+                pass
+        return found
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class RedisFragmentStore:
+    """Fragments in Redis, shared by every process and host, expiring after ``ttl`` seconds"""
+
+    def __init__(self, url, prefix='splitly:fragment:', ttl=None):
+        if redis is None:
+            raise RuntimeError('FRAGMENT_CACHE_REDIS_URL is set but the redis package is not installed')
+        self.prefix = prefix
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        values = self._redis.mget([self.prefix + key for key in keys])
+        return {key: value.decode() for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value):
+        self._redis.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
@@ -1,6 +1,85 @@
 import os
+from sqlalchemy.engine import make_url
+
+def engine_options(uri):
+    """Engine options for ``uri``; pool sizing only applies where Flask-SQLAlchemy uses a queue pool"""
+    options = {'pool_pre_ping': True}
+    url = make_url(uri)
+    # In-memory SQLite gets a StaticPool, which takes no sizing arguments
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            pool_timeout=30,
+        )
+    return options
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'anil123'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///splitly.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Sized for a multi-threaded server: every worker thread can hold a
+    # connection, with headroom for background report jobs
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Applied to every new SQLite connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    }
+    
+    # Per-process caches for logged-in users and group membership; member lists are keyed by group version
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 300
+    MEMBERSHIP_CACHE_SIZE = 4096
+    MEMBERSHIP_CACHE_TTL = 60
+    # Rendered expense cards; set a directory or a Redis URL to share them between processes
+    FRAGMENT_CACHE_SIZE = 4096
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL')
+    FRAGMENT_CACHE_TTL = 7 * 24 * 3600  # seconds, for the shared backends
+    
+    # Password hashes run in a process pool. Changing the method makes
+    # existing hashes upgrade transparently on each user's next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4 * PASSWORD_HASH_WORKERS))
+    PASSWORD_HASH_TIMEOUT = 10  # seconds
+    
+    # Token buckets for login/register attempts: (burst size, tokens per second)
+    AUTH_RATE_LIMIT_PER_EMAIL = (5, 5 / 60)
+    AUTH_RATE_LIMIT_PER_IP = (30, 1)
+    AUTH_RATE_LIMIT_KEYS = 10000
+    # Reverse proxies in front of the app. When set, the client address (and so
+    # the per-IP limit) comes from that many X-Forwarded-For hops; leave it at 0
+    # when clients connect directly, or they could pick their own address
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    
+    # Live updates: set EVENTS_REDIS_URL to share events between worker processes
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')
+    EVENTS_QUEUE_SIZE = 100  # events buffered per open stream before it is told to resync
+    # Open streams per process. Each one holds a worker thread unless the server
+    # runs an async worker class (gevent, eventlet), so keep this well below the
+    # thread count; pages over the limit get a 503 and try again later
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 8))
+    EVENTS_MAX_AGE = 300  # seconds before a stream ends and the browser reconnects
+    EVENTS_HEARTBEAT = 15  # seconds
+    
+    # /metrics is open unless a token is set, then it needs "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Opt-in: sample every request's stack and keep those slower than this many seconds
+    PROFILE_SLOW_REQUESTS = float(os.environ['PROFILE_SLOW_REQUESTS']) if os.environ.get('PROFILE_SLOW_REQUESTS') else None
+    PROFILE_SAMPLE_INTERVAL = 0.005  # seconds
+    
+    EXPENSE_PAGE_SIZE = 20
+    SEARCH_RANK_WINDOW = 500  # newest matches ordered by relevance; older ones follow by recency
+    STATS_DEFAULT_DAYS = 30
+    STATS_MAX_DAYS = 366  # longer ranges should use month buckets
+    IMPORT_BATCH_SIZE = 1000
+    LEDGER_SNAPSHOT_INTERVAL = 500  # ledger events between balance snapshots
+    LEDGER_PAGE_SIZE = 100
+    EXPORT_BATCH_SIZE = 1000
+    REPORT_WORKERS = 2
+    PDF_PRELOAD = bool(os.environ.get('PDF_PRELOAD'))  # import ReportLab at start-up on a report worker
+    SETTLEMENT_SOLVER = 'auto'
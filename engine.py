@@ -0,0 +1,231 @@
+"""Balance and settlement math for Splitly groups.
+
+Everything here works on plain columnar arrays (one entry per expense, split
+or settlement) instead of ORM objects, so a group's whole history is folded
+into per-member balances with a handful of NumPy passes.
+
+All money is in integer minor units (paise/cents). When an amount does not
+divide evenly, the leftover units go one each to the members with the lowest
+user ids, so every split adds up exactly to the expense.
+"""
+import time
+
+import numpy as np
+
+SOLVERS = ('auto', 'exact', 'greedy')
+
+# Above these limits the exact solver gives up and the greedy one is used
+EXACT_SOLVER_MAX_MEMBERS = 18
+EXACT_SOLVER_TIME_BUDGET = 0.25  # seconds
+
+
+class SolverBudgetExceeded(Exception):
+    """The exact settlement solver would exceed its size or time budget"""
+
+
+def split_evenly(amount_cents, user_ids):
+    """Divide an amount between members, handing leftover cents to the lowest ids"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    base, remainder = divmod(amount_cents, len(user_ids))
+    return {user_id: base + (1 if i < remainder else 0) for i, user_id in enumerate(user_ids)}
+
+
+def equal_split_shares(amounts, split_expenses, split_users):
+    """Per-split shares when each expense is divided evenly between its split rows.
+
+    ``split_expenses`` holds, for every split row, the index of its expense
+    in ``amounts``. Leftover cents follow the same rule as ``split_evenly``.
+    """
+    amounts = np.asarray(amounts, dtype=np.int64)
+    split_expenses = np.asarray(split_expenses, dtype=np.intp)
+    split_users = np.asarray(split_users, dtype=np.int64)
+    counts = np.bincount(split_expenses, minlength=len(amounts))
+    base, remainder = np.divmod(amounts[split_expenses], counts[split_expenses])
+
+    # Rank of each split row by user id within its expense
+    order = np.lexsort((split_users, split_expenses))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts[split_expenses[order]]
+
+    return base + (rank < remainder)
+
+
+def net_balances(payers, amounts, split_users, split_shares,
+                 settlement_from=(), settlement_to=(), settlement_amounts=()):
+    """Net balance per user id from columnar expense, split and settlement data.
+
+    Payers are credited with each expense amount, split members are debited
+    their share, and settlements move money from ``settlement_from`` back to
+    ``settlement_to``. Returns ``{user_id: balance}``.
+    """
+    payers = np.asarray(payers, dtype=np.int64)
+    split_users = np.asarray(split_users, dtype=np.int64)
+    settlement_from = np.asarray(settlement_from, dtype=np.int64)
+    settlement_to = np.asarray(settlement_to, dtype=np.int64)
+    settlement_amounts = np.asarray(settlement_amounts, dtype=np.int64)
+
+    ids = np.concatenate([payers, split_users, settlement_from, settlement_to])
+    if not len(ids):
+        return {}
+
+    # Balances are summed over dense member indexes rather than raw user ids,
+    # so memory follows the ids actually present, not the largest id. When
+    # the ids span a range no longer than the input they are indexed through
+    # a lookup table; otherwise np.unique sorts them. The sums stay in int64
+    # and are exact.
+    weights = np.concatenate([
+        np.asarray(amounts, dtype=np.int64),
+        -np.asarray(split_shares, dtype=np.int64),
+        settlement_amounts,
+        -settlement_amounts,
+    ])
+    low = ids.min()
+    offsets = ids - low
+    span = int(offsets.max()) + 1
+    if span <= len(ids):
+        present = np.zeros(span, dtype=bool)
+        present[offsets] = True
+        user_ids = np.flatnonzero(present) + low
+        index = (np.cumsum(present) - 1)[offsets]
+    else:
+        user_ids, index = np.unique(ids, return_inverse=True)
+    totals = np.zeros(len(user_ids), dtype=np.int64)
+    np.add.at(totals, index, weights)
+    return dict(zip(user_ids.tolist(), totals.tolist()))
+
+
+def greedy_settlements(balances):
+    """Settle balances by repeatedly pairing the largest creditor and debtor.
+
+    Runs in O(n log n) but can use more transfers than necessary.
+    """
+    if not balances:
+        return []
+
+    user_ids = np.fromiter(balances.keys(), dtype=np.int64, count=len(balances))
+    amounts = np.fromiter(balances.values(), dtype=np.int64, count=len(balances))
+
+    # Largest creditors and debtors first; stable sort keeps ties in input order
+    creditor_mask = amounts > 0
+    debtor_mask = amounts < 0
+    creditor_order = np.argsort(-amounts[creditor_mask], kind='stable')
+    debtor_order = np.argsort(amounts[debtor_mask], kind='stable')
+    creditors = list(zip(user_ids[creditor_mask][creditor_order].tolist(),
+                         amounts[creditor_mask][creditor_order].tolist()))
+    debtors = list(zip(user_ids[debtor_mask][debtor_order].tolist(),
+                       (-amounts[debtor_mask][debtor_order]).tolist()))
+
+    settlements = []
+
+    i, j = 0, 0
+    while i < len(creditors) and j < len(debtors):
+        creditor_id, credit_amount = creditors[i]
+        debtor_id, debt_amount = debtors[j]
+
+        settle_amount = min(credit_amount, debt_amount)
+
+        if settle_amount > 0:
+            settlements.append({
+                'from_user': debtor_id,
+                'to_user': creditor_id,
+                'amount_cents': settle_amount
+            })
+
+        creditors[i] = (creditor_id, credit_amount - settle_amount)
+        debtors[j] = (debtor_id, debt_amount - settle_amount)
+
+        if creditors[i][1] == 0:
+            i += 1
+        if debtors[j][1] == 0:
+            j += 1
+
+    return settlements
+
+
+def exact_settlements(balances, max_members=EXACT_SOLVER_MAX_MEMBERS,
+                      time_budget=EXACT_SOLVER_TIME_BUDGET):
+    """Settle balances with the minimum possible number of transfers.
+
+    A group of k members whose balances sum to zero can always be settled
+    with k - 1 transfers, so the minimum for n members is n minus the largest
+    number of disjoint zero-sum subsets. That number is found with a DP over
+    member subsets, memoized in an array indexed by bitmask and filled one
+    subset size at a time. Raises SolverBudgetExceeded when the group has too
+    many non-zero balances or the DP runs past ``time_budget`` seconds.
+    """
+    items = [(user_id, amount) for user_id, amount in balances.items() if amount != 0]
+    n = len(items)
+    if n > max_members:
+        raise SolverBudgetExceeded(f'{n} non-zero balances, limit is {max_members}')
+    if n == 0:
+        return []
+
+    deadline = time.perf_counter() + time_budget
+    masks = np.arange(1 << n, dtype=np.int64)
+    sums = np.zeros(1 << n, dtype=np.int64)
+    sizes = np.zeros(1 << n, dtype=np.int64)
+    for i, (_, amount) in enumerate(items):
+        has_bit = (masks >> i) & 1
+        sums += has_bit * amount
+        sizes += has_bit
+    zero_sum = (sums == 0).astype(np.int32)
+
+    # best[mask] = most zero-sum groups along any chain of subsets ending in mask
+    best = np.zeros(1 << n, dtype=np.int32)
+    by_size = np.argsort(sizes, kind='stable')
+    bounds = np.searchsorted(sizes[by_size], np.arange(n + 2))
+    for size in range(1, n + 1):
+        layer = by_size[bounds[size]:bounds[size + 1]]
+        candidates = np.zeros(len(layer), dtype=np.int32)
+        for i in range(n):
+            bit = 1 << i
+            has_bit = (layer & bit) != 0
+            candidates[has_bit] = np.maximum(candidates[has_bit], best[layer[has_bit] ^ bit])
+        best[layer] = candidates + zero_sum[layer]
+        if time.perf_counter() > deadline:
+            raise SolverBudgetExceeded(f'exact solver exceeded {time_budget}s')
+
+    # Walk back down from the full set; consecutive zero-sum subsets on the
+    # chain differ by one independent group
+    groups = []
+    mask = (1 << n) - 1
+    group_end = mask
+    while mask:
+        if zero_sum[mask] and mask != group_end:
+            groups.append(group_end ^ mask)
+            group_end = mask
+        target = best[mask] - zero_sum[mask]
+        for i in range(n):
+            bit = 1 << i
+            if mask & bit and best[mask ^ bit] == target:
+                mask ^= bit
+                break
+    groups.append(group_end)
+
+    settlements = []
+    for group in groups:
+        members = {items[i][0]: items[i][1] for i in range(n) if group >> i & 1}
+        settlements.extend(greedy_settlements(members))
+    return settlements
+
+
+def calculate_settlements(balances, solver='auto', max_exact_members=EXACT_SOLVER_MAX_MEMBERS,
+                          time_budget=EXACT_SOLVER_TIME_BUDGET):
+    """Calculate settlements that clear every balance.
+
+    ``solver`` is ``'exact'`` (fewest transfers), ``'greedy'`` (fast) or
+    ``'auto'``, which tries the exact solver within its budget. Both
+    ``'exact'`` and ``'auto'`` fall back to greedy when the budget is
+    exceeded. Returns ``(settlements, solver_used)``.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f'Unknown settlement solver: {solver}')
+    if solver != 'greedy':
+        try:
+            return exact_settlements(balances, max_exact_members, time_budget), 'exact'
+        except SolverBudgetExceeded:
+            pass
+    return greedy_settlements(balances), 'greedy'
@@ -0,0 +1,165 @@
+"""Pub/sub for live group updates streamed to browsers as Server-Sent Events.
+
+Every open event stream holds a Subscription with a small bounded queue.
+Publishing never blocks: a subscriber whose queue is full is marked as
+overflowed, its backlog is dropped and it is told to resync (reload)
+instead. One slow browser therefore cannot hold up a write request or grow
+memory without bound.
+
+LocalBroker fans out inside one process. RedisBroker relays through Redis,
+or any server that speaks its pub/sub protocol, so events published by one
+worker process reach streams held open by the others.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Only needed when EVENTS_REDIS_URL is set
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+
+
+class TooManySubscribers(Exception):
+    """The process already holds its maximum number of open event streams"""
+
+
+def format_sse(event_type, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = [f'event: {event_type}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """One open event stream's view of a channel"""
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self._queue = queue.Queue(maxsize)
+        self._overflowed = False
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._overflowed = True
+
+    def resync(self):
+        """Tell the stream it may have missed events"""
+        self._overflowed = True
+
+    def get(self, timeout):
+        """Next encoded event, RESYNC after an overflow, or None if ``timeout`` passes first"""
+        if self._overflowed:
+            self._overflowed = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return RESYNC
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """In-process fan-out of encoded events to the subscriptions of a channel"""
+
+    def __init__(self, queue_size=100, max_subscribers=1000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._channels = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers(f'{self._count} open event streams')
+            subscription = Subscription(channel, self.queue_size)
+            self._channels.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def has_subscribers(self, channel):
+        """Whether publishing to ``channel`` could reach anyone"""
+        return channel in self._channels
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def resync_all(self):
+        with self._lock:
+            subscriptions = [s for subscribers in self._channels.values() for s in subscribers]
+        for subscription in subscriptions:
+            subscription.resync()
+
+
+class RedisBroker(LocalBroker):
+    """LocalBroker whose messages travel through Redis pub/sub.
+
+    A single listener thread per process, started with the first
+    subscription, receives every channel under ``prefix`` and hands the
+    messages to local subscribers.
+    """
+
+    def __init__(self, url, prefix='splitly:', **kwargs):
+        if redis is None:
+            raise RuntimeError('EVENTS_REDIS_URL is set but the redis package is not installed')
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, channel):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+                    self._listener.start()
+        return super().subscribe(channel)
+
+    def has_subscribers(self, channel):
+        # Streams held by other processes are not visible from here
+        return True
+
+    def publish(self, channel, message):
+        self._redis.publish(self.prefix + channel, message)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for item in pubsub.listen():
+                    if item['type'] == 'pmessage':
+                        channel = item['channel'].decode()[len(self.prefix):]
+                        self.deliver(channel, item['data'].decode())
+            except redis.RedisError as e:
+                logger.warning('Event listener lost its Redis connection: %s', e)
+                # Anything published while disconnected is lost
+                self.resync_all()
+                time.sleep(1)
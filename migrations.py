@@ -0,0 +1,303 @@
+"""Schema migrations for existing Splitly databases.
+
+Each migration takes a SQLAlchemy connection and moves the schema forward by
+one step using raw SQL, so it keeps working after the models change. The
+number of applied migrations is tracked in SQLite's ``PRAGMA user_version``.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+
+def _to_cents(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def m001_group_balance(conn):
+    """Materialized per-(group, user) balance table"""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS group_balance (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            balance FLOAT NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, user_id),
+            FOREIGN KEY(group_id) REFERENCES "group" (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+    """)
+
+
+def m002_expense_split(conn):
+    """Move comma-separated Expense.split_members into the expense_split table"""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS expense_split (
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            share FLOAT NOT NULL,
+            PRIMARY KEY (expense_id, user_id),
+            FOREIGN KEY(expense_id) REFERENCES expense (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+    """)
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_expense_split_user_id ON expense_split (user_id)'
+    )
+
+    rows = conn.exec_driver_sql('SELECT id, amount, split_members FROM expense').fetchall()
+    splits = []
+    for expense_id, amount, split_members in rows:
+        user_ids = list(dict.fromkeys(int(x) for x in split_members.split(',') if x))
+        for user_id in user_ids:
+            splits.append((expense_id, user_id, amount / len(user_ids)))
+    if splits:
+        conn.exec_driver_sql(
+            'INSERT OR IGNORE INTO expense_split (expense_id, user_id, share) VALUES (?, ?, ?)',
+            splits
+        )
+    conn.exec_driver_sql('ALTER TABLE expense DROP COLUMN split_members')
+
+
+def m003_expense_keyset_index(conn):
+    """Composite index backing newest-first keyset pagination of a group's expenses"""
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_expense_group_date_id ON expense (group_id, date, id)'
+    )
+
+
+def m004_group_version(conn):
+    """Per-group data version used to key cached reports"""
+    conn.exec_driver_sql('ALTER TABLE "group" ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+def m005_integer_cents(conn):
+    """Store money as integer minor units instead of floats"""
+    for table in ('expense', 'settlement'):
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN amount_cents INTEGER NOT NULL DEFAULT 0')
+        rows = conn.exec_driver_sql(f'SELECT id, amount FROM {table}').fetchall()
+        if rows:
+            conn.exec_driver_sql(
+                f'UPDATE {table} SET amount_cents = ? WHERE id = ?',
+                [(_to_cents(amount), row_id) for row_id, amount in rows]
+            )
+        conn.exec_driver_sql(f'ALTER TABLE {table} DROP COLUMN amount')
+
+    # Rounded shares are nudged by a cent, lowest user id first, until they
+    # add up exactly to their expense
+    conn.exec_driver_sql('ALTER TABLE expense_split ADD COLUMN share_cents INTEGER NOT NULL DEFAULT 0')
+    rows = conn.exec_driver_sql("""
+        SELECT s.expense_id, s.user_id, s.share, e.amount_cents
+        FROM expense_split s JOIN expense e ON e.id = s.expense_id
+        ORDER BY s.expense_id, s.user_id
+    """).fetchall()
+    by_expense = {}
+    for expense_id, user_id, share, amount_cents in rows:
+        by_expense.setdefault(expense_id, (amount_cents, []))[1].append([user_id, _to_cents(share)])
+    updates = []
+    for expense_id, (amount_cents, shares) in by_expense.items():
+        diff = amount_cents - sum(cents for _, cents in shares)
+        step = 1 if diff > 0 else -1
+        for i in range(abs(diff)):
+            shares[i % len(shares)][1] += step
+        updates.extend((cents, expense_id, user_id) for user_id, cents in shares)
+    if updates:
+        conn.exec_driver_sql(
+            'UPDATE expense_split SET share_cents = ? WHERE expense_id = ? AND user_id = ?',
+            updates
+        )
+    conn.exec_driver_sql('ALTER TABLE expense_split DROP COLUMN share')
+
+    # Balances are derived data and get rebuilt after migrating
+    conn.exec_driver_sql('DROP TABLE group_balance')
+    conn.exec_driver_sql("""
+        CREATE TABLE group_balance (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            balance_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, user_id),
+            FOREIGN KEY(group_id) REFERENCES "group" (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+    """)
+
+
+def m006_lookup_indexes(conn):
+    """Index the membership and settlement lookups every route performs"""
+    conn.exec_driver_sql("""
+        DELETE FROM group_member WHERE id NOT IN (
+            SELECT MIN(id) FROM group_member GROUP BY group_id, user_id
+        )
+    """)
+    conn.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_group_member_group_user ON group_member (group_id, user_id)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_group_member_user_id ON group_member (user_id)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_settlement_group_id ON settlement (group_id)'
+    )
+
+
+def m007_group_updated_at(conn):
+    """Timestamp of each group's last data change, served as Last-Modified"""
+    conn.exec_driver_sql('ALTER TABLE "group" ADD COLUMN updated_at DATETIME')
+    conn.exec_driver_sql('UPDATE "group" SET updated_at = created_at')
+
+
+EXPENSE_SEARCH_DDL = [
+    # What the index holds per expense: the description, and its group as a
+    # token such as "g123" so a search only ever matches rows of one group
+    """
+    CREATE VIEW IF NOT EXISTS expense_search_content AS
+    SELECT id, description, 'g' || group_id AS grp FROM expense
+    """,
+    # External-content index: descriptions are stored once, in expense
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+        description, grp, content='expense_search_content', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts (rowid, description, grp) VALUES (new.id, new.description, 'g' || new.group_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense BEGIN
+        INSERT INTO expense_fts (expense_fts, rowid, description, grp)
+        VALUES ('delete', old.id, old.description, 'g' || old.group_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF description, group_id ON expense BEGIN
+        INSERT INTO expense_fts (expense_fts, rowid, description, grp)
+        VALUES ('delete', old.id, old.description, 'g' || old.group_id);
+        INSERT INTO expense_fts (rowid, description, grp) VALUES (new.id, new.description, 'g' || new.group_id);
+    END
+    """,
+]
+
+
+def create_expense_search(conn):
+    """Create the expense_fts full-text index and the triggers that keep it in step with expense"""
+    for statement in EXPENSE_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+
+
+def m008_expense_search(conn):
+    """Full-text index over expense descriptions"""
+    create_expense_search(conn)
+    conn.exec_driver_sql("INSERT INTO expense_fts (expense_fts) VALUES ('rebuild')")
+
+
+def m009_spending_rollup(conn):
+    """Per-member spending totals by day and by month, for group analytics"""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS spending_rollup (
+            group_id INTEGER NOT NULL,
+            period VARCHAR(5) NOT NULL,
+            bucket DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            paid_cents INTEGER NOT NULL DEFAULT 0,
+            owed_cents INTEGER NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, period, bucket, user_id),
+            FOREIGN KEY(group_id) REFERENCES "group" (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+    """)
+
+
+def backfill_ledger_events(conn):
+    """Turn surviving expenses and settlements into ledger events, in date order, for groups with none yet.
+
+    Deleted rows are gone and leave no events. Expense and settlement dates
+    are local wall-clock time, as the app writes them; the events are stamped
+    in UTC like the ones recorded live, using this machine's time zone.
+    """
+    conn.exec_driver_sql("""
+        WITH items AS (
+            SELECT group_id, date AS at, 'expense_added' AS kind, id AS ref_id,
+                   paid_by AS user_id, amount_cents AS delta
+            FROM expense
+            UNION ALL
+            SELECT e.group_id, e.date, 'expense_added', e.id, s.user_id, -s.share_cents
+            FROM expense_split s JOIN expense e ON e.id = s.expense_id
+            UNION ALL
+            SELECT group_id, date, 'settlement_added', id, from_user, amount_cents FROM settlement
+            UNION ALL
+            SELECT group_id, date, 'settlement_added', id, to_user, -amount_cents FROM settlement
+        ),
+        per_user AS (
+            SELECT group_id, MIN(at) AS at, kind, ref_id, user_id, SUM(delta) AS delta
+            FROM items GROUP BY group_id, kind, ref_id, user_id
+        ),
+        events AS (
+            SELECT group_id, MIN(at) AS at, kind, ref_id, json_group_object(user_id, delta) AS deltas
+            FROM per_user GROUP BY group_id, kind, ref_id
+        )
+        INSERT INTO ledger_event (group_id, seq, kind, ref_id, deltas, created_at)
+        SELECT group_id, ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY at, kind, ref_id),
+               kind, ref_id, deltas, COALESCE(datetime(at, 'utc'), CURRENT_TIMESTAMP)
+        FROM events
+        WHERE group_id NOT IN (SELECT group_id FROM ledger_event)
+    """)
+
+
+def m010_ledger_events(conn):
+    """Append-only ledger of balance changes with periodic snapshots, backfilled from existing rows"""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS ledger_event (
+            group_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            ref_id INTEGER NOT NULL,
+            deltas TEXT NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (group_id, seq),
+            FOREIGN KEY(group_id) REFERENCES "group" (id)
+        )
+    """)
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS balance_snapshot (
+            group_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            balances TEXT NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (group_id, seq),
+            FOREIGN KEY(group_id) REFERENCES "group" (id)
+        )
+    """)
+    backfill_ledger_events(conn)
+
+
+def m011_group_expense_count(conn):
+    """Expense count per group, kept up to date by every expense write"""
+    conn.exec_driver_sql('ALTER TABLE "group" ADD COLUMN expense_count INTEGER NOT NULL DEFAULT 0')
+    conn.exec_driver_sql(
+        'UPDATE "group" SET expense_count = (SELECT COUNT(*) FROM expense WHERE expense.group_id = "group".id)'
+    )
+
+
+def m012_expense_search_group(conn):
+    """Rebuild the full-text index with each expense's group as a token, so matching is per group"""
+    for trigger in ('expense_fts_insert', 'expense_fts_delete', 'expense_fts_update'):
+        conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.exec_driver_sql('DROP TABLE IF EXISTS expense_fts')
+    create_expense_search(conn)
+    conn.exec_driver_sql("INSERT INTO expense_fts (expense_fts) VALUES ('rebuild')")
+
+
+MIGRATIONS = [
+    m001_group_balance,
+    m002_expense_split,
+    m003_expense_keyset_index,
+    m004_group_version,
+    m005_integer_cents,
+    m006_lookup_indexes,
+    m007_group_updated_at,
+    m008_expense_search,
+    m009_spending_rollup,
+    m010_ledger_events,
+    m011_group_expense_count,
+    m012_expense_search_group,
+]
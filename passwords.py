@@ -0,0 +1,106 @@
+"""Password hashing off the request thread.
+
+Hashes are computed in a small pool of worker processes so a burst of
+logins cannot tie up every request thread (or the GIL) with key
+derivation. The number of hashes waiting for a worker is bounded; past
+that, callers get HashingBusy straight away instead of queueing, which
+keeps the latency of the logins that are accepted bounded. If a worker
+dies, the broken pool is replaced and the hash is retried once.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already waiting for a worker"""
+
+
+def _verify(pwhash, password, method):
+    """Check a password and, if it matched, rehash it when its method is outdated"""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if hash_method(pwhash) != method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def hash_method(pwhash):
+    """The method string a Werkzeug hash was generated with, e.g. ``scrypt:32768:8:1``"""
+    return pwhash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Process pool for ``generate_password_hash``/``check_password_hash``.
+
+    ``method`` is any Werkzeug method string and sets the cost for new
+    hashes. ``max_pending`` caps hashes queued or running at once and
+    ``timeout`` is how long a caller waits for its result.
+    """
+
+    def __init__(self, method, workers, max_pending, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        # A worker that dies (OOM kill, crash) breaks the whole pool; start
+        # a fresh one and try once more before giving up
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                return self._run(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+        raise HashingBusy('password hashing workers keep dying')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded server process is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _discard(self, executor):
+        """Forget a broken pool so the next call creates a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('password hashing queue is full')
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password):
+        """Hash a new password with the configured method"""
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Return ``(matches, new_hash)``.
+
+        ``new_hash`` is set when the password matched but was stored with a
+        different method than the configured one, so the caller can save it.
+        """
+        return self._submit(_verify, pwhash, password, self.method)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,94 @@
+"""PDF layout of group reports.
+
+ReportLab takes a noticeable share of start-up time to import. app.py
+therefore loads this module the first time a report is built, on the
+report worker, or ahead of time with PDF_PRELOAD. The styles are built
+once at import and shared by every report, since ReportLab only reads
+them.
+"""
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLES['Heading1'],
+    fontSize=24,
+    spaceAfter=30,
+    alignment=TA_CENTER,
+    textColor=colors.HexColor('#2563eb')
+)
+
+INFO_STYLE = ParagraphStyle(
+    'Info',
+    parent=STYLES['Normal'],
+    fontSize=12,
+    spaceAfter=10
+)
+
+
+def _table_style(header_color, header_font_size=12, body_font_size=None):
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(header_color)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+    ]
+    if body_font_size:
+        commands.append(('FONTSIZE', (0, 1), (-1, -1), body_font_size))
+    commands += [
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]
+    return TableStyle(commands)
+
+
+BALANCE_TABLE_STYLE = _table_style('#3b82f6')
+SETTLEMENT_TABLE_STYLE = _table_style('#10b981')
+EXPENSE_TABLE_STYLE = _table_style('#6366f1', header_font_size=10, body_font_size=9)
+
+
+def _table(header, rows, col_widths, style):
+    table = Table([header] + rows, colWidths=[width * inch for width in col_widths])
+    table.setStyle(style)
+    return table
+
+
+def write_group_report(path, title, info_lines, summary_lines, balance_rows, settlement_rows, expense_rows):
+    """Lay out a group report and write it to ``path``.
+
+    Lines are ReportLab paragraph markup. Rows are lists of already
+    formatted cells, without header rows. The settlement and expense
+    sections are left out when they have no rows.
+    """
+    story = [Paragraph(title, TITLE_STYLE), Spacer(1, 20)]
+
+    story += [Paragraph(line, INFO_STYLE) for line in info_lines]
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("<b>Summary</b>", STYLES['Heading2']))
+    story += [Paragraph(line, INFO_STYLE) for line in summary_lines]
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("<b>Current Balances</b>", STYLES['Heading2']))
+    story.append(_table(['Member', 'Balance', 'Status'], balance_rows, [2, 1.5, 1.5], BALANCE_TABLE_STYLE))
+    story.append(Spacer(1, 20))
+
+    if settlement_rows:
+        story.append(Paragraph("<b>Suggested Settlements</b>", STYLES['Heading2']))
+        story.append(_table(['From', 'To', 'Amount'], settlement_rows, [2, 2, 1.5], SETTLEMENT_TABLE_STYLE))
+        story.append(Spacer(1, 20))
+
+    if expense_rows:
+        story.append(Paragraph("<b>Expense Details</b>", STYLES['Heading2']))
+        story.append(_table(['Date', 'Description', 'Paid By', 'Amount', 'Split Between'], expense_rows,
+                            [1, 2, 1.5, 1, 2], EXPENSE_TABLE_STYLE))
+
+    SimpleDocTemplate(path, pagesize=A4).build(story)
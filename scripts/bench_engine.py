@@ -0,0 +1,89 @@
+"""Benchmark the balance/settlement engine against the original per-object loops.
+
+Run from the project root:
+
+    python scripts/bench_engine.py [--repeat 5]
+
+Groups are synthetic: every expense is paid by a random member and split
+evenly between 1-8 random members, with one settlement per 20 expenses.
+Amounts are integer cents, as stored in the database.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import calculate_settlements, equal_split_shares, net_balances  # noqa: E402
+
+EXPENSE_COUNTS = [10, 1_000, 100_000]
+MEMBER_COUNTS = [5, 50, 500]
+
+
+def make_group(n_expenses, n_members, seed=0):
+    """Columnar data for a synthetic group"""
+    rng = np.random.default_rng(seed)
+    payers = rng.integers(1, n_members + 1, n_expenses)
+    amounts = rng.integers(100, 500_000, n_expenses)
+
+    split_sizes = rng.integers(1, min(n_members, 8) + 1, n_expenses)
+    split_expenses = np.repeat(np.arange(n_expenses), split_sizes)
+    split_users = rng.integers(1, n_members + 1, len(split_expenses))
+    split_shares = equal_split_shares(amounts, split_expenses, split_users)
+
+    n_settlements = max(1, n_expenses // 20)
+    settlement_from = rng.integers(1, n_members + 1, n_settlements)
+    settlement_to = rng.integers(1, n_members + 1, n_settlements)
+    settlement_amounts = rng.integers(100, 50_000, n_settlements)
+
+    return (payers, amounts, split_users, split_shares,
+            settlement_from, settlement_to, settlement_amounts)
+
+
+def loop_balances(payers, amounts, split_users, split_shares,
+                  settlement_from, settlement_to, settlement_amounts):
+    """Reference implementation: the dict-per-row loop the routes used to run"""
+    balances = {}
+    for payer, amount in zip(payers.tolist(), amounts.tolist()):
+        balances[payer] = balances.get(payer, 0) + amount
+    for user_id, share in zip(split_users.tolist(), split_shares.tolist()):
+        balances[user_id] = balances.get(user_id, 0) - share
+    for from_user, to_user, amount in zip(settlement_from.tolist(), settlement_to.tolist(),
+                                          settlement_amounts.tolist()):
+        balances[from_user] = balances.get(from_user, 0) + amount
+        balances[to_user] = balances.get(to_user, 0) - amount
+    return balances
+
+
+def best_of(fn, repeat):
+    number = 1
+    while timeit.timeit(fn, number=number) < 0.05:
+        number *= 10
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'expenses':>9} {'members':>8} {'loop ms':>10} {'engine ms':>10} {'speedup':>8} {'settle ms':>10}")
+    for n_expenses in EXPENSE_COUNTS:
+        for n_members in MEMBER_COUNTS:
+            data = make_group(n_expenses, n_members)
+            expected = loop_balances(*data)
+            balances = net_balances(*data)
+            assert balances == expected
+
+            loop_time = best_of(lambda: loop_balances(*data), args.repeat)
+            engine_time = best_of(lambda: net_balances(*data), args.repeat)
+            settle_time = best_of(lambda: calculate_settlements(balances), args.repeat)
+            print(f'{n_expenses:>9} {n_members:>8} {loop_time * 1e3:>10.3f} '
+                  f'{engine_time * 1e3:>10.3f} {loop_time / engine_time:>7.1f}x {settle_time * 1e3:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark the group page and expense API with and without cached expense cards.
+
+Run from the project root:
+
+    python scripts/bench_fragments.py [--expenses 10000] [--members 8] [--repeat 100]
+
+Works on a throwaway SQLite database with one group. Each route is timed
+twice. In the cold pass, the fragment cache is cleared before every
+request, so all the cards on the page are rendered. In the warm pass,
+the cards come from the in-process cache.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fill(m, n_expenses, n_members, rng):
+    with m.app.app_context(), m.db.engine.begin() as conn:
+        conn.exec_driver_sql('INSERT INTO user (id, email, name, password_hash) VALUES (?, ?, ?, ?)', [
+            (user_id, f'user{user_id}@bench', f'Member {user_id}', 'x') for user_id in range(1, n_members + 1)
+        ])
+        conn.exec_driver_sql(
+            'INSERT INTO "group" (id, name, code, created_by, created_at, updated_at, version) '
+            "VALUES (1, 'Bench', 'BENCH1', 1, '2025-01-01', '2025-01-01', 0)"
+        )
+        conn.exec_driver_sql('INSERT INTO group_member (group_id, user_id) VALUES (?, ?)',
+                             [(1, user_id) for user_id in range(1, n_members + 1)])
+        start = datetime(2025, 1, 1)
+        expenses = []
+        splits = []
+        for expense_id in range(1, n_expenses + 1):
+            members = rng.sample(range(1, n_members + 1), rng.randint(2, n_members))
+            amount = rng.randint(100, 100_000)
+            expenses.append((expense_id, 1, f'Expense {expense_id}', amount, members[0],
+                             start + timedelta(minutes=expense_id)))
+            shares = m.split_evenly(amount, members)
+            splits.extend((expense_id, user_id, share) for user_id, share in shares.items())
+        conn.exec_driver_sql('INSERT INTO expense (id, group_id, description, amount_cents, paid_by, date) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', expenses)
+        conn.exec_driver_sql('INSERT INTO expense_split (expense_id, user_id, share_cents) VALUES (?, ?, ?)',
+                             splits)
+    with m.app.app_context():
+        m.rebuild_group_balances(1)
+        m.db.session.commit()
+
+
+def time_route(m, client, url, repeat, cold):
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            m.fragment_cache.clear()
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--expenses', type=int, default=10_000)
+    parser.add_argument('--members', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    import app as m
+
+    with m.app.app_context():
+        m.upgrade_database()
+    fill(m, args.expenses, args.members, random.Random(0))
+
+    client = m.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    print(f"{args.expenses:,} expenses, {args.members} members, {m.app.config['EXPENSE_PAGE_SIZE']} cards per page")
+    print(f"{'route':<24} {'cold p50 ms':>12} {'cached p50 ms':>14}")
+    for label, url in (('group page', '/group/1'), ('expenses API', '/api/group/1/expenses')):
+        cold = time_route(m, client, url, args.repeat, cold=True)
+        warm = time_route(m, client, url, args.repeat, cold=False)
+        print(f'{label:<24} {cold:>12.2f} {warm:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
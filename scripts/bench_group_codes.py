@@ -0,0 +1,150 @@
+"""Benchmark group creation as the table fills up, and check codes under concurrency.
+
+Run from the project root:
+
+    python scripts/bench_group_codes.py [--max-groups 1000000] [--creates 200] [--threads 8]
+
+Works on a throwaway SQLite database. The group table is bulk-filled to
+each size in turn and ``/create-group`` is timed at that size. The
+concurrency check then shrinks codes to two characters (1,296 possible),
+so collisions are frequent. Several threads create groups at once, and the
+script verifies that every accepted group got a distinct code.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def encode_code(number, alphabet, length):
+    chars = []
+    for _ in range(length):
+        number, digit = divmod(number, len(alphabet))
+        chars.append(alphabet[digit])
+    return ''.join(chars)
+
+
+def fill_groups(m, user_id, target, rng):
+    """Bulk-insert groups with random unused codes until the table holds ``target`` rows"""
+    with m.app.app_context():
+        existing = {code for (code,) in m.db.session.execute(m.select(m.Group.code))}
+        space = len(m.GROUP_CODE_ALPHABET) ** m.GROUP_CODE_LENGTH
+        now = datetime.utcnow()
+        rows = []
+        while len(existing) < target:
+            code = encode_code(rng.randrange(space), m.GROUP_CODE_ALPHABET, m.GROUP_CODE_LENGTH)
+            if code not in existing:
+                existing.add(code)
+                rows.append(('bench', code, user_id, now, now))
+        if rows:
+            m.db.session.connection().exec_driver_sql(
+                'INSERT INTO "group" (name, code, created_by, created_at, updated_at, version) '
+                'VALUES (?, ?, ?, ?, ?, 0)', rows
+            )
+            m.db.session.commit()
+
+
+def login_client(m, email):
+    client = m.app.test_client()
+    response = client.post('/register', json={'email': email, 'password': 'benchmark', 'name': email})
+    assert response.json['success'], response.json
+    return client
+
+
+def time_creates(client, count):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = client.post('/create-group', json={'name': f'g{i}', 'description': ''})
+        latencies.append(time.perf_counter() - start)
+        assert response.json['success'], response.json
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-groups', type=int, default=1_000_000)
+    parser.add_argument('--creates', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    import random
+    import app as m
+
+    rng = random.Random(0)
+    m.ip_limiter.capacity = m.ip_limiter.rate = 10 ** 6
+    with m.app.app_context():
+        m.upgrade_database()
+    client = login_client(m, 'bench@example.com')
+    with m.app.app_context():
+        user_id = m.User.query.filter_by(email='bench@example.com').one().id
+
+    print(f"{'groups':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    size = 0
+    for target in [0, 10_000, 100_000, 1_000_000, 10_000_000]:
+        if target > args.max_groups:
+            break
+        fill_groups(m, user_id, target, rng)
+        latencies = time_creates(client, args.creates)
+        with m.app.app_context():
+            size = m.db.session.query(m.func.count(m.Group.id)).scalar()
+        print(f'{size:>10,} {percentile(latencies, 50) * 1e3:>8.2f} {percentile(latencies, 99) * 1e3:>8.2f}')
+
+    # Concurrency: a tiny code space on a fresh table forces collisions
+    with m.app.app_context():
+        m.GroupMember.query.delete()
+        m.Group.query.delete()
+        m.db.session.commit()
+    m.GROUP_CODE_LENGTH = 2
+    space = len(m.GROUP_CODE_ALPHABET) ** m.GROUP_CODE_LENGTH
+    per_thread = space // 2 // args.threads
+
+    draws = Counter()
+    generate = m.generate_group_code
+
+    def counting_generate():
+        draws[threading.get_ident()] += 1
+        return generate()
+    m.generate_group_code = counting_generate
+
+    clients = [login_client(m, f'bench{i}@example.com') for i in range(args.threads)]
+    results = []
+
+    def worker(client):
+        for i in range(per_thread):
+            response = client.post('/create-group', json={'name': f'c{i}', 'description': ''})
+            results.append((response.json['success'], response.json.get('group_code')))
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with m.app.app_context():
+        codes = [code for (code,) in m.db.session.execute(m.select(m.Group.code))]
+    accepted = [code for success, code in results if success]
+    assert len(codes) == len(set(codes)) == len(accepted), 'duplicate group codes'
+    assert sorted(codes) == sorted(accepted)
+    print(f'{args.threads} threads created {len(accepted)} groups in a {space}-code space '
+          f'({sum(draws.values()) - len(accepted)} collisions retried, '
+          f'{len(results) - len(accepted)} gave up), no duplicates')
+
+
+if __name__ == '__main__':
+    main()
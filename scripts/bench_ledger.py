@@ -0,0 +1,133 @@
+"""Benchmark balance-as-of queries and ledger writes as a group's ledger grows.
+
+Run from the project root:
+
+    python scripts/bench_ledger.py [--max-events 1000000] [--repeat 50]
+
+Works on a throwaway SQLite database. The script grows one group's ledger
+through the bulk import path, which appends one event per expense and a
+balance snapshot every LEDGER_SNAPSHOT_INTERVAL events. At each size it
+times ``/api/group/<id>/balances?seq=N`` at random points; the endpoint
+starts from the nearest snapshot. For comparison, it also times summing
+every event from the start up to the same points, which is what the query
+would cost without snapshots. Finally, it times ``POST /add-expense``,
+which now also appends an event and checks whether a snapshot is due.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEMBERS = [1, 2, 3, 4]
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def add_events(m, count, rng):
+    start = datetime(2021, 1, 1)
+    batch_size = m.app.config['IMPORT_BATCH_SIZE']
+    for offset in range(0, count, batch_size):
+        batch = []
+        for row_number in range(offset, min(offset + batch_size, count)):
+            amount = rng.randint(100, 100_000)
+            members = rng.sample(MEMBERS, rng.randint(2, len(MEMBERS)))
+            fields = {'description': 'bench', 'amount_cents': amount, 'paid_by': rng.choice(MEMBERS),
+                      'date': start + timedelta(minutes=row_number)}
+            batch.append((row_number, fields, m.split_evenly(amount, members)))
+        m.insert_expense_batch(1, batch)
+
+
+def replay_from_start(m, seq):
+    balances = {}
+    events = m.db.session.scalars(
+        m.select(m.LedgerEvent.deltas).where(m.LedgerEvent.group_id == 1, m.LedgerEvent.seq <= seq)
+    )
+    for deltas in events:
+        for user_id, cents in json.loads(deltas).items():
+            balances[int(user_id)] = balances.get(int(user_id), 0) + cents
+    return balances
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return percentile(timings, 50) * 1e3, percentile(timings, 99) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-events', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    import app as m
+
+    rng = random.Random(0)
+    m.ip_limiter.capacity = m.ip_limiter.rate = 10 ** 6
+    with m.app.app_context():
+        m.upgrade_database()
+    client = m.app.test_client()
+    response = client.post('/register', json={'email': 'bench@example.com', 'password': 'benchmark', 'name': 'A'})
+    assert response.json['success'], response.json
+    client.post('/create-group', json={'name': 'Bench', 'description': ''})
+    with m.app.app_context(), m.db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO user (id, email, name, password_hash) VALUES "
+            "(2, 'b@bench', 'B', 'x'), (3, 'c@bench', 'C', 'x'), (4, 'd@bench', 'D', 'x')"
+        )
+        conn.exec_driver_sql('INSERT INTO group_member (group_id, user_id) VALUES (1, 2), (1, 3), (1, 4)')
+
+    def balances_at_random_point():
+        response = client.get(f'/api/group/1/balances?seq={rng.randint(1, total)}')
+        assert response.json['success'], response.json
+
+    def add_expense():
+        response = client.post('/add-expense/1', json={
+            'description': 'bench', 'amount': f'{rng.randint(100, 100_000) / 100:.2f}',
+            'paid_by': rng.choice(MEMBERS), 'split_members': MEMBERS,
+        })
+        assert response.json['success'], response.json
+
+    print(f"interval {m.app.config['LEDGER_SNAPSHOT_INTERVAL']} events")
+    print(f"{'events':>10} {'fill s':>7} {'as-of p50 ms':>13} {'as-of p99 ms':>13} "
+          f"{'no-snapshot p50 ms':>19} {'add_expense p50 ms':>19}")
+    total = 0
+    for target in [10_000, 100_000, 1_000_000, 10_000_000]:
+        if target > args.max_events:
+            break
+        with m.app.app_context():
+            start = time.perf_counter()
+            add_events(m, target - total, rng)
+            fill = time.perf_counter() - start
+            total = m.db.session.scalar(m.select(m.func.max(m.LedgerEvent.seq)))
+            # Summing from the start gets a few runs; at a million events each one takes seconds
+            full = statistics.median(
+                timed(lambda: replay_from_start(m, rng.randint(1, total)), 1)[0] for _ in range(5)
+            )
+        as_of_p50, as_of_p99 = timed(balances_at_random_point, args.repeat)
+        write_p50, _ = timed(add_expense, args.repeat)
+        with m.app.app_context():
+            total = m.db.session.scalar(m.select(m.func.max(m.LedgerEvent.seq)))
+        print(f'{total:>10,} {fill:>7.1f} {as_of_p50:>13.2f} {as_of_p99:>13.2f} {full:>19.2f} {write_p50:>19.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark expense search on a large group.
+
+Run from the project root:
+
+    python scripts/bench_search.py [--expenses 100000] [--other-expenses 100000] [--small-expenses 100] [--repeat 50]
+
+Builds a throwaway SQLite database holding one group with ``--expenses``
+expenses, plus a second group of ``--other-expenses`` that share the index
+and a small group of ``--small-expenses``. The small group is searched too:
+its matches are few, but the big groups' matches for the same words sit
+in the same index.
+Descriptions are two or three words from a small vocabulary, so common
+words match a large share of the group. Each query is timed through
+``search_expense_page``. That covers the FTS match, the filters and the
+ranking, and loads one page of expenses with their splits.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ['dinner', 'lunch', 'breakfast', 'taxi', 'uber', 'hotel', 'flight', 'train', 'groceries',
+         'coffee', 'beer', 'museum', 'tickets', 'fuel', 'parking', 'snacks', 'pizza', 'sushi',
+         'market', 'airport', 'beach', 'rental', 'laundry', 'pharmacy', 'souvenirs', 'tips']
+
+# (label, group id, query parameters); group 1 is the big group and group 3 the small one
+QUERIES = [
+    ('rare word', 1, {'q': 'pharmacy souvenirs'}),
+    ('common prefix', 1, {'q': 'di'}),
+    ('common word', 1, {'q': 'dinner'}),
+    ('word + payer', 1, {'q': 'taxi', 'payer': '2'}),
+    ('word + dates', 1, {'q': 'hotel', 'from': '2025-03-01', 'to': '2025-03-31'}),
+    ('word + amount', 1, {'q': 'coffee', 'min_amount': '100', 'max_amount': '500'}),
+    ('by date', 1, {'q': 'lunch', 'sort': 'date'}),
+    ('small: common', 3, {'q': 'dinner'}),
+    ('small: prefix', 3, {'q': 'di'}),
+    ('small: by date', 3, {'q': 'lunch', 'sort': 'date'}),
+]
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fill_group(conn, group_id, n_expenses, member_ids, rng):
+    start = datetime(2025, 1, 1)
+    expenses = []
+    splits = []
+    first_id = conn.exec_driver_sql('SELECT COALESCE(MAX(id), 0) + 1 FROM expense').scalar()
+    for expense_id in range(first_id, first_id + n_expenses):
+        description = ' '.join(rng.sample(WORDS, rng.randint(2, 3)))
+        amount = rng.randint(100, 100_000)
+        date = start + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        expenses.append((expense_id, group_id, description, amount, rng.choice(member_ids), date))
+        splits.extend((expense_id, user_id, amount // len(member_ids)) for user_id in member_ids)
+    conn.exec_driver_sql(
+        'INSERT INTO expense (id, group_id, description, amount_cents, paid_by, date) VALUES (?, ?, ?, ?, ?, ?)',
+        expenses
+    )
+    conn.exec_driver_sql('INSERT INTO expense_split (expense_id, user_id, share_cents) VALUES (?, ?, ?)', splits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--expenses', type=int, default=100_000)
+    parser.add_argument('--other-expenses', type=int, default=100_000)
+    parser.add_argument('--small-expenses', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    import app as m
+
+    rng = random.Random(0)
+    with m.app.app_context():
+        m.upgrade_database()
+        with m.db.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO user (id, email, name, password_hash) VALUES "
+                "(1, 'a@bench', 'A', 'x'), (2, 'b@bench', 'B', 'x'), (3, 'c@bench', 'C', 'x')"
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO \"group\" (id, name, code, created_by, version) VALUES "
+                "(1, 'Big', 'BENCH1', 1, 0), (2, 'Other', 'BENCH2', 1, 0), (3, 'Small', 'BENCH3', 1, 0)"
+            )
+            fill_group(conn, 1, args.expenses, [1, 2, 3], rng)
+            fill_group(conn, 2, args.other_expenses, [1, 2], rng)
+            fill_group(conn, 3, args.small_expenses, [1, 2], rng)
+            conn.exec_driver_sql('ANALYZE')
+
+    print(f'{args.expenses:,} expenses in the big group, {args.other_expenses:,} in another, '
+          f'{args.small_expenses:,} in the small one')
+    print(f"{'query':<16} {'matches':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    with m.app.test_request_context():
+        for label, group_id, params in QUERIES:
+            matches = m.db.session.execute(
+                m.text('SELECT COUNT(*) FROM expense_fts WHERE expense_fts MATCH :q'),
+                {'q': m.fts_query(params['q'], group_id)}
+            ).scalar()
+            timings = []
+            for _ in range(args.repeat):
+                m.db.session.expunge_all()
+                start = time.perf_counter()
+                m.search_expense_page(group_id, params)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f'{label:<16} {matches:>8,} {percentile(timings, 50) * 1e3:>8.2f} '
+                  f'{percentile(timings, 99) * 1e3:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark the exact and greedy settlement solvers against member count.
+
+Run from the project root:
+
+    python scripts/bench_settlements.py [--max-members 20] [--trials 5]
+
+Balances are random multiples of 50.00 that sum to zero, which gives the
+exact solver plenty of zero-sum subsets to find. Use the output to choose
+EXACT_SOLVER_MAX_MEMBERS in engine.py.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import exact_settlements, greedy_settlements  # noqa: E402
+
+
+def make_balances(n_members, rng):
+    values = [rng.randint(-20, 20) * 5000 or 5000 for _ in range(n_members - 1)]
+    values.append(-sum(values))
+    return {user_id: value for user_id, value in enumerate(values, start=1)}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-members', type=int, default=20)
+    parser.add_argument('--trials', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'members':>8} {'exact ms':>10} {'greedy ms':>10} {'exact txns':>11} {'greedy txns':>12}")
+    for n_members in range(4, args.max_members + 1, 2):
+        exact_time = greedy_time = 0
+        exact_txns = greedy_txns = 0
+        for _ in range(args.trials):
+            balances = make_balances(n_members, rng)
+            exact, elapsed = timed(exact_settlements, balances, max_members=n_members, time_budget=60)
+            exact_time += elapsed
+            exact_txns += len(exact)
+            greedy, elapsed = timed(greedy_settlements, balances)
+            greedy_time += elapsed
+            greedy_txns += len(greedy)
+        print(f'{n_members:>8} {exact_time / args.trials * 1e3:>10.2f} {greedy_time / args.trials * 1e3:>10.3f} '
+              f'{exact_txns / args.trials:>11.1f} {greedy_txns / args.trials:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark worker cold start: importing the app, its first request and its first PDF.
+
+Run from the project root:
+
+    python scripts/bench_startup.py [--runs 10] [--root path/to/checkout]
+
+Each run is a fresh Python process, as a new worker would be. It times
+three steps. The first is ``import app``. The second is the first request,
+a logged-in group page that loads the database, the templates and the
+login machinery. The third is the first PDF report, which includes
+whatever the report still has to import. All runs share a throwaway
+database with one group of 200 expenses. --root points at another
+checkout to get a before/after comparison.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = """
+import app as m
+with m.app.app_context():
+    m.upgrade_database()
+    conn = m.db.session.connection()
+    conn.exec_driver_sql("INSERT INTO user (id, email, name, password_hash) VALUES "
+                         "(1, 'a@bench', 'A', 'x'), (2, 'b@bench', 'B', 'x')")
+    conn.exec_driver_sql("INSERT INTO \\"group\\" (id, name, code, created_by, created_at, updated_at, version) "
+                         "VALUES (1, 'Bench', 'BENCH1', 1, '2025-01-01 00:00:00', '2025-01-01 00:00:00', 0)")
+    conn.exec_driver_sql("INSERT INTO group_member (group_id, user_id) VALUES (1, 1), (1, 2)")
+    conn.exec_driver_sql("INSERT INTO expense (id, group_id, description, amount_cents, paid_by, date) VALUES "
+                         + ", ".join(f"({i}, 1, 'expense {i}', 1000, {1 + i % 2}, '2025-01-01 00:00:00')"
+                                     for i in range(1, 201)))
+    conn.exec_driver_sql("INSERT INTO expense_split (expense_id, user_id, share_cents) VALUES "
+                         + ", ".join(f"({i}, {u}, 500)" for i in range(1, 201) for u in (1, 2)))
+    m.rebuild_group_balances(1)
+    m.db.session.commit()
+"""
+
+RUN = """
+import json, sys, tempfile, time
+start = time.perf_counter()
+import app as m
+imported = time.perf_counter()
+
+client = m.app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = '1'
+    session['_fresh'] = True
+response = client.get('/group/1')
+assert response.status_code == 200, response.status_code
+first_request = time.perf_counter()
+modules = len(sys.modules)
+reportlab_loaded = 'reportlab' in sys.modules
+
+m.app.config['REPORT_CACHE_DIR'] = tempfile.mkdtemp()
+with m.app.app_context():
+    assert m.build_group_report(1, m.db.session.get(m.Group, 1).version)
+first_pdf = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - start,
+    'first request': first_request - imported,
+    'first pdf': first_pdf - first_request,
+    'modules': modules,
+    'reportlab loaded': reportlab_loaded,
+}))
+"""
+
+
+def run_python(code, root, database):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--root', default=ROOT, help='checkout to measure')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(prefix='splitly-bench-'), 'bench.db')
+    run_python(SETUP, args.root, database)
+    # One unmeasured run warms the OS file cache and writes bytecode
+    run_python(RUN, args.root, database)
+
+    runs = [json.loads(run_python(RUN, args.root, database).splitlines()[-1]) for _ in range(args.runs)]
+    print(f'{args.runs} cold starts of {os.path.abspath(args.root)}')
+    print(f"{'step':<16} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for step in ('import', 'first request', 'first pdf'):
+        values = [run[step] * 1e3 for run in runs]
+        print(f'{step:<16} {statistics.median(values):>10.1f} {min(values):>8.1f} {max(values):>8.1f}')
+    print(f"modules after first request: {runs[0]['modules']}, "
+          f"ReportLab loaded: {runs[0]['reportlab loaded']}")
+
+
+if __name__ == '__main__':
+    main()
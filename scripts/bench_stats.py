@@ -0,0 +1,113 @@
+"""Benchmark the spending stats endpoint as a group's history grows.
+
+Run from the project root:
+
+    python scripts/bench_stats.py [--max-expenses 1000000] [--years 5] [--repeat 50]
+
+Works on a throwaway SQLite database. The script bulk-fills one group with
+expenses spread over ``--years`` years and times the ``rebuild-rollups``
+backfill at each size. It then times five years of monthly stats and one
+month of daily stats through ``/api/group/<id>/stats``, which reads only
+the rollup tables.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEMBERS = [1, 2, 3, 4]
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def add_expenses(conn, count, years, rng):
+    start = datetime(2021, 1, 1)
+    minutes = years * 365 * 24 * 60
+    first_id = conn.exec_driver_sql('SELECT COALESCE(MAX(id), 0) + 1 FROM expense').scalar()
+    expenses = []
+    splits = []
+    for expense_id in range(first_id, first_id + count):
+        amount = rng.randint(100, 100_000)
+        date = start + timedelta(minutes=rng.randrange(minutes))
+        expenses.append((expense_id, 1, 'bench', amount, rng.choice(MEMBERS), date))
+        splits.extend((expense_id, user_id, amount // len(MEMBERS)) for user_id in MEMBERS)
+    conn.exec_driver_sql(
+        'INSERT INTO expense (id, group_id, description, amount_cents, paid_by, date) VALUES (?, ?, ?, ?, ?, ?)',
+        expenses
+    )
+    conn.exec_driver_sql('INSERT INTO expense_split (expense_id, user_id, share_cents) VALUES (?, ?, ?)', splits)
+
+
+def time_get(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        assert response.json['success'], response.json
+    timings.sort()
+    return percentile(timings, 50) * 1e3, percentile(timings, 99) * 1e3, len(response.json['buckets'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-expenses', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    import app as m
+
+    rng = random.Random(0)
+    m.ip_limiter.capacity = m.ip_limiter.rate = 10 ** 6
+    with m.app.app_context():
+        m.upgrade_database()
+    client = m.app.test_client()
+    response = client.post('/register', json={'email': 'bench@example.com', 'password': 'benchmark', 'name': 'A'})
+    assert response.json['success'], response.json
+    client.post('/create-group', json={'name': 'Bench', 'description': ''})
+    with m.app.app_context(), m.db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO user (id, email, name, password_hash) VALUES "
+            "(2, 'b@bench', 'B', 'x'), (3, 'c@bench', 'C', 'x'), (4, 'd@bench', 'D', 'x')"
+        )
+        conn.exec_driver_sql('INSERT INTO group_member (group_id, user_id) VALUES (1, 2), (1, 3), (1, 4)')
+
+    last_year = 2021 + args.years - 1
+    monthly = f'/api/group/1/stats?period=month&from=2021-01-01&to={last_year}-12-31'
+    daily = f'/api/group/1/stats?period=day&from={last_year}-06-01&to={last_year}-06-30'
+
+    print(f"{'expenses':>10} {'backfill s':>10} {'months':>7} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'days':>5} {'p50 ms':>7} {'p99 ms':>7}")
+    total = 0
+    for target in [10_000, 100_000, 1_000_000, 10_000_000]:
+        if target > args.max_expenses:
+            break
+        with m.app.app_context(), m.db.engine.begin() as conn:
+            add_expenses(conn, target - total, args.years, rng)
+        total = target
+        with m.app.app_context():
+            start = time.perf_counter()
+            m.rebuild_spending_rollups(1)
+            m.db.session.commit()
+            backfill = time.perf_counter() - start
+        month_p50, month_p99, months = time_get(client, monthly, args.repeat)
+        day_p50, day_p99, days = time_get(client, daily, args.repeat)
+        print(f'{total:>10,} {backfill:>10.2f} {months:>7} {month_p50:>7.2f} {month_p99:>7.2f} '
+              f'{days:>5} {day_p50:>7.2f} {day_p99:>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
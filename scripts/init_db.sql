@@ -1,4 +1,5 @@
 -- Initialize database tables for Splitly Pro
+-- All money columns hold integer minor units (e.g. paise)
 
 -- Users table
 CREATE TABLE IF NOT EXISTS user (
@@ -17,6 +18,9 @@ CREATE TABLE IF NOT EXISTS group (
     code VARCHAR(6) UNIQUE NOT NULL,
     created_by INTEGER NOT NULL,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expense_count INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (created_by) REFERENCES user (id)
 );
 
@@ -27,8 +31,7 @@ CREATE TABLE IF NOT EXISTS group_member (
     user_id INTEGER NOT NULL,
     joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (group_id) REFERENCES group (id),
-    FOREIGN KEY (user_id) REFERENCES user (id),
-    UNIQUE(group_id, user_id)
+    FOREIGN KEY (user_id) REFERENCES user (id)
 );
 
 -- Expenses table
@@ -36,29 +39,110 @@ CREATE TABLE IF NOT EXISTS expense (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     group_id INTEGER NOT NULL,
     description VARCHAR(200) NOT NULL,
-    amount REAL NOT NULL,
+    amount_cents INTEGER NOT NULL,
     paid_by INTEGER NOT NULL,
-    split_members TEXT NOT NULL,
     date DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (group_id) REFERENCES group (id),
     FOREIGN KEY (paid_by) REFERENCES user (id)
 );
 
+-- Expense splits table (one row per member sharing an expense)
+CREATE TABLE IF NOT EXISTS expense_split (
+    expense_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    share_cents INTEGER NOT NULL,
+    PRIMARY KEY (expense_id, user_id),
+    FOREIGN KEY (expense_id) REFERENCES expense (id),
+    FOREIGN KEY (user_id) REFERENCES user (id)
+);
+
 -- Settlements table
 CREATE TABLE IF NOT EXISTS settlement (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     group_id INTEGER NOT NULL,
     from_user INTEGER NOT NULL,
     to_user INTEGER NOT NULL,
-    amount REAL NOT NULL,
+    amount_cents INTEGER NOT NULL,
     date DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (group_id) REFERENCES group (id),
     FOREIGN KEY (from_user) REFERENCES user (id),
     FOREIGN KEY (to_user) REFERENCES user (id)
 );
 
--- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_group_member_group_id ON group_member(group_id);
-CREATE INDEX IF NOT EXISTS idx_group_member_user_id ON group_member(user_id);
-CREATE INDEX IF NOT EXISTS idx_expense_group_id ON expense(group_id);
-CREATE INDEX IF NOT EXISTS idx_settlement_group_id ON settlement(group_id);
+-- Materialized balances, updated in the same transaction as every ledger write
+CREATE TABLE IF NOT EXISTS group_balance (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    balance_cents INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, user_id),
+    FOREIGN KEY (group_id) REFERENCES group (id),
+    FOREIGN KEY (user_id) REFERENCES user (id)
+);
+
+-- Per-member spending by day and by month ('day' or 'month' period, bucket = first day)
+CREATE TABLE IF NOT EXISTS spending_rollup (
+    group_id INTEGER NOT NULL,
+    period VARCHAR(5) NOT NULL,
+    bucket DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    paid_cents INTEGER NOT NULL DEFAULT 0,
+    owed_cents INTEGER NOT NULL DEFAULT 0,
+    expense_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, period, bucket, user_id),
+    FOREIGN KEY (group_id) REFERENCES group (id),
+    FOREIGN KEY (user_id) REFERENCES user (id)
+);
+
+-- Append-only ledger: one row per balance-changing write, numbered per group
+CREATE TABLE IF NOT EXISTS ledger_event (
+    group_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    ref_id INTEGER NOT NULL,
+    deltas TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (group_id, seq),
+    FOREIGN KEY (group_id) REFERENCES group (id)
+);
+
+-- Every member's balance after ledger event seq, taken every LEDGER_SNAPSHOT_INTERVAL events
+CREATE TABLE IF NOT EXISTS balance_snapshot (
+    group_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    balances TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (group_id, seq),
+    FOREIGN KEY (group_id) REFERENCES group (id)
+);
+
+-- Create indexes for better performance (mirrors the indexes declared on the models)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_group_member_group_user ON group_member(group_id, user_id);
+CREATE INDEX IF NOT EXISTS ix_group_member_user_id ON group_member(user_id);
+CREATE INDEX IF NOT EXISTS ix_expense_group_date_id ON expense(group_id, date, id);
+CREATE INDEX IF NOT EXISTS ix_expense_split_user_id ON expense_split(user_id);
+CREATE INDEX IF NOT EXISTS ix_settlement_group_id ON settlement(group_id);
+
+-- Full-text search over expense descriptions, kept in step by triggers.
+-- Each row also carries its group as a token ("g123"), so searches match within one group.
+CREATE VIEW IF NOT EXISTS expense_search_content AS
+SELECT id, description, 'g' || group_id AS grp FROM expense;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+    description, grp, content='expense_search_content', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense BEGIN
+    INSERT INTO expense_fts (rowid, description, grp) VALUES (new.id, new.description, 'g' || new.group_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense BEGIN
+    INSERT INTO expense_fts (expense_fts, rowid, description, grp)
+    VALUES ('delete', old.id, old.description, 'g' || old.group_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF description, group_id ON expense BEGIN
+    INSERT INTO expense_fts (expense_fts, rowid, description, grp)
+    VALUES ('delete', old.id, old.description, 'g' || old.group_id);
+    INSERT INTO expense_fts (rowid, description, grp) VALUES (new.id, new.description, 'g' || new.group_id);
+END;
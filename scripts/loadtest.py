@@ -0,0 +1,284 @@
+"""Load test the main pages with simulated users against a seeded database.
+
+Run from the project root, after scripts/seed_data.py:
+
+    python scripts/loadtest.py instance/seed.db [--users 20] [--duration 60] [--save baseline.json]
+    python scripts/loadtest.py instance/seed.db --baseline baseline.json
+
+By default the app is served from the seeded database by Werkzeug's
+threaded server on a free local port. Pass --url to load an already
+running server backed by the same database instead.
+
+Each simulated user logs in as a seeded user; users start at
+--spawn-rate per second. Each user then picks weighted tasks in a loop
+until the time is up: dashboard, group page, add expense, settle up and
+PDF download. Users wait --think seconds between tasks. A PDF download
+that answers 202 polls the report status until the file is ready.
+Cookies are kept, but no conditional headers are sent, so every page is
+rendered in full.
+
+The report gives throughput and p50/p95/p99 latency per route. --save
+writes it as JSON, and --baseline compares a run with a saved one.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Relative weights, as with Locust's @task(n)
+TASKS = {
+    'dashboard': 5,
+    'group_detail': 5,
+    'add_expense': 2,
+    'settle_up': 2,
+    'download_pdf': 1,
+}
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_accounts(database, count, rng):
+    """Pick seeded users who belong to a group, with their groups and fellow members"""
+    conn = sqlite3.connect(database)
+    try:
+        members = defaultdict(list)
+        for group_id, user_id in conn.execute('SELECT group_id, user_id FROM group_member'):
+            members[group_id].append(user_id)
+        groups_of = defaultdict(list)
+        for group_id, user_ids in members.items():
+            for user_id in user_ids:
+                groups_of[user_id].append(group_id)
+        emails = dict(conn.execute('SELECT id, email FROM user'))
+    finally:
+        conn.close()
+    user_ids = rng.sample(sorted(groups_of), min(count, len(groups_of)))
+    return [(emails[user_id], user_id, {group_id: members[group_id] for group_id in groups_of[user_id]})
+            for user_id in user_ids]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.derived = set()
+        self._lock = threading.Lock()
+
+    def add(self, route, latency, ok, derived=False):
+        """Record one sample; derived ones span several requests and stay out of the total"""
+        with self._lock:
+            self.samples[route].append(latency)
+            if not ok:
+                self.failures[route] += 1
+            if derived:
+                self.derived.add(route)
+
+    def report(self, elapsed):
+        samples = dict(self.samples)
+        samples['all'] = [latency for route, latencies in self.samples.items() if route not in self.derived
+                          for latency in latencies]
+        failures = dict(self.failures, all=sum(count for route, count in self.failures.items()
+                                               if route not in self.derived))
+        rows = {}
+        for route in sorted(self.samples) + ['all']:
+            latencies = sorted(samples[route])
+            if not latencies:
+                continue
+            rows[route] = {
+                'requests': len(latencies),
+                'failures': failures.get(route, 0),
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1e3,
+                'p95_ms': percentile(latencies, 95) * 1e3,
+                'p99_ms': percentile(latencies, 99) * 1e3,
+                'max_ms': latencies[-1] * 1e3,
+            }
+        return rows
+
+
+class SimulatedUser:
+    def __init__(self, base_url, account, password, recorder, rng):
+        self.base_url = base_url
+        self.email, self.user_id, self.groups = account
+        self.password = password
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, route, path, payload=None, expect_json=False):
+        """Time one request and record it under ``route``; returns (status, parsed JSON or None)"""
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        start = time.perf_counter()
+        body = None
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                status = response.status
+                content = response.read()
+                if expect_json:
+                    body = json.loads(content)
+        except urllib.error.HTTPError as e:
+            status = e.code
+            content = e.read()
+            if expect_json and e.headers.get_content_type() == 'application/json':
+                body = json.loads(content)
+        except OSError:
+            status = None
+        latency = time.perf_counter() - start
+        ok = status is not None and status < 400 and (body is None or body.get('success') is not False)
+        self.recorder.add(route, latency, ok)
+        return status, body
+
+    def login(self):
+        for _ in range(5):
+            status, body = self.request('login', '/login', {'email': self.email, 'password': self.password},
+                                        expect_json=True)
+            if status != 503:
+                return status == 200 and body and body.get('success')
+            time.sleep(1)  # Hashing pool is saturated; it sets Retry-After: 1
+        return False
+
+    def run(self, deadline, think):
+        while time.monotonic() < deadline:
+            task = self.rng.choices(list(TASKS), list(TASKS.values()))[0]
+            getattr(self, task)(self.rng.choice(list(self.groups)))
+            if think:
+                time.sleep(self.rng.uniform(0, 2 * think))
+
+    def dashboard(self, group_id):
+        self.request('dashboard', '/dashboard')
+
+    def group_detail(self, group_id):
+        self.request('group_detail', f'/group/{group_id}')
+
+    def settle_up(self, group_id):
+        self.request('settle_up', f'/settle-up/{group_id}')
+
+    def add_expense(self, group_id):
+        members = self.groups[group_id]
+        self.request('add_expense', f'/add-expense/{group_id}', {
+            'description': self.rng.choice(['Lunch', 'Taxi', 'Coffee', 'Groceries', 'Tickets']),
+            'amount': f'{self.rng.randint(100, 20_000) / 100:.2f}',
+            'paid_by': self.user_id,
+            'split_members': self.rng.sample(members, self.rng.randint(1, len(members))),
+        }, expect_json=True)
+
+    def download_pdf(self, group_id):
+        path = f'/download-pdf/{group_id}'
+        start = time.perf_counter()
+        status, _ = self.request('download_pdf', path)
+        polls = 0
+        while status == 202 and polls < 100:
+            time.sleep(0.2)
+            polls += 1
+            _, body = self.request('report_status', f'/api/group/{group_id}/report', expect_json=True)
+            if body and body.get('status') in ('queued', 'running'):
+                continue
+            status, _ = self.request('download_pdf', path)
+        # Time until the user actually has the file, including any wait for the build
+        self.recorder.add('download_pdf (ready)', time.perf_counter() - start, status == 200, derived=True)
+
+
+def print_report(rows, elapsed, baseline=None):
+    print(f"{'route':<22} {'reqs':>6} {'fails':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}" + (f" {'p50 vs base':>12} {'p99 vs base':>12}" if baseline else ''))
+    for route, row in rows.items():
+        line = (f"{route:<22} {row['requests']:>6} {row['failures']:>5} {row['rps']:>7.2f} {row['p50_ms']:>8.1f} "
+                f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+        if baseline and route in baseline:
+            for key in ('p50_ms', 'p99_ms'):
+                change = (row[key] / baseline[route][key] - 1) * 100 if baseline[route][key] else 0
+                line += f' {change:>+11.1f}%'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('database', help='database created by scripts/seed_data.py')
+    parser.add_argument('--url', help='base URL of a running server using the same database')
+    parser.add_argument('--users', type=int, default=20, help='simulated users')
+    parser.add_argument('--spawn-rate', type=float, default=5, help='users started per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds, after every user has started')
+    parser.add_argument('--think', type=float, default=0.5, help='mean pause between tasks, seconds')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results as JSON')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier --save')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    accounts = load_accounts(args.database, args.users, rng)
+    if not accounts:
+        parser.error('no users with groups in the database; run scripts/seed_data.py first')
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        from app import app, ip_limiter
+        # Reports built during the run must not land next to real ones
+        app.config['REPORT_CACHE_DIR'] = tempfile.mkdtemp(prefix='splitly-loadtest-')
+        # Every simulated user comes from 127.0.0.1
+        ip_limiter.capacity = ip_limiter.rate = len(accounts) * 10
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    recorder = Recorder()
+    users = [SimulatedUser(base_url, account, args.password, recorder, random.Random(rng.random()))
+             for account in accounts]
+    deadline = time.monotonic() + len(users) / args.spawn_rate + args.duration
+    failed_logins = []
+
+    def run_user(user):
+        if user.login():
+            user.run(deadline, args.think)
+        else:
+            failed_logins.append(user.email)
+
+    threads = []
+    started = time.perf_counter()
+    for user in users:
+        thread = threading.Thread(target=run_user, args=(user,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(1 / args.spawn_rate)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if server:
+        server.shutdown()
+    rows = recorder.report(elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+    print(f'{len(users)} users against {base_url} for {elapsed:.1f}s' +
+          (f', {len(failed_logins)} could not log in' if failed_logins else ''))
+    print_report(rows, elapsed, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'users': len(users), 'duration_s': elapsed, 'routes': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
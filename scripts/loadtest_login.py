@@ -0,0 +1,121 @@
+"""Load test the login path with a burst of concurrent attempts.
+
+Run from the project root:
+
+    python scripts/loadtest_login.py [--users 200] [--concurrency 200] [--method scrypt:32768:8:1]
+
+The app runs against a throwaway SQLite database in a temporary directory
+and is served by Werkzeug's threaded server on a free local port. Every
+client logs in as its own user at the same moment. Per-request latency
+percentiles and status codes are printed at the end. The per-IP limiter
+is raised for the run, since every client comes from 127.0.0.1; pass
+--keep-ip-limit to leave it at the configured value.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import json
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def post_login(url, email, password):
+    body = json.dumps({'email': email, 'password': password}).encode()
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            status = response.status
+            response.read()
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 'error'
+    return status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--method', help='password hash method, defaults to the configured one')
+    parser.add_argument('--keep-ip-limit', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='splitly-loadtest-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'loadtest.db')
+    if args.method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.method
+
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from app import AuthUser, User, app, db, ip_limiter, password_hasher, upgrade_database  # noqa: F401
+
+    if not args.keep_ip_limit:
+        ip_limiter.capacity = ip_limiter.rate = args.users * 10
+
+    print(f'hash method {password_hasher.method}, {password_hasher.workers} workers')
+    with app.app_context():
+        upgrade_database()
+        password_hash = password_hasher.hash('loadtest')
+        db.session.add_all([
+            User(email=f'user{i}@loadtest.local', name=f'User {i}', password_hash=password_hash)
+            for i in range(args.users)
+        ])
+        db.session.commit()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/login'
+
+    # Warm the worker processes so their start-up is not part of the measurement
+    post_login(url, 'user0@loadtest.local', 'loadtest')
+
+    results = []
+    results_lock = threading.Lock()
+    start_barrier = threading.Barrier(args.concurrency)
+    emails = [f'user{i}@loadtest.local' for i in range(args.users)]
+
+    def client(worker):
+        start_barrier.wait()
+        for email in emails[worker::args.concurrency]:
+            result = post_login(url, email, 'loadtest')
+            with results_lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    server.shutdown()
+    password_hasher.shutdown()
+
+    statuses = Counter(status for status, _ in results)
+    print(f'{len(results)} logins in {elapsed:.2f}s, statuses {dict(statuses)}')
+    print(f"{'status':>8} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for status in ['all'] + sorted(statuses, key=str):
+        latencies = sorted(latency for code, latency in results if status in ('all', code))
+        print(f'{status:>8} {len(latencies):>6} {percentile(latencies, 50) * 1e3:>8.0f} '
+              f'{percentile(latencies, 95) * 1e3:>8.0f} {percentile(latencies, 99) * 1e3:>8.0f} '
+              f'{latencies[-1] * 1e3:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
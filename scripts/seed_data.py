@@ -0,0 +1,207 @@
+"""Fill a new SQLite database with realistic synthetic Splitly data.
+
+Run from the project root:
+
+    python scripts/seed_data.py instance/seed.db [--users 1000] [--groups 200] [--expenses 20000]
+
+The database must not exist yet. The schema comes from the app's own
+``upgrade_database``. Users, groups, memberships, expenses with their
+splits, and settlements are then bulk-inserted in batches.
+
+- Group sizes and expense counts are heavy-tailed. Most groups are small
+  and quiet, and a few are large and busy.
+- Some users belong to many groups.
+- Most expenses are split between every member. Others use a subset, or
+  uneven custom shares.
+- Dates advance with ids over ``--days``.
+
+Balances, spending rollups and the ledger (with one balance snapshot per
+group) are rebuilt from the raw rows at the end.
+Every user can log in as ``user<N>@seed.local`` with ``--password``.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Alex', 'Ananya', 'Arjun', 'Chen', 'Diya', 'Elena', 'Farah', 'Hiro',
+               'Ishaan', 'Kavya', 'Leo', 'Maya', 'Nikhil', 'Noah', 'Priya', 'Rahul', 'Riya', 'Sam',
+               'Sara', 'Tara', 'Vikram', 'Zoe']
+LAST_NAMES = ['Ahmed', 'Bose', 'Costa', 'Das', 'Fischer', 'Gupta', 'Iyer', 'Jain', 'Kim', 'Kumar',
+              'Lopez', 'Mehta', 'Nair', 'Patel', 'Rao', 'Reddy', 'Sharma', 'Singh', 'Tanaka', 'Verma']
+GROUP_NAMES = ['Flatmates', 'Goa Trip', 'Office Lunch', 'Road Trip', 'Book Club', 'Wedding', 'Ski Weekend',
+               'Football', 'Family', 'Hiking Club', 'Birthday', 'Conference', 'Band', 'Study Group']
+ITEMS = ['Dinner', 'Lunch', 'Breakfast', 'Groceries', 'Taxi', 'Uber', 'Fuel', 'Hotel', 'Flight tickets',
+         'Train tickets', 'Coffee', 'Drinks', 'Movie tickets', 'Electricity bill', 'Internet bill', 'Rent',
+         'Pizza', 'Snacks', 'Parking', 'Museum entry', 'Gifts', 'Cleaning supplies', 'Boat ride']
+PLACES = ['the airport', 'the beach', 'downtown', 'the market', 'the station', 'the mall', 'the hotel',
+          'Olive Bistro', 'Cafe Mocha', 'Spice Route', 'the old town']
+
+
+def random_shares(rng, amount_cents, user_ids):
+    """Uneven custom shares that add up to the amount"""
+    weights = [rng.uniform(0.5, 3) for _ in user_ids]
+    total = sum(weights)
+    shares = {user_id: int(amount_cents * weight / total) for user_id, weight in zip(user_ids, weights)}
+    shares[user_ids[0]] += amount_cents - sum(shares.values())
+    return shares
+
+
+def description(rng):
+    item = rng.choice(ITEMS)
+    roll = rng.random()
+    if roll < 0.3:
+        return f'{item} at {rng.choice(PLACES)}'
+    if roll < 0.4:
+        return f'{item} ({rng.choice(FIRST_NAMES)})'
+    return item
+
+
+def pick_members(rng, n_users, size):
+    """Distinct user ids; low ids are more sociable and join more groups"""
+    members = set()
+    while len(members) < size:
+        members.add(1 + int(n_users * rng.random() ** 2))
+    return list(members)
+
+
+def insert_rows(m, sql, rows):
+    with m.db.engine.begin() as conn:
+        conn.exec_driver_sql(sql, rows)
+
+
+def seed(m, args):
+    """Generate and insert every table's rows, then rebuild the derived tables"""
+    from migrations import backfill_ledger_events
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    m.upgrade_database()
+    password_hash = m.password_hasher.hash(args.password)
+    m.password_hasher.shutdown()
+
+    now = datetime.utcnow().replace(microsecond=0)
+    history_start = now - timedelta(days=args.days)
+    # Expense and settlement dates are local wall-clock time, as the app writes them
+    local_offset = timedelta(minutes=round((datetime.now() - datetime.utcnow()).total_seconds() / 60))
+
+    users = [
+        (user_id, f'user{user_id}@seed.local', f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+         password_hash, history_start)
+        for user_id in range(1, args.users + 1)
+    ]
+    insert_rows(m, 'INSERT INTO user (id, email, name, password_hash, created_at) VALUES (?, ?, ?, ?, ?)', users)
+
+    groups = []
+    memberships = []
+    group_members = {}
+    codes = set()
+    for group_id in range(1, args.groups + 1):
+        size = min(args.users, args.max_members, 1 + int(rng.paretovariate(1.3)))
+        members = pick_members(rng, args.users, size)
+        while True:
+            code = ''.join(rng.choice(m.GROUP_CODE_ALPHABET) for _ in range(m.GROUP_CODE_LENGTH))
+            if code not in codes:
+                codes.add(code)
+                break
+        created = history_start + timedelta(days=rng.uniform(0, args.days / 4))
+        groups.append((group_id, f'{rng.choice(GROUP_NAMES)} {group_id}', None, code, members[0], created, now))
+        memberships.extend((group_id, user_id, created) for user_id in members)
+        group_members[group_id] = members
+    insert_rows(m, 'INSERT INTO "group" (id, name, description, code, created_by, created_at, updated_at, version) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, 0)', groups)
+    insert_rows(m, 'INSERT INTO group_member (group_id, user_id, joined_at) VALUES (?, ?, ?)', memberships)
+
+    # Heavy-tailed activity: a handful of groups hold most of the expenses
+    group_ids = list(group_members)
+    activity = [rng.paretovariate(1.1) for _ in group_ids]
+    span = (now - history_start).total_seconds()
+    expense_count = split_count = 0
+    for batch_start in range(0, args.expenses, args.batch):
+        batch_size = min(args.batch, args.expenses - batch_start)
+        expenses = []
+        splits = []
+        for offset, group_id in enumerate(rng.choices(group_ids, activity, k=batch_size)):
+            expense_id = batch_start + offset + 1
+            members = group_members[group_id]
+            amount = max(50, int(math.exp(rng.gauss(7.5, 1.2))))
+            roll = rng.random()
+            if roll < 0.6 or len(members) < 3:
+                shares = m.split_evenly(amount, members)
+            elif roll < 0.9:
+                shares = m.split_evenly(amount, rng.sample(members, rng.randint(2, len(members))))
+            else:
+                shares = random_shares(rng, amount, rng.sample(members, rng.randint(2, len(members))))
+            date = history_start + local_offset + timedelta(
+                seconds=span * expense_id / args.expenses - rng.uniform(0, 3600))
+            expenses.append((expense_id, group_id, description(rng), amount, rng.choice(members), date))
+            splits.extend((expense_id, user_id, share) for user_id, share in shares.items())
+        insert_rows(m, 'INSERT INTO expense (id, group_id, description, amount_cents, paid_by, date) '
+                       'VALUES (?, ?, ?, ?, ?, ?)', expenses)
+        insert_rows(m, 'INSERT INTO expense_split (expense_id, user_id, share_cents) VALUES (?, ?, ?)', splits)
+        expense_count += len(expenses)
+        split_count += len(splits)
+        print(f'\r{expense_count:,} expenses, {split_count:,} splits', end='', flush=True)
+    print()
+
+    settlements = []
+    for group_id in rng.choices(group_ids, activity, k=int(args.expenses * args.settlements)):
+        members = group_members[group_id]
+        from_user, to_user = rng.sample(members, 2) if len(members) > 1 else (members[0], members[0])
+        if from_user != to_user:
+            date = history_start + local_offset + timedelta(seconds=rng.uniform(0, span))
+            settlements.append((group_id, from_user, to_user, max(100, int(math.exp(rng.gauss(8, 1)))), date))
+    for batch_start in range(0, len(settlements), args.batch):
+        insert_rows(m, 'INSERT INTO settlement (group_id, from_user, to_user, amount_cents, date) '
+                       'VALUES (?, ?, ?, ?, ?)', settlements[batch_start:batch_start + args.batch])
+
+    # Derived tables come from the raw rows, exactly as after a migration
+    with m.db.engine.begin() as conn:
+        backfill_ledger_events(conn)
+    for group_id in group_ids:
+        m.rebuild_group_balances(group_id)
+        m.rebuild_spending_rollups(group_id)
+        m.take_balance_snapshot(group_id)
+    m.db.session.commit()
+    m.db.session.execute(m.text('ANALYZE'))
+    m.db.session.commit()
+
+    print(f'{len(users):,} users, {len(groups):,} groups, {len(memberships):,} memberships, '
+          f'{expense_count:,} expenses, {split_count:,} splits, {len(settlements):,} settlements '
+          f'in {time.perf_counter() - started:.1f}s')
+    print(f'Log in as user<N>@seed.local with password {args.password!r}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('database', help='path of the SQLite file to create')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--expenses', type=int, default=20_000, help='total across all groups')
+    parser.add_argument('--settlements', type=float, default=0.05, help='settlements per expense')
+    parser.add_argument('--max-members', type=int, default=40)
+    parser.add_argument('--days', type=int, default=730, help='history length')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--batch', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.database)
+    if os.path.exists(path):
+        parser.error(f'{path} already exists; seeding only writes to a new database')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    import app as m
+
+    with m.app.app_context():
+        seed(m, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import itertools
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads its database and hash settings at import, so they are set first
+WORKDIR = tempfile.mkdtemp(prefix='splitly-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'test.db')
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+
+@pytest.fixture(scope='session')
+def app():
+    import app as m
+
+    m.app.testing = True
+    m.app.config['REPORT_CACHE_DIR'] = os.path.join(WORKDIR, 'reports')
+    # Every test client registers from the same address
+    m.ip_limiter.capacity = m.ip_limiter.rate = 10 ** 6
+    with m.app.app_context():
+        m.upgrade_database()
+    yield m.app
+    m.password_hasher.shutdown()
+
+
+@pytest.fixture(scope='session')
+def m(app):
+    import app as m
+    return m
+
+
+@pytest.fixture(scope='session')
+def make_user(app, m):
+    """Register a new user; returns their id, name and a test client logged in as them"""
+    counter = itertools.count(1)
+
+    def make_user(name):
+        email = f'{name.lower()}{next(counter)}@example.com'
+        client = app.test_client()
+        response = client.post('/register', json={'email': email, 'password': 'secret1', 'name': name})
+        assert response.json['success'], response.json
+        with app.app_context():
+            user_id = m.db.session.scalar(m.select(m.User.id).where(m.User.email == email))
+        return SimpleNamespace(id=user_id, name=name, email=email, client=client)
+    return make_user
+
+
+@pytest.fixture(scope='session')
+def make_group(make_user):
+    """Create a group of new users named ``names``; the first one creates it and the rest join"""
+    def make_group(*names, name='Trip'):
+        users = [make_user(user_name) for user_name in names]
+        response = users[0].client.post('/create-group', json={'name': name, 'description': ''})
+        assert response.json['success'], response.json
+        for user in users[1:]:
+            assert user.client.post('/join-group', json={'code': response.json['group_code']}).json['success']
+        group_id = int(response.json['redirect'].rsplit('/', 1)[1])
+        return SimpleNamespace(id=group_id, code=response.json['group_code'], users=users)
+    return make_group
+
+
+@pytest.fixture(scope='session')
+def add_expense():
+    """Add an expense as ``user``, split evenly between ``members`` (default: just the payer)"""
+    def add_expense(group, user, description, amount, members=None):
+        response = user.client.post(f'/add-expense/{group.id}', json={
+            'description': description, 'amount': amount, 'paid_by': user.id,
+            'split_members': [member.id for member in members or [user]],
+        })
+        assert response.json['success'], response.json
+    return add_expense
+
+
+@pytest.fixture(autouse=True)
+def cold_caches(m):
+    """Every test starts without cached users, members or expense cards"""
+    m.user_cache.clear()
+    m.membership_cache.clear()
+    m.fragment_cache.clear()
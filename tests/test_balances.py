@@ -0,0 +1,45 @@
+import random
+
+from engine import equal_split_shares, net_balances
+
+
+def reference_balances(payers, amounts, split_users, split_shares, settlements=()):
+    balances = {}
+    for user_id, amount in zip(payers, amounts):
+        balances[user_id] = balances.get(user_id, 0) + amount
+    for user_id, share in zip(split_users, split_shares):
+        balances[user_id] = balances.get(user_id, 0) - share
+    for from_user, to_user, amount in settlements:
+        balances[from_user] = balances.get(from_user, 0) + amount
+        balances[to_user] = balances.get(to_user, 0) - amount
+    return balances
+
+
+def test_net_balances_match_a_plain_loop():
+    rng = random.Random(0)
+    for _ in range(50):
+        members = rng.sample(range(1, 200), rng.randint(1, 8))
+        payers, amounts, split_expenses, split_users = [], [], [], []
+        for expense in range(rng.randint(1, 30)):
+            payers.append(rng.choice(members))
+            amounts.append(rng.randint(1, 10 ** 6))
+            for user_id in rng.sample(members, rng.randint(1, len(members))):
+                split_expenses.append(expense)
+                split_users.append(user_id)
+        shares = equal_split_shares(amounts, split_expenses, split_users).tolist()
+        settlements = [(rng.choice(members), rng.choice(members), rng.randint(1, 10 ** 5)) for _ in range(3)]
+        from_users, to_users, settled = zip(*settlements)
+        balances = net_balances(payers, amounts, split_users, shares, from_users, to_users, settled)
+        assert balances == reference_balances(payers, amounts, split_users, shares, settlements)
+        assert sum(balances.values()) == 0
+
+
+def test_net_balances_with_sparse_ids_and_large_amounts():
+    # Sums past 2**53 would lose cents in float64
+    big = 2 ** 60 + 1
+    balances = net_balances([7, 10 ** 15], [big, 3], [7, 10 ** 15, 10 ** 15], [1, big, 2])
+    assert balances == {7: big - 1, 10 ** 15: 1 - big}
+
+
+def test_net_balances_without_rows():
+    assert net_balances([], [], [], []) == {}
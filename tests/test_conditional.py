@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def group(make_group, add_expense):
+    group = make_group('Alice', 'Bob')
+    add_expense(group, group.users[0], 'Ferry', '20', group.users)
+    return group
+
+
+def set_updated_at(app, m, group_id, updated_at, bump=False):
+    with app.app_context():
+        group = m.db.session.get(m.Group, group_id)
+        group.updated_at = updated_at
+        if bump:
+            group.version += 1
+        m.db.session.commit()
+
+
+def test_etag_revalidates_until_the_group_changes(group, add_expense):
+    client = group.users[0].client
+    response = client.get(f'/group/{group.id}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(f'/group/{group.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    add_expense(group, group.users[1], 'Bikes', '8', group.users)
+    response = client.get(f'/group/{group.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Bikes' in response.text
+
+
+def test_if_modified_since_is_ignored_when_an_etag_is_sent(app, m, group):
+    set_updated_at(app, m, group.id, datetime(2024, 5, 1, 12, 0, 0, 300000))
+    response = group.users[0].client.get(f'/group/{group.id}', headers={
+        'If-None-Match': '"stale"', 'If-Modified-Since': 'Wed, 01 May 2024 12:00:01 GMT',
+    })
+    assert response.status_code == 200
+
+
+def freeze_clock(m, monkeypatch, now):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now.replace(tzinfo=tz)
+    monkeypatch.setattr(m, 'datetime', FrozenDatetime)
+
+
+def test_second_change_in_the_same_second_is_not_hidden(app, m, group, monkeypatch):
+    client = group.users[0].client
+    set_updated_at(app, m, group.id, datetime(2024, 5, 1, 12, 0, 0, 300000))
+
+    # Served within the second of the change, so another change may still share it
+    freeze_clock(m, monkeypatch, datetime(2024, 5, 1, 12, 0, 0, 500000))
+    assert 'Last-Modified' not in client.get(f'/group/{group.id}').headers
+
+    set_updated_at(app, m, group.id, datetime(2024, 5, 1, 12, 0, 0, 800000), bump=True)
+    headers = {'If-Modified-Since': 'Wed, 01 May 2024 12:00:00 GMT'}
+    assert client.get(f'/group/{group.id}', headers=headers).status_code == 200
+
+    # Once the second is over the date is rounded up and can be revalidated
+    freeze_clock(m, monkeypatch, datetime(2024, 5, 1, 12, 0, 2))
+    last_modified = client.get(f'/group/{group.id}').headers['Last-Modified']
+    assert last_modified == 'Wed, 01 May 2024 12:00:01 GMT'
+    assert client.get(f'/group/{group.id}', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_last_modified_is_withheld_until_its_second_is_over(app, m, group):
+    set_updated_at(app, m, group.id, datetime.utcnow() + timedelta(hours=1))
+    response = group.users[0].client.get(f'/group/{group.id}')
+    assert response.status_code == 200
+    assert 'Last-Modified' not in response.headers
+    assert 'ETag' in response.headers
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def group(make_group):
+    return make_group('Alice', 'Bob')
+
+
+def read_event(stream):
+    """Next event from a stream, skipping heartbeats, as (type, data)"""
+    for chunk in stream:
+        message = chunk.decode()
+        if message.startswith('event:'):
+            lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+            return lines['event'], json.loads(lines['data'])
+    raise AssertionError('stream ended without an event')
+
+
+def test_event_payload_is_built_after_commit(app, m, group, add_expense, monkeypatch):
+    monkeypatch.setitem(app.config, 'EVENTS_HEARTBEAT', 1)
+    alice, bob = group.users
+    response = bob.client.get(f'/group/{group.id}/events', buffered=False)
+    stream = iter(response.response)
+    assert next(stream).startswith(b'retry:')
+
+    add_expense(group, alice, 'Museum', '30', [alice, bob])
+    event_type, data = read_event(stream)
+    assert event_type == 'expense_added'
+    assert data['expense']['description'] == 'Museum'
+    assert 'Museum' in data['expense']['html']
+    assert data['balances'] == {str(alice.id): 1500, str(bob.id): -1500}
+
+    assert bob.client.post('/mark-settled', json={
+        'group_id': group.id, 'from_user': bob.id, 'to_user': alice.id, 'amount': '15',
+    }).json['success']
+    event_type, data = read_event(stream)
+    assert event_type == 'settlement_added'
+    assert data['settlement'] == {'from_user': bob.id, 'to_user': alice.id, 'amount_cents': 1500}
+    assert data['balances'] == {str(alice.id): 0, str(bob.id): 0}
+    response.close()
+    assert not m.event_broker.has_subscribers(m.group_channel(group.id))
+
+
+def test_streams_end_after_max_age(app, m, group, monkeypatch):
+    monkeypatch.setitem(app.config, 'EVENTS_MAX_AGE', 0)
+    response = group.users[0].client.get(f'/group/{group.id}/events?since=0')
+    # The browser reconnects after ``retry``; the stale ``since`` asks it to reload first
+    assert response.get_data(as_text=True) == 'retry: 15000\n\nevent: resync\ndata: {}\n\n'
+    response.close()
+    assert not m.event_broker.has_subscribers(m.group_channel(group.id))
+
+
+def test_streams_over_the_limit_are_refused(m, group, monkeypatch):
+    monkeypatch.setattr(m.event_broker, 'max_subscribers', 0)
+    response = group.users[0].client.get(f'/group/{group.id}/events')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '15'
+    assert response.get_data(as_text=True) == 'retry: 15000\n\n'
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def group(make_group, add_expense):
+    group = make_group('Alice', '@Bob', name='=Goa trip')
+    alice, bob = group.users
+    add_expense(group, alice, 'Hotel', '120', [alice, bob])
+    add_expense(group, bob, '=HYPERLINK("http://example.com")', '30.50', [alice, bob])
+    return group
+
+
+def test_csv_export_escapes_formulas(group):
+    response = group.users[0].client.get(f'/export/{group.id}.csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="=Goa trip_expenses.csv"'
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['Group', 'Date', 'Description', 'Paid By', 'Amount', 'Split Between']
+    assert [row[2:] for row in rows[1:]] == [
+        ['\'=HYPERLINK("http://example.com")', "'@Bob", '30.50', 'Alice, @Bob'],
+        ['Hotel', 'Alice', '120.00', 'Alice, @Bob'],
+    ]
+    assert {row[0] for row in rows[1:]} == {"'=Goa trip"}
+
+
+def test_jsonl_export_keeps_values_as_entered(group):
+    alice, bob = group.users
+    response = alice.client.get(f'/export/{group.id}.jsonl')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="=Goa trip_expenses.jsonl"'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row['description'], row['paid_by'], row['amount_cents'], row['split_between']) for row in rows] == [
+        ('=HYPERLINK("http://example.com")', bob.id, 3050, ['Alice', '@Bob']),
+        ('Hotel', alice.id, 12000, ['Alice', '@Bob']),
+    ]
+    assert {row['group'] for row in rows} == {'=Goa trip'}
+
+
+def test_export_all_only_includes_own_groups(group, make_group, add_expense):
+    other = make_group('Carol')
+    add_expense(other, other.users[0], 'Secret dinner', '50', other.users)
+    body = group.users[1].client.get('/export/all.csv').get_data(as_text=True)
+    assert 'Hotel' in body
+    assert 'Secret dinner' not in body
+
+
+def test_unknown_export_format(group):
+    assert group.users[0].client.get(f'/export/{group.id}.xlsx').status_code == 404
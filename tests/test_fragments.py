@@ -0,0 +1,34 @@
+def test_card_is_not_reused_for_a_recycled_expense_id(app, m, make_group, add_expense, monkeypatch):
+    group = make_group('Alice', 'Bob')
+    alice, bob = group.users
+    add_expense(group, alice, 'Old lunch', '40', [alice, bob])
+    assert 'Old lunch' in alice.client.get(f'/group/{group.id}').text
+    with app.app_context():
+        old_id = m.db.session.scalar(m.select(m.func.max(m.Expense.id)))
+
+    # The delete is handled by another worker process, so this one's cached card survives it
+    monkeypatch.setattr(m.fragment_cache, 'delete', lambda key: None)
+    assert alice.client.post(f'/delete-expense/{old_id}').json['success']
+    add_expense(group, bob, 'New taxi', '12', [alice, bob])
+    with app.app_context():
+        assert m.db.session.scalar(m.select(m.func.max(m.Expense.id))) == old_id
+
+    page = alice.client.get(f'/group/{group.id}').text
+    assert 'New taxi' in page
+    assert 'Old lunch' not in page
+
+
+def test_cards_are_reused_until_a_member_is_renamed(app, m, make_group, add_expense):
+    group = make_group('Alice', 'Bob')
+    alice, bob = group.users
+    add_expense(group, alice, 'Groceries', '25', [alice, bob])
+    alice.client.get(f'/group/{group.id}')
+    cached = len(m.fragment_cache)
+    alice.client.get(f'/group/{group.id}')
+    assert len(m.fragment_cache) == cached
+
+    with app.app_context():
+        m.db.session.get(m.User, bob.id).name = 'Robert'
+        m.db.session.commit()
+    m.membership_cache.clear()
+    assert 'Robert' in alice.client.get(f'/api/group/{group.id}/expenses').json['expenses'][0]['html']
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def group(make_group):
+    return make_group('Alice', 'Bob')
+
+
+def balances(app, m, group_id):
+    with app.app_context():
+        return m.calculate_group_balances(group_id)
+
+
+def test_ndjson_import_reports_bad_rows_and_keeps_good_ones(app, m, group):
+    alice, bob = group.users
+    lines = [
+        json.dumps({'description': 'Hotel', 'amount': '80', 'paid_by': alice.id, 'split_members': [alice.id, bob.id]}),
+        json.dumps({'description': 'Fuel', 'amount': '20', 'paid_by': alice.id, 'split_members': bob.id}),
+        json.dumps({'description': 'Bus', 'amount': '10', 'paid_by': bob.id, 'split_members': {'a': 1}}),
+        json.dumps({'description': 'Snacks', 'amount': '6', 'paid_by': bob.id, 'shares': [alice.id]}),
+        '{"description": "Tea",',
+        json.dumps(['Lunch', '12']),
+        '',
+        json.dumps({'description': 'Lunch', 'amount': '12', 'paid_by': 'bob', 'split_members': 'Alice;Bob'}),
+    ]
+    response = alice.client.post(f'/api/group/{group.id}/expenses/bulk', data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.json == {
+        'success': False,
+        'imported': 2,
+        'failed': 5,
+        'errors': [
+            {'row': 2, 'message': 'split_members must be a list of members'},
+            {'row': 3, 'message': 'split_members must be a list of members'},
+            {'row': 4, 'message': 'shares must map members to amounts'},
+            {'row': 5, 'message': 'Invalid JSON'},
+            {'row': 6, 'message': 'Each line must be a JSON object'},
+        ],
+    }
+    assert balances(app, m, group.id) == {alice.id: 4000 - 600, bob.id: -4000 + 600}
+
+
+def test_add_expense_rejects_malformed_members(group):
+    alice, bob = group.users
+    for data in ({'split_members': 5}, {'split_members': {'x': 1}}, {'shares': 'all'}):
+        response = alice.client.post(f'/add-expense/{group.id}', json={
+            'description': 'Boat', 'amount': '30', 'paid_by': alice.id, **data,
+        })
+        assert response.status_code == 200
+        assert response.json['success'] is False
+    assert alice.client.post(f'/add-expense/{group.id}', json=['Boat', '30']).json == {
+        'success': False, 'message': 'Expected a JSON object',
+    }
+
+
+@pytest.mark.parametrize('data', [
+    {'from_user': 'bob', 'amount': '5'},
+    {'from_user': None, 'amount': '5'},
+    {'amount': 'five'},
+    {'amount': '-5'},
+])
+def test_mark_settled_rejects_bad_input(app, m, group, data):
+    alice, bob = group.users
+    payload = {'group_id': group.id, 'from_user': bob.id, 'to_user': alice.id, **data}
+    response = bob.client.post('/mark-settled', json=payload)
+    assert response.status_code == 400
+    assert response.json['success'] is False
+    assert balances(app, m, group.id) == {}
+
+
+def test_mark_settled_rejects_a_non_object_body(group):
+    assert group.users[0].client.post('/mark-settled', json=[1, 2]).status_code == 400
@@ -0,0 +1,104 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def nonzero(balances):
+    return {user_id: cents for user_id, cents in balances.items() if cents}
+
+
+def replayed_balances(response):
+    assert response.status_code == 200, response.json
+    return response.json, nonzero({b['user_id']: b['balance_cents'] for b in response.json['balances']})
+
+
+@pytest.fixture
+def history(app, m, make_group, add_expense, monkeypatch):
+    """A group with a mixed history, and its materialized balances after every ledger event"""
+    monkeypatch.setitem(app.config, 'LEDGER_SNAPSHOT_INTERVAL', 4)
+    group = make_group('Alice', 'Bob', 'Carol')
+    rng = random.Random(3)
+    expected = {0: {}}
+
+    def record():
+        with app.app_context():
+            expected[m.ledger_seq_at(group.id)] = nonzero(m.calculate_group_balances(group.id))
+
+    for step in range(15):
+        user = rng.choice(group.users)
+        action = rng.random()
+        if action < 0.6:
+            add_expense(group, user, f'Item {step}', str(rng.randint(1, 9000) / 100), rng.sample(group.users, 2))
+        elif action < 0.8:
+            with app.app_context():
+                expense_id = m.db.session.scalar(m.select(m.func.max(m.Expense.id)).where(m.Expense.group_id == group.id))
+            if expense_id is None:
+                continue
+            assert user.client.post(f'/delete-expense/{expense_id}').json['success']
+        else:
+            other = rng.choice([u for u in group.users if u is not user])
+            assert user.client.post('/mark-settled', json={
+                'group_id': group.id, 'from_user': user.id, 'to_user': other.id, 'amount': str(rng.randint(1, 50)),
+            }).json['success']
+        record()
+    return group, expected
+
+
+def test_replay_matches_materialized_balances_at_every_seq(app, m, history):
+    group, expected = history
+    client = group.users[0].client
+    with app.app_context():
+        snapshots = m.db.session.scalars(
+            m.select(m.BalanceSnapshot.seq).where(m.BalanceSnapshot.group_id == group.id)).all()
+    assert len(snapshots) >= 3
+
+    for seq, balances in expected.items():
+        body, replayed = replayed_balances(client.get(f'/api/group/{group.id}/balances?seq={seq}'))
+        assert replayed == balances, seq
+        # Only the events since the nearest snapshot are added up
+        assert body['replayed_events'] == seq - max([s for s in snapshots if s <= seq], default=0)
+
+    body, replayed = replayed_balances(client.get(f'/api/group/{group.id}/balances'))
+    assert body['seq'] == max(expected)
+    assert replayed == expected[max(expected)]
+    with app.app_context():
+        assert m.find_ledger_drift(group.id) == []
+
+
+def test_as_of_picks_the_last_event_recorded_by_then(app, m, history):
+    group, expected = history
+    start = datetime(2024, 3, 1, 12)
+    with app.app_context():
+        for event in m.LedgerEvent.query.filter_by(group_id=group.id):
+            event.created_at = start + timedelta(days=event.seq)
+        m.db.session.commit()
+
+    client = group.users[0].client
+    for seq in (0, 1, 5, max(expected)):
+        day = (start + timedelta(days=seq)).date()
+        body, replayed = replayed_balances(client.get(f'/api/group/{group.id}/balances?as_of={day}'))
+        assert body['seq'] == seq
+        assert replayed == expected[seq]
+    # Noon on the day of an event is after it; an hour before it is not
+    day = start + timedelta(days=5)
+    assert client.get(f'/api/group/{group.id}/balances?as_of={day.isoformat()}').json['seq'] == 5
+    assert client.get(f'/api/group/{group.id}/balances?as_of={(day - timedelta(hours=1)).isoformat()}').json['seq'] == 4
+    assert client.get(f'/api/group/{group.id}/balances?as_of=2024-03-06T12:00:00%2B05:30').json['seq'] == 4
+
+
+def test_drift_is_reported(app, m, history):
+    group, _ = history
+    alice = group.users[0]
+    with app.app_context():
+        row = m.db.session.get(m.GroupBalance, (group.id, alice.id))
+        stored = row.balance_cents
+        row.balance_cents += 1
+        m.db.session.commit()
+        assert m.find_ledger_drift(group.id) == [(None, alice.id, stored + 1, stored)]
+
+
+@pytest.mark.parametrize('query', ['seq=-1', 'seq=one', 'as_of=yesterday'])
+def test_bad_ledger_points(make_group, query):
+    group = make_group('Alice')
+    assert group.users[0].client.get(f'/api/group/{group.id}/balances?{query}').status_code == 400
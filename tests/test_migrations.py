@@ -0,0 +1,117 @@
+"""Upgrade a database created by the first release of the app.
+
+The app binds its engine at import, so the upgrade runs in a fresh
+interpreter pointed at the old database, and reports what it finds as JSON.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import ROOT
+
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, name VARCHAR(100) NOT NULL,
+    password_hash VARCHAR(200) NOT NULL, created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (email)
+);
+CREATE TABLE "group" (
+    id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT, code VARCHAR(6) NOT NULL,
+    created_by INTEGER NOT NULL, created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (code), FOREIGN KEY(created_by) REFERENCES user (id)
+);
+CREATE TABLE group_member (
+    id INTEGER NOT NULL, group_id INTEGER NOT NULL, user_id INTEGER NOT NULL, joined_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(group_id) REFERENCES "group" (id), FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE expense (
+    id INTEGER NOT NULL, group_id INTEGER NOT NULL, description VARCHAR(200) NOT NULL, amount FLOAT NOT NULL,
+    paid_by INTEGER NOT NULL, split_members TEXT NOT NULL, date DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(group_id) REFERENCES "group" (id), FOREIGN KEY(paid_by) REFERENCES user (id)
+);
+CREATE TABLE settlement (
+    id INTEGER NOT NULL, group_id INTEGER NOT NULL, from_user INTEGER NOT NULL, to_user INTEGER NOT NULL,
+    amount FLOAT NOT NULL, date DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(group_id) REFERENCES "group" (id),
+    FOREIGN KEY(from_user) REFERENCES user (id), FOREIGN KEY(to_user) REFERENCES user (id)
+);
+"""
+
+UPGRADE_SCRIPT = """
+import json
+import app as m
+
+with m.app.app_context():
+    m.upgrade_database()
+    session = m.db.session
+    fts = 'SELECT rowid FROM expense_fts WHERE expense_fts MATCH :match ORDER BY rowid'
+    print(json.dumps({
+        'user_version': session.execute(m.text('PRAGMA user_version')).scalar(),
+        'migrations': len(m.MIGRATIONS),
+        'balances': {group.id: m.calculate_group_balances(group.id) for group in m.Group.query},
+        'splits': sorted([split.expense_id, split.user_id, split.share_cents] for split in m.ExpenseSplit.query),
+        'members': session.query(m.GroupMember).count(),
+        'expense_counts': {group.id: group.expense_count for group in m.Group.query},
+        'search': {group_id: session.execute(m.text(fts), {'match': m.fts_query('dinner', group_id)}).scalars().all()
+                   for group_id in (1, 2)},
+        'events': [[event.group_id, event.seq, event.kind, event.ref_id]
+                   for event in m.LedgerEvent.query.order_by(m.LedgerEvent.group_id, m.LedgerEvent.seq)],
+        'snapshots': [[s.group_id, s.seq] for s in m.BalanceSnapshot.query.order_by(m.BalanceSnapshot.group_id)],
+        'drift': {group.id: m.find_ledger_drift(group.id) for group in m.Group.query},
+    }))
+m.password_hasher.shutdown()
+"""
+
+
+def test_baseline_database_upgrades_through_every_migration(tmp_path):
+    path = tmp_path / 'baseline.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO user VALUES (?, ?, ?, ?, ?)', [
+        (1, 'alice@example.com', 'Alice', 'x', '2024-01-01 00:00:00'),
+        (2, 'bob@example.com', 'Bob', 'x', '2024-01-01 00:00:00'),
+        (3, 'carol@example.com', 'Carol', 'x', '2024-01-01 00:00:00'),
+    ])
+    conn.executemany('INSERT INTO "group" VALUES (?, ?, ?, ?, ?, ?)', [
+        (1, 'Trip', None, 'AAAAAA', 1, '2024-01-01 00:00:00'),
+        (2, 'Flat', None, 'BBBBBB', 3, '2024-01-01 00:00:00'),
+    ])
+    # Bob joined twice, which the unique membership index no longer allows
+    conn.executemany('INSERT INTO group_member VALUES (?, ?, ?, ?)', [
+        (1, 1, 1, None), (2, 1, 2, None), (3, 1, 3, None), (4, 1, 2, None), (5, 2, 1, None), (6, 2, 3, None),
+    ])
+    conn.executemany('INSERT INTO expense VALUES (?, ?, ?, ?, ?, ?, ?)', [
+        (1, 1, 'Dinner at the beach', 10.01, 1, '1,2,3', '2024-01-02 20:00:00'),
+        (2, 1, 'Taxi', 33.333, 2, '1,2,', '2024-01-03 09:00:00'),
+        (3, 2, 'Dinner at home', 20.0, 3, '1,3', '2024-01-04 19:00:00'),
+    ])
+    conn.execute('INSERT INTO settlement VALUES (1, 1, 2, 1, 5.5, ?)', ('2024-01-05 12:00:00',))
+    conn.commit()
+    conn.close()
+
+    result = subprocess.run(
+        [sys.executable, '-c', UPGRADE_SCRIPT], cwd=ROOT, capture_output=True, text=True, timeout=120,
+        env=dict(os.environ, DATABASE_URL=f'sqlite:///{path}'),
+    )
+    assert result.returncode == 0, result.stderr
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert state['user_version'] == state['migrations']
+    assert state['members'] == 5
+    # Float amounts become cents and rounded shares are nudged to add up, lowest user id first
+    assert state['splits'] == [[1, 1, 333], [1, 2, 334], [1, 3, 334], [2, 1, 1666], [2, 2, 1667], [3, 1, 1000], [3, 3, 1000]]
+    assert state['balances'] == {
+        '1': {'1': 1001 - 333 - 1666 - 550, '2': 3333 - 334 - 1667 + 550, '3': -334},
+        '2': {'1': -1000, '3': 1000},
+    }
+    assert state['expense_counts'] == {'1': 2, '2': 1}
+    # Each group's search only sees its own descriptions
+    assert state['search'] == {'1': [1], '2': [3]}
+    assert state['events'] == [
+        [1, 1, 'expense_added', 1], [1, 2, 'expense_added', 2], [1, 3, 'settlement_added', 1],
+        [2, 1, 'expense_added', 3],
+    ]
+    assert state['snapshots'] == [[1, 3], [2, 1]]
+    assert state['drift'] == {'1': [], '2': []}
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from engine import split_evenly
+
+
+def test_split_evenly_divides_exactly():
+    assert split_evenly(1000, [3, 1, 2]) == {1: 334, 2: 333, 3: 333}
+    assert split_evenly(1001, [5, 4]) == {4: 501, 5: 500}
+    assert split_evenly(2, [1, 2, 3]) == {1: 1, 2: 1, 3: 0}
+    rng = random.Random(0)
+    for _ in range(200):
+        user_ids = rng.sample(range(1, 50), rng.randint(1, 10))
+        amount = rng.randint(0, 10 ** 7)
+        shares = split_evenly(amount, user_ids)
+        assert sum(shares.values()) == amount
+        assert set(shares) == set(user_ids)
+        assert max(shares.values()) - min(shares.values()) <= 1
+
+
+def test_split_evenly_ignores_duplicates_and_empty_lists():
+    assert split_evenly(300, [2, 2, 1]) == {1: 150, 2: 150}
+    assert split_evenly(300, []) == {}
+
+
+@pytest.mark.parametrize('value, cents', [('12.5', 1250), ('0.01', 1), (' 33.335 ', 3334), (7, 700), ('10000000000', 10 ** 12)])
+def test_parse_money(m, value, cents):
+    assert m.parse_money(value) == cents
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '0', '-5', '0.004', 'NaN', 'Infinity', '1e400', '10000000000.01', None])
+def test_parse_money_rejects(m, value):
+    with pytest.raises(ValueError):
+        m.parse_money(value)
+
+
+def test_format_money(m):
+    assert [m.format_money(cents) for cents in (0, 5, 1250, -7166, 10 ** 12)] == \
+        ['0.00', '0.05', '12.50', '-71.66', '10000000000.00']
@@ -0,0 +1,118 @@
+"""Drive every route that declares a query budget.
+
+With ``app.testing`` set, a route that issues more SQL queries than its
+``@query_budget`` raises QueryBudgetExceeded from the test client. The
+per-process caches are cleared before each test, so the budgets are checked
+against the cold path. Each route's answer is checked too, so a route cannot
+stay within its budget by quietly doing less.
+"""
+import time
+
+import pytest
+
+BUDGETED = {
+    'dashboard', 'group_detail', 'api_group_expenses', 'search_expenses', 'group_stats',
+    'group_balances_as_of', 'group_ledger', 'add_expense', 'delete_expense', 'group_events',
+    'settle_up', 'mark_settled', 'download_pdf', 'group_report', 'export_group', 'export_all_groups',
+}
+
+
+@pytest.fixture(scope='module')
+def group(make_group, add_expense):
+    group = make_group('Alice', 'Bob')
+    alice, bob = group.users
+    # Alice pays 143.33 in total and owes 71.67 of it, so Bob owes her 71.66
+    for description, amount in [('Dinner', '100'), ('Taxi', '33.33'), ('Coffee', '10')]:
+        add_expense(group, alice, description, amount, [alice, bob])
+    group.alice, group.bob = alice, bob
+    return group
+
+
+def descriptions(response):
+    return [expense['description'] for expense in response.json['expenses']]
+
+
+def test_every_budgeted_route_is_covered(app):
+    declared = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert declared == BUDGETED
+
+
+@pytest.mark.parametrize('path, check', [
+    ('/dashboard', lambda r, g: 'Trip' in r.text and '71.66' in r.text),
+    ('/group/{id}', lambda r, g: all(word in r.text for word in ('Dinner', 'Taxi', 'Coffee', '71.66'))),
+    ('/api/group/{id}/expenses', lambda r, g: descriptions(r) == ['Coffee', 'Taxi', 'Dinner']),
+    ('/api/group/{id}/search?q=dinner', lambda r, g: descriptions(r) == ['Dinner']),
+    ('/api/group/{id}/stats', lambda r, g: {m['user_id']: m['paid_cents'] for m in r.json['members']}
+        == {g.alice.id: 14333, g.bob.id: 0}),
+    ('/api/group/{id}/balances', lambda r, g: r.json['seq'] == 3 and {b['user_id']: b['balance_cents']
+        for b in r.json['balances']} == {g.alice.id: 7166, g.bob.id: -7166}),
+    ('/api/group/{id}/balances?seq=1', lambda r, g: {b['user_id']: b['balance_cents']
+        for b in r.json['balances']} == {g.alice.id: 5000, g.bob.id: -5000}),
+    ('/api/group/{id}/balances?as_of=2000-01-01', lambda r, g: r.json['seq'] == 0 and r.json['balances'] == []),
+    ('/api/group/{id}/ledger', lambda r, g: [e['seq'] for e in r.json['events']] == [1, 2, 3]),
+    ('/add-expense/{id}', lambda r, g: 'Bob' in r.text),
+    ('/settle-up/{id}', lambda r, g: '71.66' in r.text and r.headers['X-Settlement-Solver'] == 'exact'),
+    ('/settle-up/{id}?solver=greedy', lambda r, g: '71.66' in r.text and r.headers['X-Settlement-Solver'] == 'greedy'),
+])
+def test_get_within_budget(group, path, check):
+    response = group.alice.client.get(path.format(id=group.id))
+    assert response.status_code == 200, response.status_code
+    assert check(response, group), response.get_data(as_text=True)[:500]
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_exports_within_budget(group, fmt):
+    for path in (f'/export/{group.id}.{fmt}', f'/export/all.{fmt}'):
+        response = group.alice.client.get(path)
+        assert response.status_code == 200
+        body = response.get_data(as_text=True)
+        assert all(word in body for word in ('Dinner', 'Taxi', 'Coffee')), body
+
+
+def test_add_and_delete_expense_within_budget(app, m, group):
+    response = group.bob.client.post(f'/add-expense/{group.id}', json={
+        'description': 'Tickets', 'amount': '12.50', 'paid_by': group.bob.id,
+        'split_members': [group.alice.id, group.bob.id],
+    })
+    assert response.json['success'], response.json
+    with app.app_context():
+        expense_id = m.db.session.scalar(m.select(m.func.max(m.Expense.id)).where(m.Expense.group_id == group.id))
+        assert m.calculate_group_balances(group.id) == {group.alice.id: 7166 - 625, group.bob.id: -7166 + 625}
+    assert group.bob.client.post(f'/delete-expense/{expense_id}').json['success']
+    with app.app_context():
+        assert m.db.session.get(m.Expense, expense_id) is None
+        assert m.calculate_group_balances(group.id) == {group.alice.id: 7166, group.bob.id: -7166}
+
+
+def test_mark_settled_within_budget(app, m, group):
+    response = group.bob.client.post('/mark-settled', json={
+        'group_id': group.id, 'from_user': group.bob.id, 'to_user': group.alice.id, 'amount': '5',
+    })
+    assert response.json['success'], response.json
+    with app.app_context():
+        assert m.calculate_group_balances(group.id) == {group.alice.id: 7166 - 500, group.bob.id: -7166 + 500}
+
+
+def test_events_within_budget(group):
+    response = group.alice.client.get(f'/group/{group.id}/events', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert next(response.response).startswith(b'retry:')
+    response.close()
+
+
+def test_reports_within_budget(group):
+    assert group.alice.client.get(f'/download-pdf/{group.id}').status_code == 202
+    assert group.alice.client.post(f'/api/group/{group.id}/report').status_code in (200, 202)
+    deadline = time.monotonic() + 30
+    while True:
+        response = group.alice.client.get(f'/api/group/{group.id}/report')
+        assert response.status_code == 200
+        if response.json['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    assert response.json['status'] == 'done', response.json
+    response = group.alice.client.get(f'/download-pdf/{group.id}')
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF')
+    response.close()
@@ -0,0 +1,28 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from cache import TokenBucketLimiter
+
+
+@pytest.fixture
+def login(app, m, monkeypatch):
+    monkeypatch.setattr(m, 'ip_limiter', TokenBucketLimiter(1, 1e-6))
+    client = app.test_client()
+
+    def login(forwarded_for):
+        return client.post('/login', json={'email': 'nobody@example.com', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': forwarded_for}).status_code
+    return login
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(login):
+    assert login('203.0.113.1') == 200
+    # A client cannot dodge the limit by making up a new address
+    assert login('203.0.113.2') == 429
+
+
+def test_trusted_proxy_limits_each_client_address(app, monkeypatch, login):
+    monkeypatch.setattr(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1, x_proto=1))
+    assert login('203.0.113.1') == 200
+    assert login('203.0.113.2') == 200
+    assert login('203.0.113.1') == 429
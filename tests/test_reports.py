@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def group(make_group, add_expense):
+    group = make_group('Alice', 'Bob')
+    add_expense(group, group.users[0], 'Hotel', '240', group.users)
+    return group
+
+
+def wait_for_report(client, group_id):
+    deadline = time.monotonic() + 30
+    while True:
+        status = client.get(f'/api/group/{group_id}/report').json['status']
+        if status not in ('queued', 'running') or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def current_version(app, m, group_id):
+    with app.app_context():
+        return m.db.session.get(m.Group, group_id).version
+
+
+def test_missing_report_file_is_built_again(app, m, group):
+    client = group.users[0].client
+    assert client.post(f'/api/group/{group.id}/report').json['success']
+    assert wait_for_report(client, group.id) == 'done'
+
+    os.remove(m.report_path(group.id, current_version(app, m, group.id)))
+    assert client.get(f'/api/group/{group.id}/report').json['status'] == 'missing'
+    assert client.get(f'/download-pdf/{group.id}').status_code == 202
+    assert wait_for_report(client, group.id) == 'done'
+    response = client.get(f'/download-pdf/{group.id}')
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF')
+    response.close()
+
+
+def test_build_only_removes_older_versions(app, m, group):
+    version = current_version(app, m, group.id)
+    os.makedirs(app.config['REPORT_CACHE_DIR'], exist_ok=True)
+    older, newer = m.report_path(group.id, version - 1), m.report_path(group.id, version + 1)
+    for path in (older, newer):
+        with open(path, 'wb') as f:
+            f.write(b'%PDF')
+
+    with app.app_context():
+        path = m.build_group_report(group.id, version)
+    assert path == m.report_path(group.id, version) and os.path.exists(path)
+    assert not os.path.exists(older)
+    assert os.path.exists(newer)
+
+
+def test_build_skips_a_superseded_version(app, m, group, add_expense):
+    version = current_version(app, m, group.id)
+    add_expense(group, group.users[1], 'Train', '18', group.users)
+    with app.app_context():
+        assert m.build_group_report(group.id, version) is None
+    assert not os.path.exists(m.report_path(group.id, version))
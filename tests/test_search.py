@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+
+def search(client, group_id, query, **params):
+    response = client.get(f'/api/group/{group_id}/search', query_string={'q': query, **params})
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def descriptions(body):
+    return [expense['description'] for expense in body['expenses']]
+
+
+@pytest.fixture
+def groups(make_user, make_group, add_expense):
+    trip = make_group('Alice', 'Bob', name='Trip')
+    alice, bob = trip.users
+    flat = make_group('Carol', name='Flat')
+    carol = flat.users[0]
+    assert alice.client.post('/join-group', json={'code': flat.code}).json['success']
+
+    for description in ('Dinner cruise', 'Dinner in town', 'Lunch'):
+        add_expense(trip, alice, description, '20', [alice, bob])
+    # Many newer matches in another group must not crowd this group's out
+    rows = [json.dumps({'description': f'Dinner {n}', 'amount': '5', 'paid_by': carol.id,
+                        'split_members': [carol.id]}) for n in range(30)]
+    assert carol.client.post(f'/api/group/{flat.id}/expenses/bulk', data='\n'.join(rows),
+                             content_type='application/x-ndjson').json['imported'] == 30
+    return trip, flat
+
+
+def test_search_only_matches_the_groups_own_expenses(app, m, groups, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_RANK_WINDOW', 2)
+    monkeypatch.setitem(app.config, 'EXPENSE_PAGE_SIZE', 1)
+    trip, flat = groups
+    alice = trip.users[0]
+
+    found, phases, body = [], [], {'next_cursor': None}
+    while True:
+        body = search(alice.client, trip.id, 'din', cursor=body['next_cursor'] or '')
+        found += descriptions(body)
+        if not body['next_cursor']:
+            break
+        phases.append(m.decode_search_cursor(body['next_cursor'])[0])
+    assert sorted(found) == ['Dinner cruise', 'Dinner in town']
+    # Both fit in the relevance window, which the other group's matches do not take up
+    assert phases == ['ranked']
+    assert len(descriptions(search(alice.client, flat.id, 'dinner', sort='date'))) == 1
+
+    # The index match itself is scoped, so other groups' rows are never scored
+    with app.app_context():
+        matched = m.db.session.scalars(m.select(m.Expense.description).join(
+            m.expense_fts, m.expense_fts.c.rowid == m.Expense.id
+        ).where(m.expense_fts.c.expense_fts.match(m.fts_query('dinner', trip.id)))).all()
+    assert sorted(matched) == ['Dinner cruise', 'Dinner in town']
+
+
+def test_search_needs_membership_of_that_group(groups):
+    trip, flat = groups
+    carol = flat.users[0]
+    assert carol.client.get(f'/api/group/{trip.id}/search?q=dinner').status_code == 403
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('dinner OR lunch', []),
+    ('grp:g1', []),
+    ('NEAR(dinner lunch)', []),
+    ('"dinner', ['Dinner in town', 'Dinner cruise']),
+])
+def test_search_syntax_is_matched_literally(groups, query, expected):
+    trip, _ = groups
+    assert descriptions(search(trip.users[0].client, trip.id, query, sort='date')) == expected
+
+
+def test_search_without_words_is_rejected(groups):
+    trip, _ = groups
+    assert trip.users[0].client.get(f'/api/group/{trip.id}/search?q=*').status_code == 400
@@ -0,0 +1,71 @@
+import random
+from itertools import combinations
+
+import pytest
+
+from engine import SolverBudgetExceeded, calculate_settlements, exact_settlements, greedy_settlements
+
+
+def apply_settlements(balances, settlements):
+    result = dict(balances)
+    for settlement in settlements:
+        assert settlement['amount_cents'] > 0
+        result[settlement['from_user']] += settlement['amount_cents']
+        result[settlement['to_user']] -= settlement['amount_cents']
+    return result
+
+
+def fewest_transfers(amounts):
+    """Brute force: members minus the most disjoint zero-sum groups they split into"""
+    def most_groups(remaining):
+        if not remaining:
+            return 0
+        first, rest = remaining[0], remaining[1:]
+        best = 0
+        for size in range(len(rest) + 1):
+            for others in combinations(range(len(rest)), size):
+                if first + sum(rest[i] for i in others) == 0:
+                    left = tuple(rest[i] for i in range(len(rest)) if i not in others)
+                    best = max(best, 1 + most_groups(left))
+        return best
+    return len(amounts) - most_groups(tuple(amounts))
+
+
+def random_balances(rng, members):
+    balances = {user_id: rng.choice([-3, -2, -1, 1, 2, 3]) * rng.choice([100, 250]) for user_id in range(1, members)}
+    balances[members] = -sum(balances.values())
+    return balances
+
+
+def test_exact_settlements_clear_balances_with_fewest_transfers():
+    rng = random.Random(1)
+    for _ in range(200):
+        balances = random_balances(rng, rng.randint(2, 8))
+        settlements = exact_settlements(balances)
+        assert all(amount == 0 for amount in apply_settlements(balances, settlements).values())
+        nonzero = [amount for amount in balances.values() if amount]
+        assert len(settlements) == fewest_transfers(nonzero), balances
+        assert len(settlements) <= len(greedy_settlements(balances))
+
+
+def test_exact_settlements_beats_greedy():
+    # Greedy pays the 1200 creditor first and needs four transfers; 4 and 1 settle on their own
+    balances = {1: -700, 2: -700, 3: -500, 4: 700, 5: 1200}
+    assert len(greedy_settlements(balances)) == 4
+    assert len(exact_settlements(balances)) == 3
+
+
+def test_exact_settlements_edge_cases():
+    assert exact_settlements({}) == []
+    assert exact_settlements({1: 0, 2: 0}) == []
+    with pytest.raises(SolverBudgetExceeded):
+        exact_settlements({user_id: 1 if user_id % 2 else -1 for user_id in range(1, 21)}, max_members=18)
+
+
+def test_calculate_settlements_falls_back_to_greedy():
+    balances = {user_id: 1 if user_id % 2 else -1 for user_id in range(1, 21)}
+    settlements, solver = calculate_settlements(balances, 'auto', max_exact_members=18)
+    assert solver == 'greedy'
+    assert all(amount == 0 for amount in apply_settlements(balances, settlements).values())
+    with pytest.raises(ValueError):
+        calculate_settlements(balances, 'fastest')